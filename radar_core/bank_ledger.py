@@ -0,0 +1,134 @@
+# Banks ledger by Smjert/Spasitjel
+#
+# Keeps, per map, the consumed banks and the marked spots in sets, for constant time membership checks,
+# and also in a spatial index of cells of indexCellBanks x indexCellBanks banks, so that finding the ones
+# inside an area only looks at the cells overlapping it, instead of at all of them.
+#
+# The banks respawn: each consumed bank has the time it respawns at, in seconds like time.time(), or neverExpires.
+# The expiry times of all the maps of a ledger are kept in a single heap, so that Expire only looks at the banks
+# that respawned since it was last called, in O(log n) each, instead of at every consumed bank.
+# A bank consumed again before respawning gets a new expiry time; the one it had is left in the heap
+# and skipped when it comes out, since it doesn't match the bank anymore.
+
+import heapq
+
+# Width and height, in banks, of a spatial index cell
+indexCellBanks = 16
+
+neverExpires = float("inf")
+
+class MapLedger():
+    def __init__(self, mapIndex, bankWidth, bankHeight, expiries):
+        self.Map = mapIndex
+        self.BankWidth = bankWidth
+        self.BankHeight = bankHeight
+        # Consumed bank -> time it respawns at
+        self.ConsumedBanks = {}
+        self.MarkedSpots = set()
+        self.ConsumedIndex = {}
+        self.MarkedIndex = {}
+        # Heap of (expiry time, map index, bank), shared by the maps of the ledger
+        self.Expiries = expiries
+
+    # Returns whether the bank wasn't consumed; consuming it again only makes it respawn later
+    def AddConsumedBank(self, bankX, bankY, expiry=neverExpires):
+        bank = (bankX, bankY)
+        current = self.ConsumedBanks.get(bank)
+        if current is not None and current >= expiry:
+            return False
+
+        self.ConsumedBanks[bank] = expiry
+        if expiry != neverExpires:
+            heapq.heappush(self.Expiries, (expiry, self.Map, bank))
+
+        if current is not None:
+            return False
+
+        self.ConsumedIndex.setdefault((bankX // indexCellBanks, bankY // indexCellBanks), set()).add(bank)
+        return True
+
+    def RemoveConsumedBank(self, bank):
+        del self.ConsumedBanks[bank]
+
+        cellKey = (bank[0] // indexCellBanks, bank[1] // indexCellBanks)
+        cell = self.ConsumedIndex[cellKey]
+        cell.discard(bank)
+        if len(cell) == 0:
+            del self.ConsumedIndex[cellKey]
+
+    def IsConsumed(self, bankX, bankY):
+        return (bankX, bankY) in self.ConsumedBanks
+
+    def AddMarkedSpot(self, x, y):
+        spot = (x, y)
+        if spot in self.MarkedSpots:
+            return False
+
+        self.MarkedSpots.add(spot)
+        cell = ((x // self.BankWidth) // indexCellBanks, (y // self.BankHeight) // indexCellBanks)
+        self.MarkedIndex.setdefault(cell, set()).add(spot)
+        return True
+
+    def IsMarked(self, x, y):
+        return (x, y) in self.MarkedSpots
+
+    # Consumed banks with minBankX <= bankX <= maxBankX and minBankY <= bankY <= maxBankY
+    def ConsumedBanksIn(self, minBankX, minBankY, maxBankX, maxBankY):
+        banks = []
+        for cellY in range(minBankY // indexCellBanks, (maxBankY // indexCellBanks) + 1):
+            for cellX in range(minBankX // indexCellBanks, (maxBankX // indexCellBanks) + 1):
+                cell = self.ConsumedIndex.get((cellX, cellY))
+                if cell is None:
+                    continue
+
+                for bank in cell:
+                    if bank[0] >= minBankX and bank[0] <= maxBankX and bank[1] >= minBankY and bank[1] <= maxBankY:
+                        banks.append(bank)
+
+        return banks
+
+    # Marked spots with minX <= x <= maxX and minY <= y <= maxY
+    def MarkedSpotsIn(self, minX, minY, maxX, maxY):
+        spots = []
+        cellWidth = self.BankWidth * indexCellBanks
+        cellHeight = self.BankHeight * indexCellBanks
+        for cellY in range(minY // cellHeight, (maxY // cellHeight) + 1):
+            for cellX in range(minX // cellWidth, (maxX // cellWidth) + 1):
+                cell = self.MarkedIndex.get((cellX, cellY))
+                if cell is None:
+                    continue
+
+                for spot in cell:
+                    if spot[0] >= minX and spot[0] <= maxX and spot[1] >= minY and spot[1] <= maxY:
+                        spots.append(spot)
+
+        return spots
+
+class BankLedger():
+    def __init__(self, numberOfMaps, bankWidth, bankHeight):
+        self.Expiries = []
+        self.Maps = [MapLedger(mapIndex, bankWidth, bankHeight, self.Expiries) for mapIndex in range(numberOfMaps)]
+
+    def ForMap(self, mapIndex):
+        return self.Maps[mapIndex]
+
+    # Time the first consumed bank respawns at, neverExpires if none will; it can be earlier than that,
+    # when the first bank has been consumed again since, which Expire finds out
+    def NextExpiry(self):
+        return self.Expiries[0][0] if len(self.Expiries) > 0 else neverExpires
+
+    # Removes the banks that respawned by the time now, returning them as (map index, bank)
+    def Expire(self, now):
+        expiries = self.Expiries
+        expired = []
+        while len(expiries) > 0 and expiries[0][0] <= now:
+            expiry, mapIndex, bank = heapq.heappop(expiries)
+            mapLedger = self.Maps[mapIndex]
+            # Consumed again, it has a later entry
+            if mapLedger.ConsumedBanks.get(bank) != expiry:
+                continue
+
+            mapLedger.RemoveConsumedBank(bank)
+            expired.append((mapIndex, bank))
+
+        return expired
@@ -0,0 +1,374 @@
+# Headless benchmarks by Smjert/Spasitjel
+#
+# Measures the radar engine outside of the client, with the fake providers of radar_core/fakes.py, for instance with CPython:
+#   python -m radar_core.benchmark [--quick] [--only <name part>] [--output <results path>] [--baseline <results path>] [--tolerance 0.25]
+#
+# The benchmarks, each one giving the median of its samples in milliseconds:
+#   refresh-<map>-r<range>-<pattern>: a radar update, while moving on a synthetic map with a visibleRange of range;
+#       the patterns are walk (a tile per update), run (a couple of tiles per update, like the refresh coalescing does),
+#       random (a tile in a random direction) and teleport (always far away, so everything is queried and counted again);
+#       with a -z suffix, for walk and teleport, the same with the Z-aware reachability of radar_core/height_map.py;
+#       on the forest map, for walk and teleport, the trees are counted with the lumberjacking profile, from the statics
+#   session-<map>-r<range>: a whole walk driven by the RefreshScheduler, with a fake player and clock, divided by its steps
+#   reachability-r<range>[-numpy]: counting the reachable banks of the whole scanned area, without and with NumPy
+#   spots-<count>-open, spots-<count>-area: opening a marked spots file with count spots, and loading the spots around a position
+#   ledger-<count>-expire, ledger-<count>-filter: with count consumed banks spread over all the maps, respawning at random times,
+#       dropping the ones respawned in a second, and finding the ones around a position
+#   packets-spawn, packets-speech: building and sending a packet with utilities/misc.py, to a fake PacketLogger
+#   packets-overlay: a frame of a WorldOverlay of utilities/misc.py with overlayItems markers, a tenth of which moved
+#   packets-labels: a label over an item, said with a SpeechQueue of utilities/misc.py, each one twice, and flushed once per frame
+#
+# The land provider calls per update are reported too, but they are counts, not times, so they're never a regression.
+#
+# --output writes the results as JSON; passing such a file as --baseline compares the results with it, and any of them slower
+# by more than the tolerance, and by more than minRegressionTime, is reported as a regression, with an exit code of 1.
+# Keep a baseline per machine, since the times depend on it.
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from radar_core.fakes import FakeStatics, FakeMisc, FakePlayer, FakePacketLogger, FakeObjects, syntheticMaps
+from radar_core.radar_engine import RadarEngine
+from radar_core.reachability import ComputeReachability, numpy
+from radar_core.scheduler import RefreshScheduler
+from radar_core.spots_store import SpotsStore, MarkedSpot
+from radar_core.bank_ledger import BankLedger
+
+resultsVersion = 1
+
+# Differences smaller than this, in milliseconds, are noise even if they're above the tolerance
+minRegressionTime = 0.05
+
+startPosition = (1000, 1000)
+
+def Median(values):
+    values = sorted(values)
+    return values[int(len(values) / 2)]
+
+# Path of steps + 1 positions from startPosition
+def MovementPath(pattern, steps, seed):
+    rng = random.Random(seed)
+    x, y = startPosition
+    path = [(x, y)]
+
+    for _ in range(steps):
+        if pattern == "walk":
+            x += 1
+        elif pattern == "run":
+            x += 2
+            y += 1
+        elif pattern == "random":
+            x += rng.choice((-1, 0, 1))
+            y += rng.choice((-1, 0, 1))
+        elif pattern == "teleport":
+            x = startPosition[0] + rng.randrange(-2000, 2000)
+            y = startPosition[1] + rng.randrange(-2000, 2000)
+        else:
+            raise ValueError(f"Unknown movement pattern {pattern}")
+
+        path.append((x, y))
+
+    return path
+
+def CreateEngine(mapName, visibleRange, seed, reachabilityMode="window", resourceProfile="Mining"):
+    statics = FakeStatics(syntheticMaps[mapName](seed))
+    return (RadarEngine(statics, visibleRange, resourceProfile=resourceProfile, reachabilityMode=reachabilityMode), statics)
+
+# Milliseconds of each update along the path, the first one excluded since it always queries everything,
+# and the land provider calls per update
+def BenchmarkRefresh(mapName, visibleRange, pattern, steps, seed, reachabilityMode="window", resourceProfile="Mining"):
+    engine, statics = CreateEngine(mapName, visibleRange, seed, reachabilityMode, resourceProfile)
+    path = MovementPath(pattern, steps, seed)
+
+    engine.Update(path[0][0], path[0][1], 0)
+    calls = statics.Calls
+
+    times = []
+    for x, y in path[1:]:
+        start = time.perf_counter()
+        engine.Update(x, y, 0)
+        times.append((time.perf_counter() - start) * 1000)
+
+    engine.Close()
+    return (times, (statics.Calls - calls) / steps)
+
+# Milliseconds spent updating the engine per step of a walk, with the updates decided by the RefreshScheduler
+def BenchmarkSession(mapName, visibleRange, steps, seed):
+    engine, _ = CreateEngine(mapName, visibleRange, seed)
+    misc = FakeMisc()
+    player = FakePlayer(MovementPath("random", steps, seed), misc, stepTime=100)
+    updateTime = [0]
+
+    def OnMove(x, y, mapIndex):
+        start = time.perf_counter()
+        engine.Update(x, y, mapIndex)
+        updateTime[0] += time.perf_counter() - start
+
+    scheduler = RefreshScheduler(player, misc, OnMove, lambda: None, clock=misc.Clock)
+    scheduler.Run(lambda: not player.Finished())
+
+    engine.Close()
+    return ((updateTime[0] * 1000) / steps, scheduler.Reports)
+
+def BenchmarkReachability(visibleRange, useNumPy, repeats, seed):
+    engine, _ = CreateEngine("random", visibleRange, seed)
+    engine.Update(startPosition[0], startPosition[1], 0)
+
+    state = engine.State
+    classes, blocked, bankIndices = engine.BuildReachabilityGrids(state)
+    scanRect = (engine.ScanStart, engine.ScanEnd, engine.ScanStart, engine.ScanEnd)
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        ComputeReachability(state.Size, state.Size, classes, blocked, bankIndices, state.CountedConsumedMask, scanRect, useNumPy=useNumPy)
+        times.append((time.perf_counter() - start) * 1000)
+
+    engine.Close()
+    return times
+
+# Spots spread over an area of areaSize x areaSize tiles around startPosition, each with a few tiles around it
+def SyntheticSpots(count, seed, areaSize=4096):
+    rng = random.Random(seed)
+    spots = []
+    for _ in range(count):
+        x = startPosition[0] + rng.randrange(areaSize)
+        y = startPosition[1] + rng.randrange(areaSize)
+        tiles = [(x + rng.randrange(-2, 3), y + rng.randrange(-2, 3)) for _ in range(rng.randrange(1, 5))]
+        spots.append(MarkedSpot(0, x, y, tiles))
+
+    return spots
+
+def BenchmarkSpots(count, repeats, seed):
+    directory = tempfile.mkdtemp(prefix="radar-benchmark-")
+    try:
+        path = os.path.join(directory, "spots.bin")
+        store = SpotsStore(path)
+        store.AppendMany(SyntheticSpots(count, seed))
+        store.WriteIndex()
+
+        rng = random.Random(seed)
+        openTimes = []
+        areaTimes = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            store = SpotsStore(path)
+            openTimes.append((time.perf_counter() - start) * 1000)
+
+            # The area of a radar with the default visibleRange, plus the margin the engine loads
+            x = startPosition[0] + rng.randrange(4096)
+            y = startPosition[1] + rng.randrange(4096)
+            start = time.perf_counter()
+            store.LoadArea(0, x - 26, y - 26, x + 26, y + 26)
+            areaTimes.append((time.perf_counter() - start) * 1000)
+
+        return (openTimes, areaTimes)
+    finally:
+        shutil.rmtree(directory)
+
+# Milliseconds to expire the banks respawning in each second, and to find the consumed banks of a radar area,
+# with count banks consumed over all the maps, respawning within the next hour
+def BenchmarkLedger(count, repeats, seed, numberOfMaps=6, areaBanks=512):
+    rng = random.Random(seed)
+    ledger = BankLedger(numberOfMaps, 8, 8)
+    for _ in range(count):
+        ledger.ForMap(rng.randrange(numberOfMaps)).AddConsumedBank(rng.randrange(areaBanks), rng.randrange(areaBanks), rng.randrange(3600))
+
+    expireTimes = []
+    filterTimes = []
+    for second in range(repeats):
+        start = time.perf_counter()
+        ledger.Expire(second)
+        expireTimes.append((time.perf_counter() - start) * 1000)
+
+        # The banks of a radar with the default visibleRange
+        bankX = rng.randrange(areaBanks)
+        bankY = rng.randrange(areaBanks)
+        start = time.perf_counter()
+        ledger.ForMap(rng.randrange(numberOfMaps)).ConsumedBanksIn(bankX - 2, bankY - 2, bankX + 2, bankY + 2)
+        filterTimes.append((time.perf_counter() - start) * 1000)
+
+    return (expireTimes, filterTimes)
+
+# utilities/misc.py is a Razor Enhanced script helper, which uses the PacketLogger, Items and Mobiles globals;
+# the fake ones are set on the module
+def LoadPacketsHelpers(packetLogger):
+    import importlib.util
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utilities", "misc.py")
+    spec = importlib.util.spec_from_file_location("radar_benchmark_misc", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.PacketLogger = packetLogger
+    module.Items = FakeObjects(0x1779)
+    module.Mobiles = FakeObjects(0x190)
+    return module
+
+def BenchmarkPackets(repeats, batch=1000, overlayItems=300):
+    packetLogger = FakePacketLogger()
+    helpers = LoadPacketsHelpers(packetLogger)
+    overlay = helpers.WorldOverlay(packetLogger)
+    speech = helpers.SpeechQueue(packetLogger, maxPerFrame=overlayItems)
+
+    spawnTimes = []
+    speechTimes = []
+    overlayTimes = []
+    labelTimes = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(batch):
+            helpers.SpawnItem(0x1BFB, 0x40000000 + i, helpers.ItemDirection.North, 1, 1000 + i, 1000, 0, 0x35)
+        spawnTimes.append(((time.perf_counter() - start) * 1000) / batch)
+
+        start = time.perf_counter()
+        for i in range(batch):
+            helpers.SendSpeech(f"{i}", None, helpers.SpeechType.System, 0x35, "System")
+        speechTimes.append(((time.perf_counter() - start) * 1000) / batch)
+
+        for frame in range(10):
+            items = {}
+            for i in range(overlayItems):
+                x = 1000 + i + (frame if i % 10 == 0 else 0)
+                items[("spot", i)] = (0x1F14, x, 1000, 0, 0x21)
+
+            start = time.perf_counter()
+            overlay.Update(items)
+            overlayTimes.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for _ in range(2):
+            for i in range(overlayItems):
+                speech.Say(f"{i % 7}", 0x40000000 + i, helpers.SpeechType.Normal, 0x35, "Radar")
+        speech.Flush()
+        labelTimes.append(((time.perf_counter() - start) * 1000) / overlayItems)
+
+    return (spawnTimes, speechTimes, overlayTimes[1:], labelTimes)
+
+def RunBenchmarks(quick=False, only=None, seed=0):
+    results = {}
+    info = {}
+
+    def Wanted(name):
+        return only is None or only in name
+
+    def Report(name, value):
+        results[name] = value
+        print(f"{name:<40} {value:10.3f} ms", flush=True)
+
+    ranges = (16, 24) if quick else (16, 24, 32)
+    steps = 20 if quick else 100
+    repeats = 5 if quick else 20
+
+    for mapName in ("mountain", "random"):
+        for visibleRange in ranges:
+            for pattern in ("walk", "run", "random", "teleport"):
+                name = f"refresh-{mapName}-r{visibleRange}-{pattern}"
+                if Wanted(name):
+                    times, calls = BenchmarkRefresh(mapName, visibleRange, pattern, steps if pattern != "teleport" else int(steps / 5), seed)
+                    info[f"{name}-statics-calls"] = calls
+                    Report(name, Median(times))
+
+            for pattern in ("walk", "teleport"):
+                name = f"refresh-{mapName}-r{visibleRange}-{pattern}-z"
+                if Wanted(name):
+                    times, calls = BenchmarkRefresh(mapName, visibleRange, pattern, steps if pattern != "teleport" else int(steps / 5), seed, "z")
+                    info[f"{name}-statics-calls"] = calls
+                    Report(name, Median(times))
+
+            name = f"session-{mapName}-r{visibleRange}"
+            if Wanted(name):
+                perStep, updates = BenchmarkSession(mapName, visibleRange, steps, seed)
+                info[f"{name}-updates"] = updates
+                Report(name, perStep)
+
+    for visibleRange in ranges:
+        for pattern in ("walk", "teleport"):
+            name = f"refresh-forest-r{visibleRange}-{pattern}"
+            if Wanted(name):
+                times, calls = BenchmarkRefresh("forest", visibleRange, pattern, steps if pattern != "teleport" else int(steps / 5), seed,
+                                                resourceProfile="Lumberjacking")
+                info[f"{name}-statics-calls"] = calls
+                Report(name, Median(times))
+
+    for visibleRange in ranges + (48,):
+        for useNumPy in ((False, True) if numpy is not None else (False,)):
+            name = f"reachability-r{visibleRange}" + ("-numpy" if useNumPy else "")
+            if Wanted(name):
+                Report(name, Median(BenchmarkReachability(visibleRange, useNumPy, repeats, seed)))
+
+    for count in ((1000, 10000) if quick else (1000, 10000, 100000)):
+        if Wanted(f"spots-{count}-"):
+            openTimes, areaTimes = BenchmarkSpots(count, repeats, seed)
+            Report(f"spots-{count}-open", Median(openTimes))
+            Report(f"spots-{count}-area", Median(areaTimes))
+
+    for count in ((10000, 100000) if quick else (10000, 100000, 1000000)):
+        if Wanted(f"ledger-{count}-"):
+            expireTimes, filterTimes = BenchmarkLedger(count, repeats, seed)
+            Report(f"ledger-{count}-expire", Median(expireTimes))
+            Report(f"ledger-{count}-filter", Median(filterTimes))
+
+    if Wanted("packets-"):
+        spawnTimes, speechTimes, overlayTimes, labelTimes = BenchmarkPackets(repeats)
+        Report("packets-spawn", Median(spawnTimes))
+        Report("packets-speech", Median(speechTimes))
+        Report("packets-overlay", Median(overlayTimes))
+        Report("packets-labels", Median(labelTimes))
+
+    for name, value in info.items():
+        print(f"{name:<40} {value:10.1f}")
+
+    return {"version": resultsVersion, "results": results, "info": info}
+
+# Names of the results slower than the baseline by more than the tolerance, with their baseline and current values
+def FindRegressions(results, baseline, tolerance):
+    regressions = []
+    for name, value in results["results"].items():
+        baseValue = baseline["results"].get(name)
+        if baseValue is None:
+            continue
+
+        if value > baseValue * (1 + tolerance) and value - baseValue > minRegressionTime:
+            regressions.append((name, baseValue, value))
+
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks the radar engine with fake Razor Enhanced providers.")
+    parser.add_argument("--quick", action="store_true", help="fewer sizes and samples")
+    parser.add_argument("--only", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to, as JSON")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown from the baseline, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = RunBenchmarks(args.quick, args.only, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+        if baseline.get("version") != resultsVersion:
+            print(f"{args.baseline} is not a results file of this version", file=sys.stderr)
+            sys.exit(2)
+
+        regressions = FindRegressions(results, baseline, args.tolerance)
+        for name, baseValue, value in regressions:
+            print(f"REGRESSION {name}: {baseValue:.3f} ms -> {value:.3f} ms (+{((value / baseValue) - 1) * 100:.0f}%)", file=sys.stderr)
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+        print(f"No regressions from {args.baseline}")
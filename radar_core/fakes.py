@@ -0,0 +1,274 @@
+# Fake Razor Enhanced providers by Smjert/Spasitjel
+#
+# Stand-ins for the Razor Enhanced Statics, Player, Misc, PacketLogger, Items and Mobiles objects, so that the radar engine, the refresh scheduler
+# and the packets helpers can run outside of the client, like in radar_core/benchmark.py. They only have what those use.
+#
+# The land comes from synthetic maps, computed from the coordinates, so they have no size and take no memory:
+#   FlatMap: walkable grass only, so nothing to count
+#   RandomMap: each tile is independently grass, rock or a resource, which is the worst case for the reachability
+#   MountainMap: mountains of rock with resource tiles on their sides, and caves with resource floors inside them
+#   ForestMap: walkable grass with woods of trees, as statics, for the lumberjacking profile
+# Each one also has the Z of its land, where the rock is the highest and the mountain sides slope up to it;
+# only the ForestMap has statics, a trunk and its foliage above it on each tree tile.
+#
+# Time is fake too: FakeMisc.Pause advances the clock of the FakeMisc instead of sleeping, and the FakePlayer walks along its path
+# according to that clock, so a whole session runs as fast as the code under test allows.
+
+from radar_core.mining_tiles import mountainResourceTiles, caveResourceTiles, rockTiles
+from radar_core.lumberjacking_tiles import treeTrunkTiles, treeFoliageTiles
+
+grassTileID = 0x3
+
+# 32 bit hash of a lattice point, so that the maps are the same for the same seed
+def Hash(x, y, seed):
+    h = ((x * 374761393) + (y * 668265263) + (seed * 1442695041)) & 0xFFFFFFFF
+    h = ((h ^ (h >> 13)) * 1274126177) & 0xFFFFFFFF
+    return h ^ (h >> 16)
+
+# Smooth noise in [0, 1), interpolated between random values on a lattice of cellSize tiles
+def ValueNoise(x, y, cellSize, seed):
+    cellX = x // cellSize
+    cellY = y // cellSize
+    fractionX = (x - (cellX * cellSize)) / cellSize
+    fractionY = (y - (cellY * cellSize)) / cellSize
+
+    topLeft = Hash(cellX, cellY, seed) / 0x100000000
+    topRight = Hash(cellX + 1, cellY, seed) / 0x100000000
+    bottomLeft = Hash(cellX, cellY + 1, seed) / 0x100000000
+    bottomRight = Hash(cellX + 1, cellY + 1, seed) / 0x100000000
+
+    top = topLeft + ((topRight - topLeft) * fractionX)
+    bottom = bottomLeft + ((bottomRight - bottomLeft) * fractionX)
+    return top + ((bottom - top) * fractionY)
+
+class FlatMap():
+    def __init__(self, seed=0):
+        self.Seed = seed
+
+    def TileID(self, x, y):
+        return grassTileID
+
+    def Z(self, x, y):
+        return 0
+
+    def Statics(self, x, y):
+        return []
+
+class RandomMap():
+    def __init__(self, seed=0, resourceChance=0.2, rockChance=0.2):
+        self.Seed = seed
+        self.ResourceLimit = int(resourceChance * 0x10000)
+        self.RockLimit = self.ResourceLimit + int(rockChance * 0x10000)
+
+    def TileID(self, x, y):
+        h = Hash(x, y, self.Seed)
+        value = h & 0xFFFF
+        if value < self.ResourceLimit:
+            return mountainResourceTiles[(h >> 16) % len(mountainResourceTiles)]
+        elif value < self.RockLimit:
+            return rockTiles[(h >> 16) % len(rockTiles)]
+
+        return grassTileID
+
+    def Z(self, x, y):
+        value = Hash(x, y, self.Seed) & 0xFFFF
+        if value < self.ResourceLimit:
+            return 10
+        elif value < self.RockLimit:
+            return 30
+
+        return 0
+
+    def Statics(self, x, y):
+        return []
+
+class MountainMap():
+    def __init__(self, seed=0, mountainSize=48, caveSize=12):
+        self.Seed = seed
+        self.MountainSize = mountainSize
+        self.CaveSize = caveSize
+
+    def TileID(self, x, y):
+        height = ValueNoise(x, y, self.MountainSize, self.Seed)
+        if height < 0.55:
+            return grassTileID
+
+        h = Hash(x, y, self.Seed) >> 8
+        if height < 0.62:
+            return mountainResourceTiles[h % len(mountainResourceTiles)]
+
+        if ValueNoise(x, y, self.CaveSize, self.Seed + 1) < 0.35:
+            return caveResourceTiles[h % len(caveResourceTiles)]
+
+        return rockTiles[h % len(rockTiles)]
+
+    def Z(self, x, y):
+        height = ValueNoise(x, y, self.MountainSize, self.Seed)
+        if height < 0.55:
+            return 0
+
+        if height < 0.62:
+            return int((height - 0.55) * 400)
+
+        if ValueNoise(x, y, self.CaveSize, self.Seed + 1) < 0.35:
+            return 0
+
+        return 40
+
+    def Statics(self, x, y):
+        return []
+
+class ForestMap():
+    def __init__(self, seed=0, woodSize=32, treeChance=0.3):
+        self.Seed = seed
+        self.WoodSize = woodSize
+        self.TreeLimit = int(treeChance * 0x10000)
+
+    def TileID(self, x, y):
+        return grassTileID
+
+    def Z(self, x, y):
+        return 0
+
+    # (static ID, Z) of the statics of a tile
+    def Statics(self, x, y):
+        if ValueNoise(x, y, self.WoodSize, self.Seed) < 0.5:
+            return []
+
+        h = Hash(x, y, self.Seed)
+        if (h & 0xFFFF) >= self.TreeLimit:
+            return []
+
+        h >>= 16
+        return [(treeTrunkTiles[h % len(treeTrunkTiles)], 0), (treeFoliageTiles[h % len(treeFoliageTiles)], 20)]
+
+syntheticMaps = {"flat": FlatMap, "random": RandomMap, "mountain": MountainMap, "forest": ForestMap}
+
+# Rock and mountain side tiles are impassable, the caves floors and the grass aren't
+impassableTiles = frozenset(rockTiles + mountainResourceTiles)
+# Tree trunks are impassable, their foliage isn't
+impassableStatics = frozenset(treeTrunkTiles)
+
+# A static of a tile, as returned by Statics.GetStaticsTileInfo
+class FakeStaticTile():
+    def __init__(self, staticID, z):
+        self.StaticID = staticID
+        self.StaticZ = z
+
+class FakeStatics():
+    # maps is a synthetic map for all the map indices, or a dict of them by map index
+    def __init__(self, maps):
+        self.Maps = maps
+        self.Calls = 0
+
+    def Land(self, mapIndex):
+        return self.Maps[mapIndex] if isinstance(self.Maps, dict) else self.Maps
+
+    def GetLandID(self, x, y, mapIndex):
+        self.Calls += 1
+        return self.Land(mapIndex).TileID(x, y)
+
+    def GetLandZ(self, x, y, mapIndex):
+        self.Calls += 1
+        return self.Land(mapIndex).Z(x, y)
+
+    def GetStaticsTileInfo(self, x, y, mapIndex):
+        self.Calls += 1
+        return [FakeStaticTile(staticID, z) for staticID, z in self.Land(mapIndex).Statics(x, y)]
+
+    def GetTileHeight(self, staticID):
+        self.Calls += 1
+        return 20 if staticID in impassableStatics else 0
+
+    def GetTileFlag(self, staticID, flagName):
+        self.Calls += 1
+        return flagName == "Impassable" and staticID in impassableStatics
+
+    def GetLandFlag(self, tileID, flagName):
+        self.Calls += 1
+        return flagName == "Impassable" and tileID in impassableTiles
+
+class FakePosition():
+    def __init__(self, x, y):
+        self.X = x
+        self.Y = y
+
+class FakeHotKey():
+    def __init__(self, hotKey, timestamp):
+        self.HotKey = hotKey
+        self.Timestamp = timestamp
+
+class FakeMisc():
+    def __init__(self):
+        # Milliseconds since the start
+        self.Time = 0
+        self.HotKeys = []
+        self.Messages = []
+
+    # Seconds, like time.monotonic, for the RefreshScheduler clock
+    def Clock(self):
+        return self.Time / 1000
+
+    def Pause(self, milliseconds):
+        self.Time += milliseconds
+
+    def PressKey(self, hotKey, atTime):
+        self.HotKeys.append(FakeHotKey(hotKey, atTime))
+
+    def LastHotKey(self):
+        last = None
+        for key in self.HotKeys:
+            if key.Timestamp <= self.Time and (last is None or key.Timestamp >= last.Timestamp):
+                last = key
+
+        return last
+
+    def SendMessage(self, message, hue=None):
+        self.Messages.append(message)
+
+# Walks along a path of (x, y) positions, one every stepTime milliseconds of the clock of a FakeMisc
+class FakePlayer():
+    def __init__(self, path, misc, mapIndex=0, stepTime=200):
+        self.Path = path
+        self.Misc = misc
+        self.Map = mapIndex
+        self.StepTime = stepTime
+        self.Messages = []
+
+    @property
+    def Position(self):
+        x, y = self.Path[min(int(self.Misc.Time / self.StepTime), len(self.Path) - 1)]
+        return FakePosition(x, y)
+
+    def Finished(self):
+        return int(self.Misc.Time / self.StepTime) >= len(self.Path)
+
+    def HeadMessage(self, hue, message):
+        self.Messages.append(message)
+
+class FakePacketLogger():
+    def __init__(self):
+        self.Packets = 0
+        self.Bytes = 0
+        self.LastPacket = None
+
+    def SendToClient(self, data):
+        self.Packets += 1
+        self.Bytes += len(data)
+        self.LastPacket = data
+
+class FakeObject():
+    def __init__(self, serial, graphic):
+        self.Serial = serial
+        self.ItemID = graphic
+        self.Body = graphic
+
+# Items or Mobiles, where every serial exists and has the same graphic
+class FakeObjects():
+    def __init__(self, graphic):
+        self.Graphic = graphic
+        self.Calls = 0
+
+    def FindBySerial(self, serial):
+        self.Calls += 1
+        return FakeObject(serial, self.Graphic)
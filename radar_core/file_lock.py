@@ -0,0 +1,119 @@
+# Cross process file lock by Smjert/Spasitjel
+#
+# Several clients can run a radar each on the same machine, sharing the land cache and the marked spots files.
+# Whoever changes one of them holds its lock, which is a lock on a companion file, so that the changes don't interleave.
+#
+# The lock is taken with msvcrt on Windows and with fcntl elsewhere; where neither is available, like in Python builds
+# without them, the lock is an exclusively created file instead, which is considered abandoned after staleLockAge seconds.
+# All the processes sharing a file have to use the same kind of lock, which is the case for the radars of the same machine.
+#
+# The lock is also reentrant for the thread holding it, and excludes the other threads of the process.
+
+import os
+import time
+from threading import RLock
+
+try:
+    import msvcrt
+    if not hasattr(msvcrt, "locking"):
+        msvcrt = None
+except ImportError:
+    msvcrt = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Seconds after which an exclusively created lock file is assumed to belong to a process that died
+staleLockAge = 30
+retryInterval = 0.005
+
+class FileLock():
+    def __init__(self, path, timeout=10):
+        self.Path = path
+        self.Timeout = timeout
+        self.ThreadLock = RLock()
+        self.Depth = 0
+        self.Handle = None
+
+    def acquire(self):
+        self.ThreadLock.acquire()
+        if self.Depth == 0:
+            try:
+                self.LockFile()
+            except Exception:
+                self.ThreadLock.release()
+                raise
+
+        self.Depth += 1
+        return True
+
+    def release(self):
+        self.Depth -= 1
+        if self.Depth == 0:
+            self.UnlockFile()
+
+        self.ThreadLock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.release()
+        return False
+
+    def LockFile(self):
+        deadline = time.monotonic() + self.Timeout
+        while not self.TryLockFile():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for the lock {self.Path}")
+
+            time.sleep(retryInterval)
+
+    def TryLockFile(self):
+        if msvcrt is None and fcntl is None:
+            try:
+                self.Handle = os.open(self.Path + ".held", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.Path + ".held") > staleLockAge:
+                        os.remove(self.Path + ".held")
+                except OSError:
+                    pass
+
+                return False
+
+        # The lock file is kept open, only the lock on it is taken and released
+        if self.Handle is None:
+            self.Handle = os.open(self.Path, os.O_CREAT | os.O_RDWR)
+
+        try:
+            if msvcrt is not None:
+                os.lseek(self.Handle, 0, os.SEEK_SET)
+                msvcrt.locking(self.Handle, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self.Handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+
+        return True
+
+    def UnlockFile(self):
+        if msvcrt is None and fcntl is None:
+            os.close(self.Handle)
+            self.Handle = None
+            os.remove(self.Path + ".held")
+        elif msvcrt is not None:
+            os.lseek(self.Handle, 0, os.SEEK_SET)
+            msvcrt.locking(self.Handle, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.Handle, fcntl.LOCK_UN)
+
+    def Close(self):
+        with self.ThreadLock:
+            if self.Handle is not None and self.Depth == 0:
+                os.close(self.Handle)
+                self.Handle = None
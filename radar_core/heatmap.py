@@ -0,0 +1,285 @@
+# Bank reachability heatmap by Smjert/Spasitjel
+#
+# Which banks can be reached from a tile only depends on the land tiles, so it can be computed once for a whole map,
+# from the land tiles cached by the radar, and saved on a file that the radar reads instead of computing it live:
+#   python -m radar_core.heatmap <map index> [<min x> <min y> <max x> <max y>] [options]
+# Only the consumed banks change while playing, and they are subtracted when the counts are shown.
+# As with the planner, only the profiles whose resources are land tiles, with square banks, can have a heatmap.
+#
+# Since the reach is smaller than a bank, the banks reachable from a tile are always among the 3x3 banks around
+# the bank the tile is in, so each tile stores a 9 bit mask, where bit (((bankY offset + 1) * 3) + bankX offset + 1)
+# is set when the bank at that offset is reachable. Blocked tiles have an empty mask.
+#
+# The file is split in chunks of chunkSize x chunkSize tiles, compressed on their own, so that the radar only has to read
+# and decompress the ones around the player; chunks whose land tiles weren't all cached are not saved,
+# and the radar computes those live.
+#
+# File layout (all values little endian):
+#   Header: magic "RHMP", version (uint16), map index (uint16), chunk size (uint16), bank size (uint16), reach (uint16),
+#           chunks wide (uint16), chunks high (uint16), resource profile name (16 bytes, zero padded)
+#   Directory: per chunk, in row major order: offset (uint32), compressed size (uint32); a size of 0 means the chunk is missing
+#   Chunks: zlib compressed masks (uint16), in row major order
+
+import os
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+
+from radar_core.tile_cache import mapSizes
+from radar_core.reachability import ComputeReachability
+from radar_core.planner import OpenReader, GridBanks, LandProfile, BankDimensions
+
+heatmapMagic = b"RHMP"
+heatmapVersion = 1
+heatmapHeader = struct.Struct("<4sHHHHHHH16s")
+heatmapDirectoryEntry = struct.Struct("<II")
+
+# Bits set in each 9 bit mask
+maskCounts = [bin(mask).count("1") for mask in range(512)]
+
+def HeatmapFilePath(heatmapDirectory, mapIndex, profileName, bankSize):
+    return os.path.join(heatmapDirectory, f"heatmap-{mapIndex}-{profileName}-{bankSize}.bin")
+
+# 9 bit mask of which of the banks around a bank are consumed
+def ConsumedAroundMask(bankX, bankY, consumedBanks):
+    mask = 0
+    bit = 1
+    for offsetY in (-1, 0, 1):
+        for offsetX in (-1, 0, 1):
+            if (bankX + offsetX, bankY + offsetY) in consumedBanks:
+                mask |= bit
+            bit <<= 1
+
+    return mask
+
+class HeatmapFile():
+    def __init__(self, path, maxChunks=64):
+        self.Path = path
+        self.MaxChunks = maxChunks
+        self.Chunks = OrderedDict()
+
+        with open(path, "rb") as f:
+            header = heatmapHeader.unpack(f.read(heatmapHeader.size))
+            magic, version, self.Map, self.ChunkSize, self.BankSize, self.Reach, self.ChunksWide, self.ChunksHigh, profileName = header
+            if magic != heatmapMagic or version != heatmapVersion:
+                raise ValueError(f"{path} is not a heatmap file")
+
+            self.ProfileName = profileName.rstrip(b"\0").decode("ascii")
+            self.Directory = list(heatmapDirectoryEntry.iter_unpack(f.read(self.ChunksWide * self.ChunksHigh * heatmapDirectoryEntry.size)))
+
+    def HasChunk(self, chunkX, chunkY):
+        if chunkX < 0 or chunkY < 0 or chunkX >= self.ChunksWide or chunkY >= self.ChunksHigh:
+            return False
+
+        return self.Directory[(chunkY * self.ChunksWide) + chunkX][1] != 0
+
+    def ReadCompressedChunk(self, chunkX, chunkY):
+        offset, size = self.Directory[(chunkY * self.ChunksWide) + chunkX]
+        with open(self.Path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def GetChunk(self, chunkX, chunkY):
+        key = (chunkX, chunkY)
+        chunk = self.Chunks.get(key)
+        if chunk is not None:
+            self.Chunks.move_to_end(key)
+            return chunk
+
+        chunk = array("H", zlib.decompress(self.ReadCompressedChunk(chunkX, chunkY)))
+
+        self.Chunks[key] = chunk
+        if len(self.Chunks) > self.MaxChunks:
+            self.Chunks.popitem(last=False)
+
+        return chunk
+
+    def Covers(self, minX, minY, maxX, maxY):
+        for chunkY in range(minY // self.ChunkSize, (maxY // self.ChunkSize) + 1):
+            for chunkX in range(minX // self.ChunkSize, (maxX // self.ChunkSize) + 1):
+                if not self.HasChunk(chunkX, chunkY):
+                    return False
+
+        return True
+
+    def GetMask(self, x, y):
+        chunk = self.GetChunk(x // self.ChunkSize, y // self.ChunkSize)
+        return chunk[((y % self.ChunkSize) * self.ChunkSize) + (x % self.ChunkSize)]
+
+    # Number of reachable banks that are not consumed, for each tile of an area, in row major order,
+    # or None if the area is not completely covered by the heatmap.
+    def GetCounts(self, minX, minY, width, height, consumedBanks):
+        if not self.Covers(minX, minY, minX + width - 1, minY + height - 1):
+            return None
+
+        bankSize = self.BankSize
+        consumedAround = {}
+        counts = []
+
+        for y in range(minY, minY + height):
+            for x in range(minX, minX + width):
+                mask = self.GetMask(x, y)
+                if mask == 0:
+                    counts.append(0)
+                    continue
+
+                bank = (x // bankSize, y // bankSize)
+                consumedMask = consumedAround.get(bank)
+                if consumedMask is None:
+                    consumedMask = ConsumedAroundMask(bank[0], bank[1], consumedBanks)
+                    consumedAround[bank] = consumedMask
+
+                counts.append(maskCounts[mask & ~consumedMask])
+
+        return counts
+
+workerState = {}
+
+def InitWorker(cacheDirectory, mapIndex, profileName, bankSize, reach):
+    workerState["Reader"] = OpenReader(cacheDirectory, mapIndex, profileName)
+    workerState["BankSize"] = bankSize
+    workerState["Reach"] = reach
+
+# Computes the masks of a chunk; returns the chunk coordinates and its compressed masks,
+# or None for the masks if some of the land tiles it needs aren't cached.
+def BuildChunk(task):
+    chunkX, chunkY, chunkSize = task
+    reader = workerState["Reader"]
+    bankSize = workerState["BankSize"]
+    reach = workerState["Reach"]
+
+    gridMinX = (chunkX * chunkSize) - reach
+    gridMinY = (chunkY * chunkSize) - reach
+    size = chunkSize + (reach * 2)
+
+    classes, blocked, missingBlocks = reader.ReadGrid(gridMinX, gridMinY, size, size)
+    if missingBlocks > 0:
+        return (chunkX, chunkY, None)
+
+    bankIndices, indexBanks, _ = GridBanks(gridMinX, gridMinY, size, size, bankSize, bankSize, set())
+    result = ComputeReachability(size, size, classes, blocked, bankIndices, 0, (reach, size - reach, reach, size - reach), reach)
+
+    bankBits = dict((bank, index) for index, bank in indexBanks.items())
+    masks = array("H", [0] * (chunkSize * chunkSize))
+
+    i = 0
+    for row in range(reach, size - reach):
+        for col in range(reach, size - reach):
+            if result.GetCount(row, col) > 0:
+                tileMask = result.GetMask(row, col)
+                bankX = (gridMinX + col) // bankSize
+                bankY = (gridMinY + row) // bankSize
+
+                mask = 0
+                bit = 1
+                for offsetY in (-1, 0, 1):
+                    for offsetX in (-1, 0, 1):
+                        index = bankBits.get((bankX + offsetX, bankY + offsetY))
+                        if index is not None and tileMask & (1 << index):
+                            mask |= bit
+                        bit <<= 1
+
+                masks[i] = mask
+            i += 1
+
+    return (chunkX, chunkY, zlib.compress(masks.tobytes(), 9))
+
+# Builds the chunks of an area; the chunks outside of it, or that can't be built, are kept from the existing file, if any.
+# bankSize, if given, makes the banks bankSize x bankSize tiles instead of the size of the profile.
+def BuildHeatmap(cacheDirectory, outputPath, mapIndex, profileName="Mining", bankSize=None, chunkSize=64, area=None, workers=None):
+    profile = LandProfile(profileName)
+    bankWidth, bankHeight = BankDimensions(profile, bankSize)
+    if bankWidth != bankHeight:
+        raise ValueError("The heatmap needs square banks")
+
+    bankSize = bankWidth
+    reach = profile.Reach
+    if reach > bankSize:
+        raise ValueError("The heatmap needs the reach to be smaller than the banks")
+
+    width, height = mapSizes[mapIndex]
+    chunksWide = int((width + chunkSize - 1) / chunkSize)
+    chunksHigh = int((height + chunkSize - 1) / chunkSize)
+
+    if area is None:
+        area = (0, 0, width - 1, height - 1)
+
+    tasks = []
+    for chunkY in range(max(area[1], 0) // chunkSize, (min(area[3], height - 1) // chunkSize) + 1):
+        for chunkX in range(max(area[0], 0) // chunkSize, (min(area[2], width - 1) // chunkSize) + 1):
+            tasks.append((chunkX, chunkY, chunkSize))
+
+    initArgs = (cacheDirectory, mapIndex, profileName, bankSize, reach)
+    if workers == 1:
+        InitWorker(*initArgs)
+        results = [BuildChunk(task) for task in tasks]
+    else:
+        from multiprocessing import Pool
+
+        with Pool(workers, InitWorker, initArgs) as pool:
+            results = pool.map(BuildChunk, tasks, chunksize=16)
+
+    chunks = {}
+    if os.path.exists(outputPath):
+        existing = HeatmapFile(outputPath)
+        if (existing.Map, existing.ChunkSize, existing.BankSize, existing.Reach, existing.ProfileName) == (mapIndex, chunkSize, bankSize, reach, profileName):
+            for chunkY in range(chunksHigh):
+                for chunkX in range(chunksWide):
+                    if existing.HasChunk(chunkX, chunkY):
+                        chunks[(chunkX, chunkY)] = existing.ReadCompressedChunk(chunkX, chunkY)
+
+    built = 0
+    for chunkX, chunkY, compressed in results:
+        if compressed is not None:
+            chunks[(chunkX, chunkY)] = compressed
+            built += 1
+
+    directory = [(0, 0)] * (chunksWide * chunksHigh)
+    data = bytearray()
+    dataStart = heatmapHeader.size + (len(directory) * heatmapDirectoryEntry.size)
+
+    for chunkX, chunkY in sorted(chunks, key=lambda chunk: (chunk[1], chunk[0])):
+        compressed = chunks[(chunkX, chunkY)]
+        directory[(chunkY * chunksWide) + chunkX] = (dataStart + len(data), len(compressed))
+        data += compressed
+
+    temporaryPath = outputPath + ".tmp"
+    with open(temporaryPath, "wb") as f:
+        f.write(heatmapHeader.pack(heatmapMagic, heatmapVersion, mapIndex, chunkSize, bankSize, reach, chunksWide, chunksHigh,
+                                   profileName.encode("ascii")))
+        for entry in directory:
+            f.write(heatmapDirectoryEntry.pack(*entry))
+        f.write(data)
+
+    os.replace(temporaryPath, outputPath)
+    return (built, len(tasks))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precomputes the banks reachable from every tile of a map.")
+    parser.add_argument("map", type=int, help="map index, the Player.Map value")
+    parser.add_argument("area", type=int, nargs="*", help="optional <min x> <min y> <max x> <max y>, the whole map by default")
+    parser.add_argument("--cache-dir", default="radar-land-cache", help="land tiles cache folder of the radar")
+    parser.add_argument("--output-dir", default="radar-heatmaps", help="heatmaps folder of the radar")
+    parser.add_argument("--profile", default="Mining", help="resource profile, see resource_profiles.py")
+    parser.add_argument("--bank-size", type=int, default=None, help="size of the square banks, the size of the profile ones by default")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, all the cores by default")
+    args = parser.parse_args()
+
+    if len(args.area) not in (0, 4):
+        parser.error("the area needs 4 values: <min x> <min y> <max x> <max y>")
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    try:
+        bankWidth, _ = BankDimensions(LandProfile(args.profile), args.bank_size)
+        outputPath = HeatmapFilePath(args.output_dir, args.map, args.profile, bankWidth)
+        built, total = BuildHeatmap(args.cache_dir, outputPath, args.map, args.profile, args.bank_size,
+                                    area=tuple(args.area) if args.area else None, workers=args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Built {built} of {total} chunks in {outputPath}; the others don't have all their land tiles cached")
@@ -0,0 +1,169 @@
+# Height map and line of sight by Smjert/Spasitjel
+#
+# The fixed reach window counts every resource tile within reach, but servers also check that the tile is in line of sight
+# of the player, so a resource tile on the other side of a rock, or high up on a cliff, can't actually be mined from there.
+# ZReach approximates that check with the heights of the tiles:
+#   the player stands on the land of its tile, and looks from eyeHeight above it, to the land of the resource tile;
+#   the line between them is blocked by any tile it crosses whose top, the highest of its land and statics, is above the line.
+# The checks are done on the LandZ and TopZ of a tile grid, through the GridSight given by ZReach.ForGrid.
+# Each tile pair is checked once: the terrain never changes, so the results are kept by world coordinates, for all the grids.
+#
+# The heights come from a height provider, which is any object with:
+#   GetTileHeights(x, y, mapIndex) -> (land Z, top Z)
+# StaticsHeights is one, on top of a land provider like the Razor Enhanced Statics, with GetLandZ(x, y, mapIndex)
+# and optionally GetTileHeight(staticID), without which statics only count for their Z, and of a StaticsCache
+# (see statics_cache.py) for the statics of the tiles, which are then queried only once for the heights and the resources.
+#
+# HeightCache keeps them in memory in blocks of blockSize x blockSize tiles, the least recently used blocks being evicted.
+
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+# How high the eyes of the player are above the tile it stands on
+eyeHeight = 14
+
+# Results kept before starting over
+maxCachedPairs = 262144
+
+class StaticsHeights():
+    def __init__(self, landProvider, statics):
+        self.Provider = landProvider
+        self.Statics = statics
+        self.TileHeights = {}
+
+    def StaticHeight(self, staticID):
+        height = self.TileHeights.get(staticID)
+        if height is None:
+            getTileHeight = getattr(self.Provider, "GetTileHeight", None)
+            height = getTileHeight(staticID) if getTileHeight is not None else 0
+            self.TileHeights[staticID] = height
+
+        return height
+
+    def GetTileHeights(self, x, y, mapIndex):
+        landZ = self.Provider.GetLandZ(x, y, mapIndex)
+        topZ = landZ
+        for staticID, z in self.Statics.GetStatics(x, y, mapIndex):
+            topZ = max(topZ, z + self.StaticHeight(staticID))
+
+        return (landZ, topZ)
+
+class HeightBlock():
+    def __init__(self, size):
+        self.LandZ = array("b", bytes(size * size))
+        self.TopZ = array("b", bytes(size * size))
+
+def ClampZ(z):
+    return min(max(z, -128), 127)
+
+class HeightCache():
+    def __init__(self, heightProvider, blockSize, maxBlocks=4096):
+        self.Provider = heightProvider
+        self.BlockSize = blockSize
+        self.MaxBlocks = maxBlocks
+        self.Blocks = OrderedDict()
+        self.Lock = Lock()
+
+    def GetBlock(self, mapIndex, blockX, blockY):
+        key = (mapIndex, blockX, blockY)
+
+        with self.Lock:
+            block = self.Blocks.get(key)
+            if block is not None:
+                self.Blocks.move_to_end(key)
+                return block
+
+        # Loaded without holding the lock, so that a block being prefetched doesn't hold up the others
+        size = self.BlockSize
+        block = HeightBlock(size)
+        i = 0
+        for y in range(blockY * size, (blockY + 1) * size):
+            for x in range(blockX * size, (blockX + 1) * size):
+                landZ, topZ = self.Provider.GetTileHeights(x, y, mapIndex)
+                block.LandZ[i] = ClampZ(landZ)
+                block.TopZ[i] = ClampZ(topZ)
+                i += 1
+
+        with self.Lock:
+            self.Blocks[key] = block
+            if len(self.Blocks) > self.MaxBlocks:
+                self.Blocks.popitem(last=False)
+
+        return block
+
+    def GetTileHeights(self, x, y, mapIndex):
+        size = self.BlockSize
+        blockX = x // size
+        blockY = y // size
+        block = self.GetBlock(mapIndex, blockX, blockY)
+        i = ((y - (blockY * size)) * size) + (x - (blockX * size))
+        return (block.LandZ[i], block.TopZ[i])
+
+# The tiles a line from (0, 0) to (deltaX, deltaY) crosses, endpoints excluded, as (deltaX, deltaY, fraction of the line)
+def LineTiles(deltaX, deltaY):
+    steps = max(abs(deltaX), abs(deltaY))
+    tiles = []
+    for step in range(1, steps):
+        fraction = step / steps
+        tiles.append((int(round(deltaX * fraction)), int(round(deltaY * fraction)), fraction))
+
+    return tiles
+
+class ZReach():
+    def __init__(self, reach=2):
+        self.Reach = reach
+        self.Side = (reach * 2) + 1
+        self.Lines = {}
+        for deltaY in range(-reach, reach + 1):
+            for deltaX in range(-reach, reach + 1):
+                self.Lines[(deltaX, deltaY)] = LineTiles(deltaX, deltaY)
+
+        # World tile and offset -> reachable
+        self.Pairs = {}
+        self.Hits = 0
+        self.Checks = 0
+
+    # The checks for a grid of tiles (see radar_core/tile_grid.py), whose first tile is at originX, originY
+    def ForGrid(self, mapIndex, originX, originY, tiles):
+        return GridSight(self, mapIndex, originX, originY, tiles)
+
+class GridSight():
+    def __init__(self, zReach, mapIndex, originX, originY, tiles):
+        self.ZReach = zReach
+        self.Map = mapIndex
+        self.OriginX = originX
+        self.OriginY = originY
+        self.Width = tiles.Size
+        self.LandZ = tiles.LandZ
+        self.TopZ = tiles.TopZ
+
+    # Whether the resource tile at (row + deltaRow, col + deltaCol) of the grid can be mined standing on (row, col)
+    def CanReach(self, row, col, deltaRow, deltaCol):
+        zReach = self.ZReach
+        worldKey = (self.Map << 26) | ((self.OriginY + row) << 13) | (self.OriginX + col)
+        key = (worldKey * zReach.Side * zReach.Side) + ((deltaRow + zReach.Reach) * zReach.Side) + deltaCol + zReach.Reach
+
+        reachable = zReach.Pairs.get(key)
+        if reachable is not None:
+            zReach.Hits += 1
+            return reachable
+
+        zReach.Checks += 1
+        reachable = self.LineOfSight(row, col, deltaRow, deltaCol)
+        if len(zReach.Pairs) >= maxCachedPairs:
+            zReach.Pairs.clear()
+        zReach.Pairs[key] = reachable
+        return reachable
+
+    def LineOfSight(self, row, col, deltaRow, deltaCol):
+        width = self.Width
+        i = (row * width) + col
+        eyeZ = self.LandZ[i] + eyeHeight
+        targetZ = self.LandZ[((row + deltaRow) * width) + col + deltaCol]
+
+        for lineCol, lineRow, fraction in self.ZReach.Lines[(deltaCol, deltaRow)]:
+            if self.TopZ[i + (lineRow * width) + lineCol] > eyeZ + ((targetZ - eyeZ) * fraction):
+                return False
+
+        return True
@@ -0,0 +1,32 @@
+# Lumberjacking resource tiles by Smjert/Spasitjel
+#
+# The trees used by the resource radar to recognize lumberjacking resources. Unlike the ore, they're statics,
+# so the profile reads them from the statics of each tile (see tile_classifier.py and statics_cache.py).
+
+from radar_core.tile_classifier import ResourceProfile, sourceStatics
+
+###################################################################################################
+# The majority of you don't need to modify this, but if you find a tree that you would like to add
+# or remove from the list, then this can be done here.
+#
+# These are the static IDs of the trunks and of the foliage that servers accept as trees, as in the ServUO lumberjacking.
+###################################################################################################
+
+treeTrunkTiles = [0xCCA, 0xCCB, 0xCCC, 0xCCD, 0xCD0, 0xCD3, 0xCD6, 0xCD8, 0xCDA, 0xCDD, 0xCE0, 0xCE3, 0xCE6,
+                  0xCF8, 0xCFB, 0xCFE, 0xD01, 0xD41, 0xD42, 0xD43, 0xD44, 0xD57, 0xD58, 0xD59, 0xD5A, 0xD5B,
+                  0xD6E, 0xD6F, 0xD70, 0xD71, 0xD72, 0xD84, 0xD85, 0xD86, 0x12B5, 0x12B6, 0x12B7, 0x12B8,
+                  0x12B9, 0x12BA, 0x12BB, 0x12BC, 0x12BD]
+
+treeFoliageTiles = [0xCCE, 0xCCF, 0xCD1, 0xCD2, 0xCD4, 0xCD5, 0xCD7, 0xCD9, 0xCDB, 0xCDC, 0xCDE, 0xCDF, 0xCE1,
+                    0xCE2, 0xCE4, 0xCE5, 0xCE7, 0xCE8, 0xCF9, 0xCFA, 0xCFC, 0xCFD, 0xCFF, 0xD00, 0xD02, 0xD03,
+                    0xD45, 0xD46, 0xD47, 0xD48, 0xD49, 0xD4A, 0xD4B, 0xD4C, 0xD4D, 0xD4E, 0xD4F, 0xD50, 0xD51,
+                    0xD52, 0xD53, 0xD5C, 0xD5D, 0xD5E, 0xD5F, 0xD60, 0xD61, 0xD62, 0xD63, 0xD64, 0xD65, 0xD66,
+                    0xD67, 0xD68, 0xD69, 0xD73, 0xD74, 0xD75, 0xD76, 0xD77, 0xD78, 0xD79, 0xD7A, 0xD7B, 0xD7C,
+                    0xD7D, 0xD7E, 0xD7F, 0xD87, 0xD88, 0xD89, 0xD8A, 0xD8B, 0xD8C, 0xD8D, 0xD8E, 0xD8F, 0xD90,
+                    0xD95, 0xD96, 0xD97, 0xD99, 0xD9A, 0xD9B, 0xD9D, 0xD9E, 0xD9F, 0xDA1, 0xDA2, 0xDA3, 0xDA5,
+                    0xDA6, 0xDA7, 0xDA9, 0xDAA, 0xDAB, 0x12BE, 0x12BF, 0x12C0, 0x12C1, 0x12C2, 0x12C3, 0x12C4,
+                    0x12C5, 0x12C6, 0x12C7]
+
+# The lumberjacking banks are 4 tiles wide and 3 high
+lumberjackingProfiles = [ResourceProfile("Lumberjacking", treeTrunkTiles + treeFoliageTiles, [], bankWidth=4, bankHeight=3,
+                                         source=sourceStatics, skill="Lumberjacking")]
@@ -0,0 +1,288 @@
+# Offline spots planner by Smjert/Spasitjel
+#
+# Finds, for an area of a map, a small set of spots from which the most distinct resource banks can be gathered.
+# It reads the land tiles cached by the radar (see tile_cache), so it runs outside of the client, for instance with CPython:
+#   python -m radar_core.planner <map index> <min x> <min y> <max x> <max y> --output planned-spots.txt [options]
+# Walk the area with the radar open first, so that its land tiles are cached; tiles that aren't cached are considered blocked.
+# Only the profiles whose resources are land tiles can be planned, the statics aren't cached on disk.
+# The banks and the reach are the ones of the profile, unless --bank-size is given, as the bankSize setting of the radar.
+#
+# The bank counts of every walkable tile are computed as the radar does, in chunks processed in parallel by a pool of processes.
+# Spots are then picked greedily, each time the one reaching the most banks not reached by the spots picked before it,
+# which is the classic approximation of the maximum coverage problem.
+#
+# The result is written in the marked spots format: the text one when the output path ends with .txt, the binary one otherwise.
+
+import heapq
+import os
+import sys
+
+from radar_core.tile_classifier import TileClassifier, sourceLand
+from radar_core.tile_cache import LandBlockFile, LandBlockFilePath, MapBlocksSize, cacheBlockSize
+from radar_core.reachability import BankIndexer, ComputeReachability, FirstReachableTiles
+from radar_core.spots_store import SpotsStore, MarkedSpot, FormatTextSpot
+from radar_core.resource_profiles import resourceProfiles
+
+class LandGridReader():
+    def __init__(self, blockFile, classifier, blockSize):
+        self.BlockFile = blockFile
+        self.Classifier = classifier
+        self.BlockSize = blockSize
+
+    # Flat classes and blocked grids of an area; tiles of blocks that are not cached are blocked.
+    # Also returns how many blocks were not cached.
+    def ReadGrid(self, minX, minY, width, height):
+        size = self.BlockSize
+        classes = [0] * (width * height)
+        blocked = [1] * (width * height)
+        missingBlocks = 0
+
+        for blockY in range(minY // size, ((minY + height - 1) // size) + 1):
+            for blockX in range(minX // size, ((minX + width - 1) // size) + 1):
+                block = None
+                if blockX >= 0 and blockY >= 0 and blockX < self.BlockFile.BlocksWide and blockY < self.BlockFile.BlocksHigh:
+                    block = self.BlockFile.Read(blockX, blockY)
+
+                if block is None:
+                    missingBlocks += 1
+                    continue
+
+                for tileY in range(max(blockY * size, minY), min((blockY + 1) * size, minY + height)):
+                    blockIndex = (tileY - (blockY * size)) * size
+                    gridIndex = (tileY - minY) * width
+                    for tileX in range(max(blockX * size, minX), min((blockX + 1) * size, minX + width)):
+                        i = blockIndex + (tileX - (blockX * size))
+                        classes[gridIndex + (tileX - minX)] = self.Classifier.Classes[block.TileIDs[i]]
+                        blocked[gridIndex + (tileX - minX)] = block.Blocked[i]
+
+        return (classes, blocked, missingBlocks)
+
+# The profile of a name, which has to gather land tiles
+def LandProfile(profileName):
+    for profile in resourceProfiles:
+        if profile.Name == profileName:
+            if profile.Source != sourceLand:
+                raise ValueError(f"The resources of the {profileName} profile are statics, which are not cached on disk")
+
+            return profile
+
+    raise ValueError(f"Unknown resource profile {profileName}")
+
+# Bank width and height of a profile, or bankSize x bankSize if it's given
+def BankDimensions(profile, bankSize=None):
+    if bankSize is not None:
+        return (bankSize, bankSize)
+
+    return (profile.BankWidth, profile.BankHeight)
+
+def OpenReader(cacheDirectory, mapIndex, profileName):
+    LandProfile(profileName)
+    classifier = TileClassifier(resourceProfiles)
+    classifier.SetProfile(profileName)
+
+    blocksWide, blocksHigh = MapBlocksSize(mapIndex, cacheBlockSize)
+    blockFile = LandBlockFile(LandBlockFilePath(cacheDirectory, mapIndex, cacheBlockSize), mapIndex, cacheBlockSize, blocksWide, blocksHigh,
+                              readOnly=True)
+    return LandGridReader(blockFile, classifier, cacheBlockSize)
+
+# Bank indices of a grid, the bank of each index, and the mask of the consumed banks in it
+def GridBanks(minX, minY, width, height, bankWidth, bankHeight, consumedBanks):
+    indexer = BankIndexer(width, height, bankWidth, bankHeight)
+    bankIndices = []
+    indexBanks = {}
+    consumedMask = 0
+
+    for y in range(minY, minY + height):
+        for x in range(minX, minX + width):
+            bank = (x // bankWidth, y // bankHeight)
+            index = indexer.Index(bank[0], bank[1])
+            bankIndices.append(index)
+
+            if index not in indexBanks:
+                indexBanks[index] = bank
+                if bank in consumedBanks:
+                    consumedMask |= 1 << index
+
+    return (bankIndices, indexBanks, consumedMask)
+
+workerState = {}
+
+def InitWorker(cacheDirectory, mapIndex, profileName, bankSize, consumedBanks):
+    profile = LandProfile(profileName)
+    workerState["Reader"] = OpenReader(cacheDirectory, mapIndex, profileName)
+    workerState["Reach"] = profile.Reach
+    workerState["BankWidth"], workerState["BankHeight"] = BankDimensions(profile, bankSize)
+    workerState["ConsumedBanks"] = consumedBanks
+
+# Walkable tiles of a chunk, with inclusive bounds, that reach at least a bank, as (x, y, banks)
+def PlanChunk(chunk):
+    reader = workerState["Reader"]
+    reach = workerState["Reach"]
+    minX, minY, maxX, maxY = chunk
+
+    gridMinX = minX - reach
+    gridMinY = minY - reach
+    width = (maxX - minX + 1) + (reach * 2)
+    height = (maxY - minY + 1) + (reach * 2)
+
+    classes, blocked, missingBlocks = reader.ReadGrid(gridMinX, gridMinY, width, height)
+    bankIndices, indexBanks, consumedMask = GridBanks(gridMinX, gridMinY, width, height, workerState["BankWidth"], workerState["BankHeight"],
+                                                      workerState["ConsumedBanks"])
+
+    result = ComputeReachability(width, height, classes, blocked, bankIndices, consumedMask, (reach, height - reach, reach, width - reach),
+                                 reach)
+
+    candidates = []
+    for row in range(reach, height - reach):
+        for col in range(reach, width - reach):
+            if result.GetCount(row, col) == 0:
+                continue
+
+            mask = result.GetMask(row, col)
+            banks = []
+            while mask:
+                lowest = mask & -mask
+                banks.append(indexBanks[lowest.bit_length() - 1])
+                mask ^= lowest
+
+            candidates.append((gridMinX + col, gridMinY + row, tuple(banks)))
+
+    return (candidates, missingBlocks)
+
+def SplitChunks(minX, minY, maxX, maxY, chunkSize):
+    chunks = []
+    for chunkY in range(minY, maxY + 1, chunkSize):
+        for chunkX in range(minX, maxX + 1, chunkSize):
+            chunks.append((chunkX, chunkY, min(chunkX + chunkSize - 1, maxX), min(chunkY + chunkSize - 1, maxY)))
+
+    return chunks
+
+# Greedy maximum coverage: candidates are (x, y, banks); returns the chosen (x, y) in the order they were chosen.
+# Gains only decrease as banks get covered, so a candidate whose recomputed gain is still the highest in the heap is the best one.
+def ChooseSpots(candidates, maxSpots=None, minBanks=1):
+    heap = [(-len(banks), y, x, i) for i, (x, y, banks) in enumerate(candidates)]
+    heapq.heapify(heap)
+
+    covered = set()
+    chosen = []
+
+    while len(heap) > 0 and (maxSpots is None or len(chosen) < maxSpots):
+        negativeGain, y, x, i = heapq.heappop(heap)
+        gain = sum(1 for bank in candidates[i][2] if bank not in covered)
+
+        if gain != -negativeGain:
+            if gain > 0:
+                heapq.heappush(heap, (-gain, y, x, i))
+            continue
+
+        if gain < minBanks:
+            break
+
+        covered.update(candidates[i][2])
+        chosen.append((x, y))
+
+    return chosen
+
+# The first reachable tile of each bank not consumed yet, as the radar would save it
+def SpotTiles(reader, x, y, reach, bankWidth, bankHeight, consumedBanks):
+    size = (reach * 2) + 1
+    minX = x - reach
+    minY = y - reach
+
+    classes, blocked, _ = reader.ReadGrid(minX, minY, size, size)
+    bankIndices, _, consumedMask = GridBanks(minX, minY, size, size, bankWidth, bankHeight, consumedBanks)
+
+    tiles = FirstReachableTiles(size, size, classes, blocked, bankIndices, consumedMask, reach, reach, reach)
+    return [(minX + col, minY + row) for col, row in tiles]
+
+# bankSize, if given, makes the banks bankSize x bankSize tiles instead of the size of the profile
+def PlanArea(cacheDirectory, mapIndex, minX, minY, maxX, maxY, profileName="Mining", bankSize=None,
+             chunkSize=256, workers=None, maxSpots=None, minBanks=1, consumedBanks=None):
+    profile = LandProfile(profileName)
+    bankWidth, bankHeight = BankDimensions(profile, bankSize)
+    consumedBanks = set(consumedBanks or [])
+    chunks = SplitChunks(minX, minY, maxX, maxY, chunkSize)
+    initArgs = (cacheDirectory, mapIndex, profileName, bankSize, consumedBanks)
+
+    if workers == 1 or len(chunks) == 1:
+        InitWorker(*initArgs)
+        results = [PlanChunk(chunk) for chunk in chunks]
+    else:
+        from multiprocessing import Pool
+
+        with Pool(workers, InitWorker, initArgs) as pool:
+            results = pool.map(PlanChunk, chunks)
+
+    candidates = []
+    missingBlocks = 0
+    for chunkCandidates, chunkMissingBlocks in results:
+        candidates.extend(chunkCandidates)
+        missingBlocks += chunkMissingBlocks
+
+    reader = OpenReader(cacheDirectory, mapIndex, profileName)
+    spots = []
+    try:
+        for x, y in ChooseSpots(candidates, maxSpots, minBanks):
+            tiles = SpotTiles(reader, x, y, profile.Reach, bankWidth, bankHeight, consumedBanks)
+            spots.append(MarkedSpot(mapIndex, x, y, tiles))
+
+            for tileX, tileY in tiles:
+                consumedBanks.add((tileX // bankWidth, tileY // bankHeight))
+    finally:
+        reader.BlockFile.Close()
+
+    return (spots, missingBlocks)
+
+def WriteSpots(spots, outputPath):
+    if outputPath.endswith(".txt"):
+        with open(outputPath, "w") as f:
+            for spot in spots:
+                f.write(FormatTextSpot(spot) + "\n")
+    else:
+        store = SpotsStore(outputPath)
+        store.AppendMany(spots)
+        store.WriteIndex()
+
+def ConsumedBanksOf(spotsPath, mapIndex, bankWidth, bankHeight):
+    banks = set()
+    for spot in SpotsStore(spotsPath).AllSpots():
+        if spot.Map == mapIndex:
+            for tileX, tileY in spot.Tiles:
+                banks.add((tileX // bankWidth, tileY // bankHeight))
+
+    return banks
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Plans the spots that reach the most resource banks in an area.")
+    parser.add_argument("map", type=int, help="map index, the Player.Map value")
+    parser.add_argument("minX", type=int)
+    parser.add_argument("minY", type=int)
+    parser.add_argument("maxX", type=int)
+    parser.add_argument("maxY", type=int)
+    parser.add_argument("--output", required=True, help="marked spots file to write, text if it ends with .txt")
+    parser.add_argument("--cache-dir", default="radar-land-cache", help="land tiles cache folder of the radar")
+    parser.add_argument("--profile", default="Mining", help="resource profile, see resource_profiles.py")
+    parser.add_argument("--spots", help="marked spots file whose banks are already consumed")
+    parser.add_argument("--bank-size", type=int, default=None, help="size of the square banks, the size of the profile ones by default")
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, all the cores by default")
+    parser.add_argument("--max-spots", type=int, default=None)
+    parser.add_argument("--min-banks", type=int, default=1, help="don't pick spots reaching less new banks than this")
+    args = parser.parse_args()
+
+    try:
+        bankWidth, bankHeight = BankDimensions(LandProfile(args.profile), args.bank_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    consumed = ConsumedBanksOf(args.spots, args.map, bankWidth, bankHeight) if args.spots and os.path.exists(args.spots) else set()
+    spots, missingBlocks = PlanArea(args.cache_dir, args.map, args.minX, args.minY, args.maxX, args.maxY, args.profile, args.bank_size,
+                                    args.chunk_size, args.workers, args.max_spots, args.min_banks, consumed)
+    WriteSpots(spots, args.output)
+
+    if missingBlocks > 0:
+        print(f"{missingBlocks} blocks of land tiles are not cached and have been considered blocked", file=sys.stderr)
+
+    print(f"Planned {len(spots)} spots reaching {sum(len(spot.Tiles) for spot in spots)} banks")
@@ -0,0 +1,149 @@
+# Tile prefetcher by Smjert/Spasitjel
+#
+# Walking into an area that isn't cached makes the radar update wait for the land provider (the Razor Enhanced Statics)
+# to be queried for the tiles that just entered the visible area. The prefetcher follows the heading of the player,
+# taken from the successive positions it's given, and loads in the tile cache, on a thread of its own, the blocks just beyond
+# the visible area in that direction, so that while walking steadily the updates find them already cached.
+#
+# The blocks hold everything the reachability is computed from, the tile IDs and their impassable flags, which are read once
+# per tile ID by the classifier, and the blocks of the other caches in BlockCaches, like the statics and the heights of the tiles,
+# when the resource profile uses them; the counts themselves depend on the consumed banks at the time of the update, so they aren't.
+#
+# When the heading changes, what's left to load for the previous one is cancelled; a teleport or a map change just cancels it.
+# The thread is started by the first position, so an engine that is never given one doesn't have it.
+
+from threading import Thread, Lock, Event
+
+from radar_core.profiler import NullProfiler
+
+def Sign(value):
+    return (value > 0) - (value < 0)
+
+class TilePrefetcher():
+    # landTiles is a TileCache; distance is how many tiles beyond the visible area are loaded;
+    # blockCaches are other caches with blocks of the same size, with GetBlock(mapIndex, blockX, blockY)
+    def __init__(self, landTiles, visibleRange, distance=16, profiler=None, blockCaches=()):
+        self.LandTiles = landTiles
+        self.BlockCaches = blockCaches
+        self.BlockSize = landTiles.BlockSize
+        self.VisibleRange = visibleRange
+        self.Distance = distance
+        self.Profiler = profiler if profiler is not None else NullProfiler()
+
+        self.Lock = Lock()
+        self.Wake = Event()
+        self.Thread = None
+        self.Stopped = False
+
+        self.LastPosition = None
+        self.Heading = None
+        # Increased each time the blocks being loaded are no longer wanted
+        self.Generation = 0
+        # (generation, map index, blocks) to load next
+        self.Request = None
+
+        self.Prefetched = 0
+        self.Cancelled = 0
+
+    def Start(self):
+        self.Thread = Thread(target=self.Run)
+        self.Thread.daemon = True
+        self.Thread.start()
+
+    def Stop(self):
+        self.Stopped = True
+        self.Wake.set()
+        if self.Thread is not None:
+            self.Thread.join()
+            self.Thread = None
+
+    # Called with each position of the player
+    def Observe(self, x, y, mapIndex):
+        last = self.LastPosition
+        self.LastPosition = (x, y, mapIndex)
+        if last is None or (x, y, mapIndex) == last:
+            return
+
+        deltaX = x - last[0]
+        deltaY = y - last[1]
+
+        with self.Lock:
+            if mapIndex != last[2] or abs(deltaX) > self.VisibleRange or abs(deltaY) > self.VisibleRange:
+                self.Heading = None
+                self.Generation += 1
+                self.Request = None
+                return
+
+            heading = (Sign(deltaX), Sign(deltaY))
+            if heading != self.Heading:
+                self.Heading = heading
+                self.Generation += 1
+
+            self.Request = (self.Generation, mapIndex, self.BlocksAhead(x, y, heading))
+
+        if self.Thread is None:
+            self.Start()
+
+        self.Wake.set()
+
+    # Blocks with tiles within distance beyond the visible area around x, y in the heading, the nearest first
+    def BlocksAhead(self, x, y, heading):
+        reach = self.VisibleRange + self.Distance
+        size = self.BlockSize
+        blocks = set()
+
+        for axis in (0, 1):
+            direction = heading[axis]
+            if direction == 0:
+                continue
+
+            center = (x, y)[axis]
+            if direction > 0:
+                first, last = center + self.VisibleRange + 1, center + reach
+            else:
+                first, last = center - reach, center - self.VisibleRange - 1
+
+            # As wide as the visible area, and further on the side the other axis of the heading goes to, for the corner
+            across = (y, x)[axis]
+            acrossDirection = heading[1 - axis]
+            acrossFirst = across - (reach if acrossDirection < 0 else self.VisibleRange)
+            acrossLast = across + (reach if acrossDirection > 0 else self.VisibleRange)
+
+            for along in range(first // size, (last // size) + 1):
+                for side in range(acrossFirst // size, (acrossLast // size) + 1):
+                    blocks.add((along, side) if axis == 0 else (side, along))
+
+        centerX = x // size
+        centerY = y // size
+        return sorted(blocks, key=lambda block: max(abs(block[0] - centerX), abs(block[1] - centerY)))
+
+    def Run(self):
+        while not self.Stopped:
+            self.Wake.wait()
+
+            with self.Lock:
+                self.Wake.clear()
+                request = self.Request
+                self.Request = None
+
+            if request is None or self.Stopped:
+                continue
+
+            generation, mapIndex, blocks = request
+            self.Profiler.BeginFrame("prefetch")
+
+            loaded = 0
+            for blockX, blockY in blocks:
+                if self.Stopped or self.Generation != generation:
+                    self.Cancelled += 1
+                    break
+
+                if self.LandTiles.PrefetchBlock(mapIndex, blockX, blockY):
+                    loaded += 1
+
+                for cache in self.BlockCaches:
+                    cache.GetBlock(mapIndex, blockX, blockY)
+
+            self.Prefetched += loaded
+            self.Profiler.Count("blocks", loaded)
+            self.Profiler.EndFrame()
@@ -0,0 +1,292 @@
+# Frame profiler by Smjert/Spasitjel
+#
+# Optional instrumentation of the radar. It records how long each phase of a frame takes, how many times
+# the land provider (the Razor Enhanced Statics) is called, and how long the locks are waited for.
+#
+# A frame is a unit of work of some kind, like the worker computing a state ("update"), the UI thread painting ("paint")
+# or the script thread handling a hotkey ("key"). Frames of different kinds run on different threads at the same time,
+# so each thread has its own current frame. Phases are timed with:
+#   with profiler.Phase("counts"):
+# and a phase nested in another one is timed on its own too, so the outer one includes it.
+# Phases timed outside of a frame are recorded as frames of the "other" kind.
+#
+# The durations of the last `window` frames of each kind and phase are kept to compute the percentiles shown by the radar,
+# and every frame is also kept in a trace, which can be written as CSV or JSON to be looked at later.
+#
+# When profiling is disabled the radar uses a NullProfiler, whose methods do nothing, and Instrumented and CountCalls
+# return the lock and the provider as they are, so the instrumentation only costs the calls to the NullProfiler.
+
+import json
+import time
+import threading
+from collections import deque
+
+class PhaseTimer():
+    __slots__ = ("Profiler", "Name", "Start")
+
+    def __init__(self, profiler, name):
+        self.Profiler = profiler
+        self.Name = name
+
+    def __enter__(self):
+        self.Start = self.Profiler.Clock()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Profiler.AddTime(self.Name, self.Profiler.Clock() - self.Start)
+        return False
+
+class Frame():
+    __slots__ = ("Kind", "Start", "Phases", "Counters")
+
+    def __init__(self, kind, start):
+        self.Kind = kind
+        self.Start = start
+        # Name -> seconds
+        self.Phases = {}
+        # Name -> count
+        self.Counters = {}
+
+class FrameProfiler():
+    Enabled = True
+
+    def __init__(self, window=512, maxTraceFrames=100000, clock=time.perf_counter):
+        self.Window = window
+        self.Clock = clock
+        self.StartTime = clock()
+        self.Local = threading.local()
+        self.Lock = threading.Lock()
+
+        # (kind, name, isCounter) -> values of the last frames, in milliseconds for the phases
+        self.Samples = {}
+        self.Trace = deque(maxlen=maxTraceFrames)
+
+    def CurrentFrame(self):
+        return getattr(self.Local, "Frame", None)
+
+    def BeginFrame(self, kind):
+        self.Local.Frame = Frame(kind, self.Clock())
+
+    def EndFrame(self):
+        frame = self.CurrentFrame()
+        if frame is None:
+            return
+
+        self.Local.Frame = None
+        frame.Phases["total"] = self.Clock() - frame.Start
+        self.Commit(frame)
+
+    def Commit(self, frame):
+        with self.Lock:
+            for name, seconds in frame.Phases.items():
+                self.AddSample((frame.Kind, name, False), seconds * 1000)
+
+            for name, count in frame.Counters.items():
+                self.AddSample((frame.Kind, name, True), count)
+
+            self.Trace.append(frame)
+
+    def AddSample(self, key, value):
+        samples = self.Samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.Window)
+            self.Samples[key] = samples
+
+        samples.append(value)
+
+    def Phase(self, name):
+        return PhaseTimer(self, name)
+
+    def AddTime(self, name, seconds):
+        frame = self.CurrentFrame()
+        if frame is None:
+            frame = Frame("other", self.Clock() - seconds)
+            frame.Phases[name] = seconds
+            self.Commit(frame)
+            return
+
+        frame.Phases[name] = frame.Phases.get(name, 0) + seconds
+
+    def Count(self, name, count=1):
+        frame = self.CurrentFrame()
+        if frame is None:
+            frame = Frame("other", self.Clock())
+            frame.Counters[name] = count
+            self.Commit(frame)
+            return
+
+        frame.Counters[name] = frame.Counters.get(name, 0) + count
+
+    def AddWait(self, lockName, seconds):
+        self.AddTime(f"wait {lockName}", seconds)
+
+    # (kind, name, isCounter, p50, p95, max) of each phase and counter over the frames in the window;
+    # phases are in milliseconds, counters are per frame
+    def Percentiles(self):
+        with self.Lock:
+            items = [(key, sorted(samples)) for key, samples in self.Samples.items()]
+
+        stats = []
+        for (kind, name, isCounter), values in sorted(items):
+            stats.append((kind, name, isCounter, Percentile(values, 50), Percentile(values, 95), values[-1]))
+
+        return stats
+
+    def SummaryLines(self):
+        lines = []
+        for kind, name, isCounter, p50, p95, maximum in self.Percentiles():
+            if isCounter:
+                lines.append(f"{kind} {name}: p50 {p50:.0f} p95 {p95:.0f} max {maximum:.0f} per frame")
+            else:
+                lines.append(f"{kind} {name}: p50 {p50:.1f} p95 {p95:.1f} max {maximum:.1f} ms")
+
+        return lines
+
+    # Writes every frame of the trace, as JSON if the path ends with .json, as CSV otherwise
+    def WriteTrace(self, path):
+        with self.Lock:
+            frames = list(self.Trace)
+
+        if path.endswith(".json"):
+            records = []
+            for frame in frames:
+                records.append({
+                    "kind": frame.Kind,
+                    "start": round((frame.Start - self.StartTime) * 1000, 3),
+                    "phases": dict((name, round(seconds * 1000, 3)) for name, seconds in frame.Phases.items()),
+                    "counters": frame.Counters,
+                })
+
+            with open(path, "w") as f:
+                json.dump(records, f, indent=1)
+
+            return len(records)
+
+        phaseNames = sorted(set(name for frame in frames for name in frame.Phases))
+        counterNames = sorted(set(name for frame in frames for name in frame.Counters))
+
+        with open(path, "w") as f:
+            f.write(",".join(["kind", "start"] + [f"{name} ms" for name in phaseNames] + counterNames) + "\n")
+            for frame in frames:
+                fields = [frame.Kind, f"{(frame.Start - self.StartTime) * 1000:.3f}"]
+                fields += [f"{frame.Phases[name] * 1000:.3f}" if name in frame.Phases else "" for name in phaseNames]
+                fields += [f"{frame.Counters.get(name, 0)}" for name in counterNames]
+                f.write(",".join(fields) + "\n")
+
+        return len(frames)
+
+# Nearest rank percentile of sorted values
+def Percentile(values, percent):
+    if len(values) == 0:
+        return 0
+
+    rank = int(((percent * len(values)) + 99) / 100)
+    return values[max(rank, 1) - 1]
+
+class NullPhaseTimer():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+nullPhaseTimer = NullPhaseTimer()
+
+class NullProfiler():
+    Enabled = False
+
+    def BeginFrame(self, kind):
+        pass
+
+    def EndFrame(self):
+        pass
+
+    def Phase(self, name):
+        return nullPhaseTimer
+
+    def AddTime(self, name, seconds):
+        pass
+
+    def Count(self, name, count=1):
+        pass
+
+    def AddWait(self, lockName, seconds):
+        pass
+
+    def SummaryLines(self):
+        return []
+
+    def WriteTrace(self, path):
+        return 0
+
+# A lock that reports how long it has been waited for; it can wrap a Lock or an RLock
+class TimedLock():
+    def __init__(self, lock, profiler, name):
+        self.Inner = lock
+        self.Profiler = profiler
+        self.Name = name
+
+    def acquire(self, blocking=True, timeout=-1):
+        # Not waiting at all is the common case, and isn't worth a sample
+        if self.Inner.acquire(False):
+            return True
+
+        if not blocking:
+            return False
+
+        start = self.Profiler.Clock()
+        acquired = self.Inner.acquire(True, timeout)
+        self.Profiler.AddWait(self.Name, self.Profiler.Clock() - start)
+        return acquired
+
+    def release(self):
+        self.Inner.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.release()
+        return False
+
+# Counts the calls to the methods of a provider, like the Razor Enhanced Statics, as "<name>.<method>"
+class CountingProvider():
+    def __init__(self, provider, profiler, name):
+        self.Provider = provider
+        self.Profiler = profiler
+        self.Name = name
+        self.Methods = {}
+
+    def __getattr__(self, attribute):
+        method = self.Methods.get(attribute)
+        if method is not None:
+            return method
+
+        inner = getattr(self.Provider, attribute)
+        if not callable(inner):
+            return inner
+
+        counterName = f"{self.Name}.{attribute}"
+        profiler = self.Profiler
+
+        def CountedMethod(*args):
+            profiler.Count(counterName)
+            return inner(*args)
+
+        self.Methods[attribute] = CountedMethod
+        return CountedMethod
+
+def Instrumented(lock, profiler, name):
+    if not profiler.Enabled:
+        return lock
+
+    return TimedLock(lock, profiler, name)
+
+def CountCalls(provider, profiler, name):
+    if not profiler.Enabled:
+        return provider
+
+    return CountingProvider(provider, profiler, name)
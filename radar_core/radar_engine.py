@@ -0,0 +1,562 @@
+# Radar engine by Smjert/Spasitjel
+#
+# Everything the resource radar computes, without drawing it: the tiles around the player, the banks reachable from them,
+# the consumed banks and the marked spots. The radar script only draws the published state and forwards the moves and hotkeys,
+# so the engine can also run outside of the client, for instance with CPython in radar_core/benchmark.py.
+#
+# Like the tile cache, the engine doesn't talk to Razor Enhanced directly, but through a land provider
+# (see tile_cache.py), which is the Razor Enhanced Statics in the client, or a fake one like those in radar_core/fakes.py.
+#
+# The banks reachable from a tile are counted either with the reach window, where every resource tile within 2 tiles counts,
+# which is cheap and can use the heatmaps, or, with reachabilityMode "z", only with the tiles in line of sight, from the heights
+# of the tiles (see height_map.py), which is closer to what servers check.
+#
+# What is counted is given by a resource profile (see tile_classifier.py and resource_profiles.py): its resource tiles, land IDs
+# or statics, the size of its banks and its reach. The profile can be switched at any time with SetResourceProfile:
+# the land, the statics and the heights are cached in blocks of cacheBlockSize tiles, whatever the banks are, so the tiles already
+# known are only classified again. Each skill has its own consumed banks and marked spots.
+#
+# The consumed banks respawn bankRespawnTime seconds after the spot they have been consumed from was saved, if it's given,
+# otherwise they stay consumed; the spots saved before their time was kept are considered consumed long ago.
+# The respawned banks are dropped from the ledger (see bank_ledger.py) before each state is computed, so only the banks
+# still depleted are shown and left out of the counts; HasExpiredBanks tells when to compute it again for them.
+#
+# The published state, in State, is never modified: a new one is computed from it with ComputeMapState,
+# then swapped in with PublishMapState, so that it can be read without locks.
+
+import copy
+import os
+import time
+from threading import Lock, RLock
+
+from radar_core.tile_cache import TileCache, cacheBlockSize
+from radar_core.prefetcher import TilePrefetcher
+from radar_core.statics_cache import StaticsCache
+from radar_core.tile_classifier import TileClassifier, tileClassResource, sourceLand, sourceStatics
+from radar_core.resource_profiles import resourceProfiles
+from radar_core.reachability import BankIndexer, ComputeReachability, ComputeReachabilityZ, FirstReachableTiles
+from radar_core.height_map import HeightCache, StaticsHeights, ZReach
+from radar_core.bank_ledger import BankLedger, neverExpires
+from radar_core.spots_store import SpotsStore, MarkedSpot, CreateLogFromTextSpots
+from radar_core.heatmap import HeatmapFile, HeatmapFilePath
+from radar_core.tile_grid import TileGrid
+from radar_core.profiler import NullProfiler, Instrumented, CountCalls
+
+reachabilityModes = ("window", "z")
+
+# The state the radar is drawn from
+class MapState():
+    def __init__(self, size):
+        self.GridRows = [0] * (size + 1)
+        self.GridCols = [0] * (size + 1)
+        # Info of the visible tiles, see radar_core/tile_grid.py
+        self.Tiles = TileGrid(size)
+        self.Size = size
+
+        # Map and position the tiles have been gathered around, and the consumed banks the reachable banks have been counted with
+        self.Map = -1
+        self.CenterX = 0
+        self.CenterY = 0
+        # The resource profile the tiles have been classified with, and the size of its banks
+        self.Profile = None
+        self.BankWidth = 0
+        self.BankHeight = 0
+        self.CountedConsumedBanks = set()
+        self.CountedConsumedMask = 0
+
+        # Consumed banks and marked spots in the visible area, refreshed from the ledger each time the state is published
+        self.VisibleConsumedBanks = set()
+        self.VisibleMarkedSpots = set()
+
+        # Per bank summary drawn when the radar is zoomed out; built on demand by the radar, since it only depends on the tiles
+        self.Overview = None
+
+# The bands, as (rowStart, rowEnd, colStart, colEnd), of the square area from start to end (excluded) of the grid,
+# that contain tiles which weren't in it before moving
+def EdgeBands(start, end, deltaX, deltaY):
+    bands = []
+
+    if deltaX > 0:
+        bands.append((start, end, max(end - deltaX, start), end))
+    elif deltaX < 0:
+        bands.append((start, end, start, min(start - deltaX, end)))
+
+    if deltaY > 0:
+        bands.append((max(end - deltaY, start), end, start, end))
+    elif deltaY < 0:
+        bands.append((start, min(start - deltaY, end), start, end))
+
+    return bands
+
+# The consumed banks and the marked spots of a skill
+class SkillSpots():
+    def __init__(self, ledger):
+        self.Ledger = ledger
+        self.SpotsStore = None
+
+class RadarEngine():
+    # visibleRange is the distance from the player to the furthest tile of the grid, as in the radar settings;
+    # bankSize, if given, makes the banks of all the profiles bankSize x bankSize tiles instead of the size of the profile;
+    # profiler, if given, is a FrameProfiler (see profiler.py) timing the phases of the updates;
+    # prefetchDistance is how many tiles beyond the visible area are loaded ahead of the player by ObservePosition, 0 disables it;
+    # reachabilityMode is "window" or "z", see above;
+    # bankRespawnTime is how many seconds the consumed banks take to respawn, None if they never do, by the unix time of clock.
+    def __init__(self, landProvider, visibleRange=16, bankSize=None, numberOfMaps=6, resourceProfile="Mining",
+                 landCacheDirectory=None, landCacheBlocks=4096, heatmapDirectory=None, scrollingUpdate=True, profiler=None,
+                 prefetchDistance=0, reachabilityMode="window", bankRespawnTime=None, clock=time.time):
+        if reachabilityMode not in reachabilityModes:
+            raise ValueError(f"Unknown reachability mode {reachabilityMode}")
+
+        self.Profiler = profiler if profiler is not None else NullProfiler()
+
+        self.VisibleTiles = (visibleRange * 2) + 1
+        self.CenterTile = int(self.VisibleTiles / 2)
+
+        self.BankSize = bankSize
+        self.NumberOfMaps = numberOfMaps
+        self.HeatmapDirectory = heatmapDirectory
+        self.ScrollingUpdate = scrollingUpdate
+        self.ReachabilityMode = reachabilityMode
+        self.BankRespawnTime = bankRespawnTime
+        self.Clock = clock
+
+        # The land provider calls are counted while profiling
+        self.LandProvider = CountCalls(landProvider, self.Profiler, "Statics")
+        self.Classifier = TileClassifier(resourceProfiles, self.LandProvider)
+        self.LandTiles = TileCache(self.LandProvider, cacheBlockSize, landCacheDirectory, landCacheBlocks, self.Classifier)
+        # The statics and the heights of the tiles, only queried when they're used
+        self.Statics = StaticsCache(self.LandProvider, cacheBlockSize, landCacheBlocks)
+        self.Heights = None
+        if reachabilityMode == "z":
+            self.Heights = HeightCache(StaticsHeights(self.LandProvider, self.Statics), cacheBlockSize, landCacheBlocks)
+
+        # Line of sight checks of each reach, kept while switching profiles
+        self.ZReaches = {}
+
+        self.Prefetcher = None
+        if prefetchDistance > 0:
+            self.Prefetcher = TilePrefetcher(self.LandTiles, visibleRange, prefetchDistance, self.Profiler)
+
+        self.State = MapState(self.VisibleTiles)
+        self.PublishLock = Instrumented(RLock(), self.Profiler, "publishLock")
+
+        # Marked spots and consumed banks of each skill, shared by the worker and the hotkeys handling
+        self.Skills = {}
+        self.LedgerLock = Instrumented(Lock(), self.Profiler, "ledgerLock")
+
+        # Heatmap of each map and profile, opened the first time it's needed
+        self.Heatmaps = {}
+
+        self.SetResourceProfile(resourceProfile)
+
+    # Switches the profile the next states are computed with; it has to be called by the thread computing them.
+    # The spots file of a skill that hasn't been used yet has to be opened with LoadMiningSpots after switching to it.
+    def SetResourceProfile(self, name):
+        profile = self.Classifier.Profiles.get(name)
+        if profile is None:
+            raise ValueError(f"Unknown resource profile {name}")
+
+        with self.LedgerLock:
+            self.Classifier.SetProfile(name)
+            self.Profile = profile
+            self.ResourceProfile = name
+            self.BankWidth = self.BankSize if self.BankSize is not None else profile.BankWidth
+            self.BankHeight = self.BankSize if self.BankSize is not None else profile.BankHeight
+            self.Reach = profile.Reach
+
+            # Grid rows and columns (end excluded) for which the reachable banks are counted
+            scanRange = self.CenterTile - self.Reach
+            self.ScanStart = self.CenterTile - scanRange
+            self.ScanEnd = self.CenterTile + scanRange
+
+            self.BankIndexer = BankIndexer(self.VisibleTiles, self.VisibleTiles, self.BankWidth, self.BankHeight)
+
+            self.ZReach = None
+            if self.ReachabilityMode == "z":
+                if self.Reach not in self.ZReaches:
+                    self.ZReaches[self.Reach] = ZReach(self.Reach)
+                self.ZReach = self.ZReaches[self.Reach]
+
+            # The profiles of a skill have the same banks
+            if profile.Skill not in self.Skills:
+                self.Skills[profile.Skill] = SkillSpots(BankLedger(self.NumberOfMaps, self.BankWidth, self.BankHeight))
+            self.Spots = self.Skills[profile.Skill]
+
+        if self.Prefetcher is not None:
+            self.Prefetcher.BlockCaches = self.BlockCaches()
+
+    # The caches, besides the land one, that the tiles of the profile are read from
+    def BlockCaches(self):
+        caches = []
+        if self.Profile.Source == sourceStatics:
+            caches.append(self.Statics)
+        if self.Heights is not None:
+            caches.append(self.Heights)
+
+        return caches
+
+    # The consumed banks and the marked spots of the skill of the current profile
+    @property
+    def Ledger(self):
+        return self.Spots.Ledger
+
+    @property
+    def SpotsStore(self):
+        return self.Spots.SpotsStore
+
+    @SpotsStore.setter
+    def SpotsStore(self, store):
+        self.Spots.SpotsStore = store
+
+    def Close(self):
+        if self.Prefetcher is not None:
+            self.Prefetcher.Stop()
+
+        self.LandTiles.Close()
+
+    # Lets the prefetcher follow the player; called with each polled position, not only the ones the radar is updated for
+    def ObservePosition(self, x, y, mapIndex):
+        if self.Prefetcher is not None:
+            self.Prefetcher.Observe(x, y, mapIndex)
+
+    def GridToWorldCoords(self, col, row, centerX, centerY):
+        return (centerX + (col - self.CenterTile), centerY + (row - self.CenterTile))
+
+    # Opens the marked spots file, importing the text file of older versions the first time
+    def LoadMiningSpots(self, spotsFilePath, legacySpotsFilePath=None):
+        importLegacy = legacySpotsFilePath is not None and not os.path.exists(spotsFilePath) and os.path.exists(legacySpotsFilePath)
+        # The log only exists once all the legacy spots are in it, so a legacy file that can't be read is imported again next time
+        if importLegacy:
+            CreateLogFromTextSpots(spotsFilePath, legacySpotsFilePath)
+
+        self.SpotsStore = SpotsStore(spotsFilePath)
+        if importLegacy:
+            self.SpotsStore.WriteIndex()
+
+    # Loads the marked spots of the regions around the visible area that haven't been loaded yet.
+    # The spots just outside of it are needed too, since their banks can reach inside.
+    def LoadVisibleMiningSpots(self, mapIndex, centerX, centerY):
+        if self.SpotsStore is None:
+            return
+
+        margin = max(self.BankWidth, self.BankHeight) + self.Reach
+        minX, minY = self.GridToWorldCoords(0, 0, centerX, centerY)
+        maxX, maxY = self.GridToWorldCoords(self.VisibleTiles - 1, self.VisibleTiles - 1, centerX, centerY)
+
+        with self.Profiler.Phase("spots file"):
+            spots = self.SpotsStore.LoadArea(mapIndex, minX - margin, minY - margin, maxX + margin, maxY + margin)
+            # Saved by the radars of other clients sharing the file
+            spots += self.SpotsStore.ReadNewSpots()
+
+        now = self.Clock()
+        for spot in spots:
+            self.AddSpotToLedger(self.Ledger, spot.Map, spot.X, spot.Y, spot.Tiles, spot.Time, now)
+
+    # Whether the radars of other clients saved spots that haven't been read yet
+    def HasNewSpots(self):
+        return self.SpotsStore is not None and self.SpotsStore.HasNewRecords()
+
+    # Whether some consumed banks of the current profile respawned, so that the counts have to be computed again
+    def HasExpiredBanks(self):
+        with self.LedgerLock:
+            return self.Ledger.NextExpiry() <= self.Clock()
+
+    # Time the banks consumed at savedTime respawn at
+    def BankExpiry(self, savedTime):
+        if self.BankRespawnTime is None:
+            return neverExpires
+
+        # The spots saved before their time was kept have been saved long ago
+        return (savedTime if savedTime is not None else 0) + self.BankRespawnTime
+
+    def AddSpotToLedger(self, ledger, mapIndex, x, y, mineableTiles, savedTime, now):
+        mapLedger = ledger.ForMap(mapIndex)
+        mapLedger.AddMarkedSpot(x, y)
+
+        # The banks that already respawned are left out, so that old spots don't fill the expiry index
+        expiry = self.BankExpiry(savedTime)
+        if expiry <= now:
+            return
+
+        for miningCoords in mineableTiles:
+            mapLedger.AddConsumedBank(int(miningCoords[0] / mapLedger.BankWidth), int(miningCoords[1] / mapLedger.BankHeight), expiry)
+
+    # Saves the spot at the center of a state, with the first reachable tile of each bank not consumed yet,
+    # in the spots of the skill the state has been computed for
+    def SaveMiningSpot(self, mapState):
+        mineableTiles = self.GetMineableTiles(mapState, self.CenterTile, self.CenterTile)
+        spots = self.Skills[mapState.Profile.Skill]
+        now = self.Clock()
+
+        with self.LedgerLock, self.Profiler.Phase("spots file"):
+            spots.SpotsStore.Append(MarkedSpot(mapState.Map, mapState.CenterX, mapState.CenterY, mineableTiles, int(now)))
+            self.AddSpotToLedger(spots.Ledger, mapState.Map, mapState.CenterX, mapState.CenterY, mineableTiles, int(now), now)
+
+    # The ledger is the one of the current profile if not given
+    def FilterVisibleConsumedBanks(self, mapIndex, centerX, centerY, ledger=None):
+        mapLedger = (ledger if ledger is not None else self.Ledger).ForMap(mapIndex)
+        minX, minY = self.GridToWorldCoords(0, 0, centerX, centerY)
+        maxX, maxY = self.GridToWorldCoords(self.VisibleTiles - 1, self.VisibleTiles - 1, centerX, centerY)
+
+        minBankX = int(minX / mapLedger.BankWidth)
+        maxBankX = int(maxX / mapLedger.BankWidth)
+
+        minBankY = int(minY / mapLedger.BankHeight)
+        maxBankY = int(maxY / mapLedger.BankHeight)
+
+        # Filter only the banks that are visible
+        return set(mapLedger.ConsumedBanksIn(minBankX, minBankY, maxBankX, maxBankY))
+
+    def FilterVisibleMarkedSpots(self, mapIndex, centerX, centerY, ledger=None):
+        mapLedger = (ledger if ledger is not None else self.Ledger).ForMap(mapIndex)
+        minX, minY = self.GridToWorldCoords(0, 0, centerX, centerY)
+        maxX, maxY = self.GridToWorldCoords(self.VisibleTiles - 1, self.VisibleTiles - 1, centerX, centerY)
+
+        return set(mapLedger.MarkedSpotsIn(minX, minY, maxX, maxY))
+
+    def RefreshOverlays(self, mapState):
+        if mapState.Map < 0:
+            return
+
+        # The profile could have been switched since the state was computed
+        ledger = self.Skills[mapState.Profile.Skill].Ledger
+        with self.LedgerLock:
+            ledger.Expire(self.Clock())
+            mapState.VisibleConsumedBanks = self.FilterVisibleConsumedBanks(mapState.Map, mapState.CenterX, mapState.CenterY, ledger)
+            mapState.VisibleMarkedSpots = self.FilterVisibleMarkedSpots(mapState.Map, mapState.CenterX, mapState.CenterY, ledger)
+
+    # Grid (col, row) of the tiles that are drawn differently in newState than in oldState,
+    # or None if the whole radar has to be redrawn
+    def DirtyTiles(self, oldState, newState):
+        if (oldState.Map, oldState.CenterX, oldState.CenterY) != (newState.Map, newState.CenterX, newState.CenterY) or oldState.Profile is not newState.Profile:
+            return None
+
+        oldTiles = oldState.Tiles
+        newTiles = newState.Tiles
+        size = newTiles.Size
+        dirtyTiles = set()
+
+        if oldTiles is not newTiles:
+            if oldTiles.Classes != newTiles.Classes:
+                return None
+
+            if oldTiles.Amounts != newTiles.Amounts:
+                for i in range(size * size):
+                    if oldTiles.Amounts[i] != newTiles.Amounts[i]:
+                        dirtyTiles.add((i % size, i // size))
+
+        changedBanks = oldState.VisibleConsumedBanks ^ newState.VisibleConsumedBanks
+        if len(changedBanks) > 0:
+            for i in range(size * size):
+                if newTiles.Classes[i] == tileClassResource and (newTiles.BankX[i], newTiles.BankY[i]) in changedBanks:
+                    dirtyTiles.add((i % size, i // size))
+
+        originX, originY = self.GridToWorldCoords(0, 0, newState.CenterX, newState.CenterY)
+        for spotX, spotY in oldState.VisibleMarkedSpots ^ newState.VisibleMarkedSpots:
+            dirtyTiles.add((spotX - originX, spotY - originY))
+
+        return dirtyTiles
+
+    # Publishes a new state and returns its dirty tiles. Since they're computed between each published state and the next one,
+    # all the tiles that changed since any state are invalidated, whichever state the UI ends up drawing.
+    def PublishMapState(self, newState):
+        # The overlays are refreshed here, so that spots saved while the state was computed are shown too
+        with self.Profiler.Phase("publish"), self.PublishLock:
+            self.RefreshOverlays(newState)
+            dirtyTiles = self.DirtyTiles(self.State, newState)
+            self.State = newState
+
+        return dirtyTiles
+
+    # Publishes the current state again, with its overlays refreshed, after the ledger changed
+    def RepublishMapState(self):
+        with self.PublishLock:
+            return self.PublishMapState(copy.copy(self.State))
+
+    # Computes and publishes the state of a position, returning its dirty tiles
+    def Update(self, centerX, centerY, mapIndex):
+        return self.PublishMapState(self.ComputeMapState(self.State, centerX, centerY, mapIndex))
+
+    def UpdateBankBoundaries(self, mapState, centerX, centerY):
+        mapState.GridCols = [0] * (mapState.Size + 1)
+        mapState.GridRows = [0] * (mapState.Size + 1)
+
+        gridRowsCount = len(mapState.GridRows)
+        gridColsCount = len(mapState.GridCols)
+
+        # Offset, from the grid left and top lines, of the first bank boundary
+        originX, originY = self.GridToWorldCoords(0, 0, centerX, centerY)
+        firstCol = (self.BankWidth - (originX % self.BankWidth)) % self.BankWidth
+        firstRow = (self.BankHeight - (originY % self.BankHeight)) % self.BankHeight
+
+        # Color the grid lines that represent the banks boundaries
+        for col in range(firstCol, gridColsCount, self.BankWidth):
+            mapState.GridCols[col] = 1
+
+        for row in range(firstRow, gridRowsCount, self.BankHeight):
+            mapState.GridRows[row] = 1
+
+    def QueryTile(self, mapState, row, col, centerX, centerY, mapIndex):
+        adjX, adjY = self.GridToWorldCoords(col, row, centerX, centerY)
+        tileID, blocked = self.LandTiles.GetLandTile(adjX, adjY, mapIndex)
+
+        if self.Profile.Source == sourceStatics:
+            # The tile can't be walked on if any of its statics is impassable, like a tree
+            statics = self.Statics.GetStatics(adjX, adjY, mapIndex)
+            color = self.Classifier.ClassifyStatics(statics)
+            for staticID, _ in statics:
+                blocked = blocked or self.Classifier.IsStaticImpassable(staticID)
+        else:
+            color = self.Classifier.Classes[tileID]
+
+        bankX = int(adjX / self.BankWidth)
+        bankY = int(adjY / self.BankHeight)
+
+        landZ = topZ = 0
+        if self.Heights is not None:
+            landZ, topZ = self.Heights.GetTileHeights(adjX, adjY, mapIndex)
+
+        mapState.Tiles.SetTile(row, col, color, bankX, bankY, self.BankIndexer.Index(bankX, bankY), blocked, landZ, topZ)
+
+    # Flat grids of the tiles classes, blocked state and bank bits, as the reachability engine expects them
+    def BuildReachabilityGrids(self, mapState):
+        return (mapState.Tiles.Classes, mapState.Tiles.Blocked, mapState.Tiles.BankBits)
+
+    # The line of sight checks on the tiles of a state, None with the reach window
+    def GridSight(self, mapState):
+        if self.ReachabilityMode != "z":
+            return None
+
+        originX, originY = self.GridToWorldCoords(0, 0, mapState.CenterX, mapState.CenterY)
+        return self.ZReaches[mapState.Profile.Reach].ForGrid(mapState.Map, originX, originY, mapState.Tiles)
+
+    def GetHeatmap(self, mapIndex):
+        # The heatmaps are counted with the reach window, from the land, with square banks
+        if self.ReachabilityMode != "window" or self.Profile.Source != sourceLand or self.BankWidth != self.BankHeight:
+            return None
+
+        key = (mapIndex, self.ResourceProfile, self.BankWidth)
+        if key in self.Heatmaps:
+            return self.Heatmaps[key]
+
+        heatmap = None
+        if self.HeatmapDirectory:
+            path = HeatmapFilePath(self.HeatmapDirectory, mapIndex, self.ResourceProfile, self.BankWidth)
+            if os.path.exists(path):
+                heatmap = HeatmapFile(path)
+                # A heatmap computed with a different reach wouldn't give the same counts
+                if heatmap.Reach != self.Reach:
+                    heatmap = None
+
+        self.Heatmaps[key] = heatmap
+        return heatmap
+
+    # The scanned areas that contain tiles which weren't scanned before moving
+    def ScanBands(self, deltaX, deltaY):
+        return EdgeBands(self.ScanStart, self.ScanEnd, deltaX, deltaY)
+
+    # World coordinates of the first mineable tile of each bank reachable from a tile
+    def GetMineableTiles(self, mapState, row, col):
+        if mapState.Profile is None:
+            return []
+
+        # With the reach of the profile the state has been computed with, which could have been switched since
+        reach = mapState.Profile.Reach
+        if row < reach or row >= self.VisibleTiles - 1 - reach or col < reach or col >= self.VisibleTiles - 1 - reach:
+            return []
+
+        classes, blocked, bankIndices = self.BuildReachabilityGrids(mapState)
+        sight = self.GridSight(mapState)
+        gridTiles = FirstReachableTiles(mapState.Size, mapState.Size, classes, blocked, bankIndices,
+                                        mapState.CountedConsumedMask, row, col, reach, sight.CanReach if sight is not None else None)
+
+        return [self.GridToWorldCoords(tileCol, tileRow, mapState.CenterX, mapState.CenterY) for tileCol, tileRow in gridTiles]
+
+    # Computes the state of a position, starting from the published one, which is left untouched
+    def ComputeMapState(self, frontState, centerX, centerY, mapIndex):
+        profiler = self.Profiler
+        visibleTiles = self.VisibleTiles
+        scanStart = self.ScanStart
+        scanEnd = self.ScanEnd
+
+        with profiler.Phase("spots"), self.LedgerLock:
+            self.LoadVisibleMiningSpots(mapIndex, centerX, centerY)
+            self.Ledger.Expire(self.Clock())
+            visibleConsumedBanks = self.FilterVisibleConsumedBanks(mapIndex, centerX, centerY)
+
+        deltaX = centerX - frontState.CenterX
+        deltaY = centerY - frontState.CenterY
+
+        fullRefresh = (not self.ScrollingUpdate or mapIndex != frontState.Map or frontState.Profile is not self.Profile
+                       or abs(deltaX) >= visibleTiles or abs(deltaY) >= visibleTiles)
+
+        # The counts of the tiles we keep are only valid if the consumed banks they have been computed with are the same
+        consumedBanksChanged = visibleConsumedBanks != frontState.CountedConsumedBanks
+
+        mapState = copy.copy(frontState)
+        mapState.Overview = None
+        self.UpdateBankBoundaries(mapState, centerX, centerY)
+
+        with profiler.Phase("tiles"):
+            if fullRefresh:
+                # Gather the land tiles IDs and check if it's impassable
+                mapState.Tiles = TileGrid(mapState.Size)
+                for row in range(0, visibleTiles):
+                    for col in range(0, visibleTiles):
+                        self.QueryTile(mapState, row, col, centerX, centerY, mapIndex)
+            else:
+                # Only the rows and columns that entered the visible area need to be queried;
+                # the tiles are shifted in a new grid, since the one of the published state must not change.
+                mapState.Tiles, exposedTiles = mapState.Tiles.Scrolled(deltaX, deltaY)
+                for row, col in exposedTiles:
+                    self.QueryTile(mapState, row, col, centerX, centerY, mapIndex)
+
+                # Tiles that scrolled out of the scanned area must not keep showing their count
+                mapState.Tiles.ClearAmountsOutside(scanStart, scanEnd, scanStart, scanEnd)
+
+        mapState.Map = mapIndex
+        mapState.CenterX = centerX
+        mapState.CenterY = centerY
+        mapState.Profile = self.Profile
+        mapState.BankWidth = self.BankWidth
+        mapState.BankHeight = self.BankHeight
+
+        # For each walkable tiles, check how many mineable tiles,
+        # each on a different bank, are reachable.
+        # A tile that was already scanned before moving has its whole neighborhood in reach still in the grid,
+        # so its count is still valid and only the newly scanned bands have to be counted.
+        if fullRefresh or consumedBanksChanged:
+            scanRects = [(scanStart, scanEnd, scanStart, scanEnd)]
+        else:
+            scanRects = self.ScanBands(deltaX, deltaY)
+
+        mapState.CountedConsumedBanks = visibleConsumedBanks
+        mapState.CountedConsumedMask = self.BankIndexer.MaskOf(visibleConsumedBanks)
+        classes, blocked, bankIndices = self.BuildReachabilityGrids(mapState)
+
+        heatmap = self.GetHeatmap(mapIndex)
+        sight = self.GridSight(mapState)
+
+        for scanRect in scanRects:
+            rectWidth = scanRect[3] - scanRect[2]
+            rectHeight = scanRect[1] - scanRect[0]
+
+            counts = None
+            if heatmap is not None:
+                rectX, rectY = self.GridToWorldCoords(scanRect[2], scanRect[0], centerX, centerY)
+                with profiler.Phase("heatmap"):
+                    counts = heatmap.GetCounts(rectX, rectY, rectWidth, rectHeight, visibleConsumedBanks)
+
+            if counts is None:
+                with profiler.Phase("reachability"):
+                    if sight is not None:
+                        reachability = ComputeReachabilityZ(mapState.Size, mapState.Size, classes, blocked, bankIndices,
+                                                            mapState.CountedConsumedMask, scanRect, sight.CanReach, self.Reach)
+                    else:
+                        reachability = ComputeReachability(mapState.Size, mapState.Size, classes, blocked, bankIndices,
+                                                           mapState.CountedConsumedMask, scanRect, self.Reach)
+                    counts = [reachability.GetCount(row, col) for row in range(scanRect[0], scanRect[1]) for col in range(scanRect[2], scanRect[3])]
+
+            mapState.Tiles.SetAmounts(scanRect[0], scanRect[1], scanRect[2], scanRect[3], counts)
+
+        return mapState
@@ -0,0 +1,231 @@
+# Resource banks reachability by Smjert/Spasitjel
+#
+# Computes, for every walkable tile of a grid, how many distinct resource banks have at least one resource tile
+# in reach (Chebyshev distance of reach tiles, 2 by default) and are not consumed.
+#
+# Each bank in the grid is assigned a bit, so that the banks reachable from a tile are a bitmask:
+# the mask of a resource tile is its bank bit, then the masks are OR-ed over a sliding window horizontally and
+# then vertically, which gives the reachable banks of every tile with (reach * 4) ORs per tile,
+# independently of how many banks or resource tiles there are. The count is then the number of bits set.
+#
+# The grids are flat sequences in row major order:
+#   classes: the tile class (see tile_classifier)
+#   blocked: a true value if the tile is impassable
+#   bankIndices: the bit of the bank the tile is in, as given by a BankIndexer
+#
+# When NumPy is available, it can be used to compute the masks, which is faster on big grids.
+#
+# The window counts every resource tile in reach; ComputeReachabilityZ instead only counts the ones a canReach(row, col,
+# deltaRow, deltaCol) check allows from each tile, like the line of sight of radar_core/height_map.py. It checks tile pairs
+# one by one, so it's slower, but a bank already reached from a tile isn't checked again for it.
+
+from radar_core.tile_classifier import tileClassResource
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Maps bank coordinates to bits. The bit only depends on the bank coordinates modulo the number of banks that fit
+# in the grid, so it's unique within the grid and stays the same when the grid scrolls, as long as its size doesn't change.
+class BankIndexer():
+    def __init__(self, gridWidth, gridHeight, bankWidth, bankHeight):
+        self.BankWidth = bankWidth
+        self.BankHeight = bankHeight
+        # A grid not aligned to the banks can touch one more bank than it can contain
+        self.BanksWide = int((gridWidth + bankWidth - 1) / bankWidth) + 1
+        self.BanksHigh = int((gridHeight + bankHeight - 1) / bankHeight) + 1
+        self.Count = self.BanksWide * self.BanksHigh
+
+    def Index(self, bankX, bankY):
+        return ((bankY % self.BanksHigh) * self.BanksWide) + (bankX % self.BanksWide)
+
+    def MaskOf(self, banks):
+        mask = 0
+        for bankX, bankY in banks:
+            mask |= 1 << self.Index(bankX, bankY)
+
+        return mask
+
+popCounts = {}
+
+def PopCount(mask):
+    count = popCounts.get(mask)
+    if count is None:
+        count = bin(mask).count("1")
+        if len(popCounts) < 65536:
+            popCounts[mask] = count
+
+    return count
+
+class ReachabilityResult():
+    def __init__(self, width, height, scanRect):
+        self.Width = width
+        self.Height = height
+        # (rowStart, rowEnd, colStart, colEnd), ends excluded
+        self.ScanRect = scanRect
+        self.Counts = [0] * (width * height)
+        self.Masks = None
+        self.MaskWords = None
+
+    def GetMask(self, row, col):
+        if self.Masks is not None:
+            return self.Masks[(row * self.Width) + col]
+
+        mask = 0
+        words = self.MaskWords[row, col]
+        for word in range(len(words)):
+            mask |= int(words[word]) << (64 * word)
+
+        return mask
+
+    def GetCount(self, row, col):
+        return self.Counts[(row * self.Width) + col]
+
+def SlidingOr(values, reach):
+    count = len(values)
+    padded = ([0] * reach) + values + ([0] * reach)
+    result = padded[0:count]
+    for offset in range(1, (reach * 2) + 1):
+        result = [a | b for a, b in zip(result, padded[offset:offset + count])]
+
+    return result
+
+def ComputeReachability(width, height, classes, blocked, bankIndices, consumedMask, scanRect, reach=2, useNumPy=True):
+    if useNumPy and numpy is not None:
+        return ComputeReachabilityNumPy(width, height, classes, blocked, bankIndices, consumedMask, scanRect, reach)
+
+    rowStart, rowEnd, colStart, colEnd = scanRect
+    result = ReachabilityResult(width, height, scanRect)
+    result.Masks = [0] * (width * height)
+
+    if rowStart >= rowEnd or colStart >= colEnd:
+        return result
+
+    # Horizontal pass, on all the rows that are in reach of the scanned ones
+    firstRow = max(rowStart - reach, 0)
+    lastRow = min(rowEnd + reach, height)
+    firstCol = max(colStart - reach, 0)
+    lastCol = min(colEnd + reach, width)
+
+    horizontal = []
+    for row in range(firstRow, lastRow):
+        rowMasks = []
+        for i in range((row * width) + firstCol, (row * width) + lastCol):
+            if classes[i] == tileClassResource:
+                rowMasks.append((1 << bankIndices[i]) & ~consumedMask)
+            else:
+                rowMasks.append(0)
+
+        horizontal.append(SlidingOr(rowMasks, reach)[colStart - firstCol:colEnd - firstCol])
+
+    # Vertical pass, only on the scanned rows
+    for row in range(rowStart, rowEnd):
+        first = max(row - reach, firstRow) - firstRow
+        last = min(row + reach + 1, lastRow) - firstRow
+        rowMasks = horizontal[first]
+        for other in range(first + 1, last):
+            rowMasks = [a | b for a, b in zip(rowMasks, horizontal[other])]
+
+        i = (row * width) + colStart
+        for mask in rowMasks:
+            if mask != 0 and not blocked[i]:
+                result.Masks[i] = mask
+                result.Counts[i] = PopCount(mask)
+            i += 1
+
+    return result
+
+def ComputeReachabilityNumPy(width, height, classes, blocked, bankIndices, consumedMask, scanRect, reach=2):
+    rowStart, rowEnd, colStart, colEnd = scanRect
+    result = ReachabilityResult(width, height, scanRect)
+
+    indices = numpy.asarray(bankIndices, dtype=numpy.int64).reshape(height, width)
+    banksCount = int(indices.max()) + 1 if indices.size > 0 else 1
+    words = int((banksCount + 63) / 64)
+
+    consumed = numpy.array([(consumedMask >> bank) & 1 for bank in range(banksCount)], dtype=bool)
+    resources = (numpy.asarray(classes, dtype=numpy.uint8).reshape(height, width) == tileClassResource) & ~consumed[indices]
+
+    bits = numpy.zeros((height, width, words), dtype=numpy.uint64)
+    rows, cols = numpy.nonzero(resources)
+    tileBanks = indices[rows, cols]
+    bits[rows, cols, tileBanks >> 6] = numpy.left_shift(numpy.uint64(1), (tileBanks & 63).astype(numpy.uint64))
+
+    horizontal = bits.copy()
+    for offset in range(1, reach + 1):
+        horizontal[:, offset:] |= bits[:, :-offset]
+        horizontal[:, :-offset] |= bits[:, offset:]
+
+    vertical = horizontal.copy()
+    for offset in range(1, reach + 1):
+        vertical[offset:] |= horizontal[:-offset]
+        vertical[:-offset] |= horizontal[offset:]
+
+    masks = numpy.zeros_like(vertical)
+    masks[rowStart:rowEnd, colStart:colEnd] = vertical[rowStart:rowEnd, colStart:colEnd]
+    masks[numpy.asarray(blocked, dtype=bool).reshape(height, width)] = 0
+
+    result.MaskWords = masks
+    result.Counts = numpy.unpackbits(masks.view(numpy.uint8), axis=2).sum(axis=2).ravel().tolist()
+    return result
+
+def ComputeReachabilityZ(width, height, classes, blocked, bankIndices, consumedMask, scanRect, canReach, reach=2):
+    rowStart, rowEnd, colStart, colEnd = scanRect
+    result = ReachabilityResult(width, height, scanRect)
+    result.Masks = [0] * (width * height)
+
+    for row in range(rowStart, rowEnd):
+        firstRow = max(row - reach, 0)
+        lastRow = min(row + reach + 1, height)
+
+        for col in range(colStart, colEnd):
+            i = (row * width) + col
+            if blocked[i]:
+                continue
+
+            mask = 0
+            for finalRow in range(firstRow, lastRow):
+                for finalCol in range(max(col - reach, 0), min(col + reach + 1, width)):
+                    j = (finalRow * width) + finalCol
+                    if classes[j] != tileClassResource:
+                        continue
+
+                    bit = 1 << bankIndices[j]
+                    if (mask | consumedMask) & bit:
+                        continue
+
+                    if canReach(row, col, finalRow - row, finalCol - col):
+                        mask |= bit
+
+            if mask != 0:
+                result.Masks[i] = mask
+                result.Counts[i] = PopCount(mask)
+
+    return result
+
+# The first resource tile of each reachable bank, in the order they are met scanning the reach window row by row,
+# as grid (col, row) coordinates; with canReach, only the tiles it allows, as in ComputeReachabilityZ.
+def FirstReachableTiles(width, height, classes, blocked, bankIndices, consumedMask, row, col, reach=2, canReach=None):
+    tiles = []
+    if blocked[(row * width) + col]:
+        return tiles
+
+    seen = consumedMask
+    for finalRow in range(max(row - reach, 0), min(row + reach + 1, height)):
+        for finalCol in range(max(col - reach, 0), min(col + reach + 1, width)):
+            i = (finalRow * width) + finalCol
+            if classes[i] != tileClassResource:
+                continue
+
+            bit = 1 << bankIndices[i]
+            if seen & bit:
+                continue
+
+            if canReach is not None and not canReach(row, col, finalRow - row, finalCol - col):
+                continue
+
+            seen |= bit
+            tiles.append((finalCol, finalRow))
+
+    return tiles
@@ -0,0 +1,9 @@
+# Resource profiles by Smjert/Spasitjel
+#
+# All the profiles the radar can show, and switch between while running; add the profiles of a new skill here.
+# See tile_classifier.py for what a profile defines.
+
+from radar_core.mining_tiles import miningProfiles
+from radar_core.lumberjacking_tiles import lumberjackingProfiles
+
+resourceProfiles = miningProfiles + lumberjackingProfiles
@@ -0,0 +1,99 @@
+# Radar refresh scheduler by Smjert/Spasitjel
+#
+# Decides when the player position is checked, when the radar is recomputed and when the hotkeys are handled,
+# and sleeps until the next of them is due, instead of waking up at a fixed rate.
+#
+# - A move is reported right away, unless another one was reported less than refreshInterval ago:
+#   then it's held back and only the latest position is reported once refreshInterval has passed,
+#   so that moving continuously, like when running, causes one recompute per refreshInterval instead of one per step.
+# - The position is checked every movePollInterval while moving, and every idlePollInterval
+#   once the player hasn't moved for idleAfter.
+# - The hotkeys are checked every hotKeyPollInterval, independently of the position.
+# - Each position that differs from the previous poll is also given to onPositionChange, if any, even when it's held back.
+#
+# All the intervals are in milliseconds. The scheduler doesn't talk to Razor Enhanced directly, but through:
+#   player: any object with Position.X, Position.Y and Map, like the Razor Enhanced Player
+#   misc: any object with Pause(milliseconds), like the Razor Enhanced Misc
+#   clock: a function returning the current time in seconds
+# so it can run with fake ones, where the clock is advanced by the fake Pause, as in tests/test_scheduler.py.
+
+import time
+
+class RefreshScheduler():
+    def __init__(self, player, misc, onMove, onHotKeys, movePollInterval=50, idlePollInterval=500, idleAfter=2000,
+                 refreshInterval=250, hotKeyPollInterval=50, clock=time.monotonic, onPositionChange=None):
+        self.Player = player
+        self.Misc = misc
+        # Called with (x, y, mapIndex) of the position to recompute the radar for
+        self.OnMove = onMove
+        self.OnHotKeys = onHotKeys
+        self.OnPositionChange = onPositionChange
+        self.MovePollInterval = movePollInterval
+        self.IdlePollInterval = idlePollInterval
+        self.IdleAfter = idleAfter
+        self.RefreshInterval = refreshInterval
+        self.HotKeyPollInterval = hotKeyPollInterval
+        self.Clock = clock
+
+        self.LastPosition = None
+        self.ReportedPosition = None
+        self.LastMoveTime = None
+        self.LastReportTime = None
+        self.NextPositionPoll = 0
+        self.NextHotKeyPoll = 0
+
+        self.Polls = 0
+        self.Reports = 0
+
+    def Now(self):
+        return self.Clock() * 1000
+
+    def PollInterval(self, now):
+        if self.LastMoveTime is not None and now - self.LastMoveTime < self.IdleAfter:
+            return self.MovePollInterval
+
+        return self.IdlePollInterval
+
+    def PollPosition(self, now):
+        self.Polls += 1
+        position = (self.Player.Position.X, self.Player.Position.Y, self.Player.Map)
+
+        if position != self.LastPosition:
+            self.LastPosition = position
+            self.LastMoveTime = now
+            if self.OnPositionChange is not None:
+                self.OnPositionChange(position[0], position[1], position[2])
+
+        if position == self.ReportedPosition:
+            return
+
+        if self.LastReportTime is not None and now - self.LastReportTime < self.RefreshInterval:
+            # Held back; the poll that reports it is scheduled by Step
+            return
+
+        self.ReportedPosition = position
+        self.LastReportTime = now
+        self.Reports += 1
+        self.OnMove(position[0], position[1], position[2])
+
+    # Runs what is due and returns how many milliseconds to wait before calling it again
+    def Step(self):
+        now = self.Now()
+
+        if now >= self.NextHotKeyPoll:
+            self.OnHotKeys()
+            self.NextHotKeyPoll = now + self.HotKeyPollInterval
+
+        if now >= self.NextPositionPoll:
+            self.PollPosition(now)
+            self.NextPositionPoll = now + self.PollInterval(now)
+
+            # A held back move is reported as soon as refreshInterval has passed
+            if self.LastPosition != self.ReportedPosition:
+                self.NextPositionPoll = min(self.NextPositionPoll, self.LastReportTime + self.RefreshInterval)
+
+        return max(int(min(self.NextHotKeyPoll, self.NextPositionPoll) - self.Now()), 1)
+
+    def Run(self, keepRunning):
+        while keepRunning():
+            self.Misc.Pause(self.Step())
@@ -0,0 +1,653 @@
+# Session trace recorder and replay by Smjert/Spasitjel
+#
+# Records what the radar receives during a real session: the player positions, the hotkeys, the resource profile switches,
+# the answers of the land provider (the Razor Enhanced Statics) and the marked spots it loads and saves, for each skill. The trace can then be replayed outside of the client,
+# for instance with CPython, to profile the places where the radar struggles, or to check that a new version computes the same:
+#   python -m radar_core.session_trace info <trace path>
+#   python -m radar_core.session_trace replay <trace path> [--output <result path>] [--compare <result path>] [--profile <csv or json path>]
+#
+# The replay runs the RadarEngine and the RefreshScheduler on a fake clock, so it's as fast as the engine, and it's deterministic:
+# the player moves and presses the hotkeys at the recorded times, and every update is computed right away.
+# Its result is, for each update, the position and a checksum of the bank counts, plus the saved spots, and it can be
+# written with --output, to be compared with the result of another version with --compare.
+#
+# While recording, the land cache on disk is not used, so that every land tile the radar needs is in the trace.
+#
+# File layout (all values little endian):
+#   Header: magic "RSTR", version (uint16), visible range (uint16), bank size (uint16, 0 for the size of the profiles),
+#           resource profile name (16 bytes, zero padded),
+#           move latency, idle latency, idle after, refresh interval, hotkey latency (uint16 each, in milliseconds)
+#   Records: kind (uint8), followed by:
+#     land: x (int16), y (int16), map index (uint8), tile ID (uint16); the radar also asks for tiles past the map edges
+#     flag: tile ID (uint16), value (uint8), name length (uint8), name (ASCII)
+#     position: time (uint32, milliseconds since the start), x (uint16), y (uint16), map index (uint8)
+#     hotkey: time (uint32), key length (uint8), key (ASCII)
+#     loaded spot, saved spot: a spot record, as in the marked spots log (see spots_store.py)
+#     land Z: x (int16), y (int16), map index (uint8), Z (int8)
+#     statics: x (int16), y (int16), map index (uint8), count (uint8), then for each static: static ID (uint16), Z (int8)
+#     tile height: static ID (uint16), height (uint8)
+#     reachability: mode length (uint8), mode (ASCII); written after the header, traces without it are of the "window" mode
+#     tile flag: as a flag, for a static ID
+#     profile: time (uint32), name length (uint8), name (ASCII)
+#     skill: name length (uint8), name (ASCII); the loaded and saved spots after it are of that skill
+#     clock: unix time at the start (float64), banks respawn time (uint32, in seconds, 0 if they never respawn)
+# The heights are only recorded with the Z-aware reachability, which is the only one asking for them.
+# The spots before the first skill record are of the skill of the profile in the header.
+# The replay runs at the unix time of the clock record, so the banks respawn as they did while recording;
+# traces without it replay with banks that never respawn.
+
+import bisect
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from threading import Lock
+
+from radar_core.spots_store import SpotsStore, PackSpot, UnpackRecord, FormatTextSpot
+from radar_core.radar_engine import RadarEngine
+from radar_core.scheduler import RefreshScheduler
+from radar_core.profiler import FrameProfiler
+from radar_core.fakes import FakeMisc
+from radar_core.resource_profiles import resourceProfiles
+
+traceMagic = b"RSTR"
+traceVersion = 1
+traceHeader = struct.Struct("<4sHHH16sHHHHH")
+recordKind = struct.Struct("<B")
+landRecord = struct.Struct("<hhBH")
+flagRecord = struct.Struct("<HBB")
+positionRecord = struct.Struct("<IHHB")
+hotKeyRecord = struct.Struct("<IB")
+landZRecord = struct.Struct("<hhBb")
+staticsRecord = struct.Struct("<hhBB")
+staticRecord = struct.Struct("<Hb")
+tileHeightRecord = struct.Struct("<HB")
+reachabilityRecord = struct.Struct("<B")
+profileRecord = struct.Struct("<IB")
+skillRecord = struct.Struct("<B")
+clockRecord = struct.Struct("<dI")
+
+recordKindLand = 1
+recordKindFlag = 2
+recordKindPosition = 3
+recordKindHotKey = 4
+recordKindLoadedSpot = 5
+recordKindSavedSpot = 6
+recordKindLandZ = 7
+recordKindStatics = 8
+recordKindTileHeight = 9
+recordKindReachability = 10
+recordKindTileFlag = 11
+recordKindProfile = 12
+recordKindSkill = 13
+recordKindClock = 14
+
+class TraceSettings():
+    def __init__(self, visibleRange=16, bankSize=None, resourceProfile="Mining", moveLatency=50, idleLatency=500, idleAfter=2000,
+                 refreshInterval=250, hotKeyLatency=100, reachabilityMode="window", bankRespawnTime=None):
+        self.VisibleRange = visibleRange
+        self.BankSize = bankSize
+        self.ResourceProfile = resourceProfile
+        self.MoveLatency = moveLatency
+        self.IdleLatency = idleLatency
+        self.IdleAfter = idleAfter
+        self.RefreshInterval = refreshInterval
+        self.HotKeyLatency = hotKeyLatency
+        self.ReachabilityMode = reachabilityMode
+        self.BankRespawnTime = bankRespawnTime
+
+# Records the land answers of a provider
+class RecordingLand():
+    def __init__(self, provider, recorder):
+        self.Provider = provider
+        self.Recorder = recorder
+
+    def GetLandID(self, x, y, mapIndex):
+        tileID = self.Provider.GetLandID(x, y, mapIndex)
+        self.Recorder.Write(recordKindLand, landRecord.pack(x, y, mapIndex, tileID))
+        return tileID
+
+    def GetLandFlag(self, tileID, flagName):
+        value = self.Provider.GetLandFlag(tileID, flagName)
+        name = flagName.encode("ascii")
+        self.Recorder.Write(recordKindFlag, flagRecord.pack(tileID, 1 if value else 0, len(name)) + name)
+        return value
+
+    def GetLandZ(self, x, y, mapIndex):
+        z = self.Provider.GetLandZ(x, y, mapIndex)
+        self.Recorder.Write(recordKindLandZ, landZRecord.pack(x, y, mapIndex, z))
+        return z
+
+    def GetStaticsTileInfo(self, x, y, mapIndex):
+        tiles = self.Provider.GetStaticsTileInfo(x, y, mapIndex)
+        data = staticsRecord.pack(x, y, mapIndex, len(tiles))
+        for tile in tiles:
+            data += staticRecord.pack(tile.StaticID, tile.StaticZ)
+
+        self.Recorder.Write(recordKindStatics, data)
+        return tiles
+
+    def GetTileHeight(self, staticID):
+        getTileHeight = getattr(self.Provider, "GetTileHeight", None)
+        height = getTileHeight(staticID) if getTileHeight is not None else 0
+        self.Recorder.Write(recordKindTileHeight, tileHeightRecord.pack(staticID, height))
+        return height
+
+    def GetTileFlag(self, staticID, flagName):
+        value = self.Provider.GetTileFlag(staticID, flagName)
+        name = flagName.encode("ascii")
+        self.Recorder.Write(recordKindTileFlag, flagRecord.pack(staticID, 1 if value else 0, len(name)) + name)
+        return value
+
+# Records the player position each time it's read and it changed
+class RecordingPlayer():
+    def __init__(self, player, recorder):
+        self.Player = player
+        self.Recorder = recorder
+        self.LastPosition = None
+
+    @property
+    def Position(self):
+        position = self.Player.Position
+        current = (position.X, position.Y, self.Player.Map)
+        if current != self.LastPosition:
+            self.LastPosition = current
+            self.Recorder.Write(recordKindPosition, positionRecord.pack(self.Recorder.Now(), current[0], current[1], current[2]))
+
+        return position
+
+    def __getattr__(self, attribute):
+        return getattr(self.Player, attribute)
+
+# Records the spots loaded from the store of a skill, and the ones saved in it
+class RecordingSpotsStore():
+    def __init__(self, store, recorder, skill):
+        self.Store = store
+        self.Recorder = recorder
+        self.Skill = skill
+        # Spots saved in this session are loaded again when their region is, but they weren't in the store at the start
+        self.SavedSpots = set()
+
+    def LoadArea(self, mapIndex, minX, minY, maxX, maxY):
+        spots = self.Store.LoadArea(mapIndex, minX, minY, maxX, maxY)
+        for spot in spots:
+            if (spot.Map, spot.X, spot.Y, tuple(spot.Tiles)) not in self.SavedSpots:
+                self.Recorder.WriteSpot(self.Skill, recordKindLoadedSpot, PackSpot(spot))
+
+        return spots
+
+    def ReadNewSpots(self):
+        spots = self.Store.ReadNewSpots()
+        for spot in spots:
+            self.Recorder.WriteSpot(self.Skill, recordKindLoadedSpot, PackSpot(spot))
+
+        return spots
+
+    def Append(self, spot):
+        self.Store.Append(spot)
+        self.SavedSpots.add((spot.Map, spot.X, spot.Y, tuple(spot.Tiles)))
+        self.Recorder.WriteSpot(self.Skill, recordKindSavedSpot, PackSpot(spot))
+
+    def __getattr__(self, attribute):
+        return getattr(self.Store, attribute)
+
+class SessionRecorder():
+    Enabled = True
+
+    # clock times the records, wallClock is the unix time the replay runs at
+    def __init__(self, path, settings, clock=time.monotonic, wallClock=time.time):
+        self.Clock = clock
+        self.StartTime = clock()
+        self.Lock = Lock()
+        # Skill of the last spot record written
+        self.Skill = None
+        self.File = open(path, "wb")
+        self.File.write(traceHeader.pack(traceMagic, traceVersion, settings.VisibleRange, settings.BankSize or 0,
+                                         settings.ResourceProfile.encode("ascii"), settings.MoveLatency, settings.IdleLatency,
+                                         settings.IdleAfter, settings.RefreshInterval, settings.HotKeyLatency))
+        mode = settings.ReachabilityMode.encode("ascii")
+        self.File.write(recordKind.pack(recordKindReachability) + reachabilityRecord.pack(len(mode)) + mode)
+        self.File.write(recordKind.pack(recordKindClock) + clockRecord.pack(wallClock(), settings.BankRespawnTime or 0))
+
+    # Milliseconds since the start
+    def Now(self):
+        return int((self.Clock() - self.StartTime) * 1000)
+
+    def Write(self, kind, data):
+        with self.Lock:
+            self.File.write(recordKind.pack(kind) + data)
+
+    # Writes a spot record, preceded by a skill record if the previous one was of another skill
+    def WriteSpot(self, skill, kind, data):
+        with self.Lock:
+            if skill != self.Skill:
+                self.Skill = skill
+                name = skill.encode("ascii")
+                self.File.write(recordKind.pack(recordKindSkill) + skillRecord.pack(len(name)) + name)
+
+            self.File.write(recordKind.pack(kind) + data)
+
+    def HotKey(self, key):
+        name = key.encode("ascii")
+        self.Write(recordKindHotKey, hotKeyRecord.pack(self.Now(), len(name)) + name)
+
+    def Profile(self, profileName):
+        name = profileName.encode("ascii")
+        self.Write(recordKindProfile, profileRecord.pack(self.Now(), len(name)) + name)
+
+    def WrapLand(self, provider):
+        return RecordingLand(provider, self)
+
+    def WrapPlayer(self, player):
+        return RecordingPlayer(player, self)
+
+    def WrapSpotsStore(self, store, skill):
+        return RecordingSpotsStore(store, self, skill)
+
+    def Close(self):
+        with self.Lock:
+            self.File.close()
+
+# Records nothing, the providers are returned as they are
+class NullRecorder():
+    Enabled = False
+
+    def HotKey(self, key):
+        pass
+
+    def Profile(self, profileName):
+        pass
+
+    def WrapLand(self, provider):
+        return provider
+
+    def WrapPlayer(self, player):
+        return player
+
+    def WrapSpotsStore(self, store, skill):
+        return store
+
+    def Close(self):
+        pass
+
+class SessionTrace():
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        magic, version, visibleRange, bankSize, profileName, *latencies = traceHeader.unpack_from(data, 0)
+        if magic != traceMagic or version != traceVersion:
+            raise ValueError(f"{path} is not a session trace")
+
+        self.Settings = TraceSettings(visibleRange, bankSize or None, profileName.rstrip(b"\0").decode("ascii"), *latencies)
+        # (x, y, map index) -> tile ID
+        self.LandIDs = {}
+        # (tile ID, flag name) -> value
+        self.LandFlags = {}
+        # (x, y, map index) -> land Z
+        self.LandZ = {}
+        # (x, y, map index) -> [(static ID, Z)]
+        self.Statics = {}
+        # static ID -> height
+        self.TileHeights = {}
+        # (static ID, flag name) -> value
+        self.TileFlags = {}
+        # (time, x, y, map index), in time order
+        self.Positions = []
+        # (time, key)
+        self.HotKeys = []
+        # (time, profile name)
+        self.ProfileSwitches = []
+        # Skill -> spots
+        self.LoadedSpots = {}
+        self.SavedSpots = {}
+        # Unix time at the start, None in traces without a clock record
+        self.StartTime = None
+
+        skill = next((profile.Skill for profile in resourceProfiles if profile.Name == self.Settings.ResourceProfile), None)
+
+        offset = traceHeader.size
+        while offset < len(data):
+            kind = data[offset]
+            offset += recordKind.size
+
+            if kind == recordKindLand:
+                x, y, mapIndex, tileID = landRecord.unpack_from(data, offset)
+                self.LandIDs[(x, y, mapIndex)] = tileID
+                offset += landRecord.size
+            elif kind == recordKindFlag:
+                tileID, value, nameLength = flagRecord.unpack_from(data, offset)
+                offset += flagRecord.size
+                self.LandFlags[(tileID, data[offset:offset + nameLength].decode("ascii"))] = value != 0
+                offset += nameLength
+            elif kind == recordKindPosition:
+                self.Positions.append(positionRecord.unpack_from(data, offset))
+                offset += positionRecord.size
+            elif kind == recordKindHotKey:
+                keyTime, keyLength = hotKeyRecord.unpack_from(data, offset)
+                offset += hotKeyRecord.size
+                self.HotKeys.append((keyTime, data[offset:offset + keyLength].decode("ascii")))
+                offset += keyLength
+            elif kind == recordKindLandZ:
+                x, y, mapIndex, z = landZRecord.unpack_from(data, offset)
+                self.LandZ[(x, y, mapIndex)] = z
+                offset += landZRecord.size
+            elif kind == recordKindStatics:
+                x, y, mapIndex, count = staticsRecord.unpack_from(data, offset)
+                offset += staticsRecord.size
+                self.Statics[(x, y, mapIndex)] = [staticRecord.unpack_from(data, offset + (i * staticRecord.size)) for i in range(count)]
+                offset += count * staticRecord.size
+            elif kind == recordKindTileHeight:
+                staticID, height = tileHeightRecord.unpack_from(data, offset)
+                self.TileHeights[staticID] = height
+                offset += tileHeightRecord.size
+            elif kind == recordKindReachability:
+                modeLength, = reachabilityRecord.unpack_from(data, offset)
+                offset += reachabilityRecord.size
+                self.Settings.ReachabilityMode = data[offset:offset + modeLength].decode("ascii")
+                offset += modeLength
+            elif kind == recordKindTileFlag:
+                staticID, value, nameLength = flagRecord.unpack_from(data, offset)
+                offset += flagRecord.size
+                self.TileFlags[(staticID, data[offset:offset + nameLength].decode("ascii"))] = value != 0
+                offset += nameLength
+            elif kind == recordKindProfile:
+                switchTime, nameLength = profileRecord.unpack_from(data, offset)
+                offset += profileRecord.size
+                self.ProfileSwitches.append((switchTime, data[offset:offset + nameLength].decode("ascii")))
+                offset += nameLength
+            elif kind == recordKindSkill:
+                nameLength, = skillRecord.unpack_from(data, offset)
+                offset += skillRecord.size
+                skill = data[offset:offset + nameLength].decode("ascii")
+                offset += nameLength
+            elif kind == recordKindClock:
+                self.StartTime, respawnTime = clockRecord.unpack_from(data, offset)
+                self.Settings.BankRespawnTime = respawnTime or None
+                offset += clockRecord.size
+            elif kind == recordKindLoadedSpot or kind == recordKindSavedSpot:
+                spot, offset = UnpackRecord(data, offset)
+                (self.LoadedSpots if kind == recordKindLoadedSpot else self.SavedSpots).setdefault(skill, []).append(spot)
+            else:
+                raise ValueError(f"Unknown record kind {kind} at offset {offset - recordKind.size} of {path}")
+
+    def Duration(self):
+        lastPosition = self.Positions[-1][0] if len(self.Positions) > 0 else 0
+        lastHotKey = self.HotKeys[-1][0] if len(self.HotKeys) > 0 else 0
+        lastSwitch = self.ProfileSwitches[-1][0] if len(self.ProfileSwitches) > 0 else 0
+        return max(lastPosition, lastHotKey, lastSwitch)
+
+    # The spots of all the skills, by skill name
+    def AllSpots(self, spots):
+        return [spot for skill in sorted(spots) for spot in spots[skill]]
+
+class TraceStatic():
+    def __init__(self, staticID, z):
+        self.StaticID = staticID
+        self.StaticZ = z
+
+# Answers with the recorded land tiles; tiles that weren't recorded, because the replayed version needs more of them
+# than the recorded one did, are counted and answered with tile 0, and with no height
+class TraceLand():
+    def __init__(self, trace):
+        self.Trace = trace
+        self.Misses = 0
+
+    def GetLandID(self, x, y, mapIndex):
+        tileID = self.Trace.LandIDs.get((x, y, mapIndex))
+        if tileID is None:
+            self.Misses += 1
+            return 0
+
+        return tileID
+
+    def GetLandFlag(self, tileID, flagName):
+        return self.Trace.LandFlags.get((tileID, flagName), False)
+
+    def GetLandZ(self, x, y, mapIndex):
+        z = self.Trace.LandZ.get((x, y, mapIndex))
+        if z is None:
+            self.Misses += 1
+            return 0
+
+        return z
+
+    def GetStaticsTileInfo(self, x, y, mapIndex):
+        return [TraceStatic(staticID, z) for staticID, z in self.Trace.Statics.get((x, y, mapIndex), [])]
+
+    def GetTileHeight(self, staticID):
+        return self.Trace.TileHeights.get(staticID, 0)
+
+    def GetTileFlag(self, staticID, flagName):
+        return self.Trace.TileFlags.get((staticID, flagName), False)
+
+class TracePosition():
+    def __init__(self, x, y):
+        self.X = x
+        self.Y = y
+
+# Is at the last recorded position at the time of the fake clock
+class TracePlayer():
+    def __init__(self, trace, misc):
+        self.Misc = misc
+        self.Times = [position[0] for position in trace.Positions]
+        self.Positions = trace.Positions
+
+    def Current(self):
+        i = bisect.bisect_right(self.Times, self.Misc.Time) - 1
+        return self.Positions[max(i, 0)]
+
+    @property
+    def Position(self):
+        current = self.Current()
+        return TracePosition(current[1], current[2])
+
+    @property
+    def Map(self):
+        return self.Current()[3]
+
+class ReplayResult():
+    def __init__(self):
+        # (map index, x, y, checksum of the bank counts) of each update
+        self.Frames = []
+        # Milliseconds taken by each update
+        self.Latencies = []
+        self.SavedSpots = []
+        self.LandMisses = 0
+
+def ReplaySession(trace, saveKey="S", profiler=None):
+    if len(trace.Positions) == 0:
+        raise ValueError("The trace has no positions to replay")
+
+    settings = trace.Settings
+    land = TraceLand(trace)
+    misc = FakeMisc()
+    # The banks respawn at the recorded times
+    startTime = trace.StartTime if trace.StartTime is not None else 0
+    engine = RadarEngine(land, settings.VisibleRange, settings.BankSize, resourceProfile=settings.ResourceProfile, profiler=profiler,
+                         reachabilityMode=settings.ReachabilityMode, bankRespawnTime=settings.BankRespawnTime,
+                         clock=lambda: startTime + (misc.Time / 1000))
+    result = ReplayResult()
+
+    # The spots of each skill that were in its store when they were loaded
+    directory = tempfile.mkdtemp(prefix="radar-replay-")
+    stores = {}
+    try:
+        # Opens the store of the skill of the current profile, as the radar does when switching to it the first time
+        def OpenStore():
+            skill = engine.Profile.Skill
+            loadedSpots = trace.LoadedSpots.get(skill, [])
+            store = SpotsStore(os.path.join(directory, f"spots-{skill}.bin"))
+            store.AppendMany(loadedSpots)
+            store.WriteIndex()
+            engine.SpotsStore = store
+            stores[skill] = (store, len(loadedSpots))
+
+        OpenStore()
+
+        player = TracePlayer(trace, misc)
+        for keyTime, key in trace.HotKeys:
+            misc.PressKey(key, keyTime)
+
+        def Update(x, y, mapIndex):
+            engine.Profiler.BeginFrame("update")
+            start = time.perf_counter()
+            engine.Update(x, y, mapIndex)
+            result.Latencies.append((time.perf_counter() - start) * 1000)
+            engine.Profiler.EndFrame()
+
+            state = engine.State
+            result.Frames.append((state.Map, state.CenterX, state.CenterY, zlib.crc32(state.Tiles.Amounts.tobytes())))
+
+        lastKey = [misc.LastHotKey()]
+        profileSwitches = list(reversed(trace.ProfileSwitches))
+
+        # As the radar does, but the state of the player position is computed right away instead of waited for
+        def OnHotKeys():
+            while len(profileSwitches) > 0 and profileSwitches[-1][0] <= misc.Time:
+                engine.SetResourceProfile(profileSwitches.pop()[1])
+                if engine.SpotsStore is None:
+                    OpenStore()
+
+                state = engine.State
+                if state.Map >= 0:
+                    Update(state.CenterX, state.CenterY, state.Map)
+
+            key = misc.LastHotKey()
+            if key is None or (lastKey[0] is not None and lastKey[0].Timestamp >= key.Timestamp):
+                return
+
+            lastKey[0] = key
+            if key.HotKey != saveKey:
+                return
+
+            position = player.Position
+            state = engine.State
+            if (state.Map, state.CenterX, state.CenterY) != (player.Map, position.X, position.Y):
+                Update(position.X, position.Y, player.Map)
+
+            engine.SaveMiningSpot(engine.State)
+            engine.RepublishMapState()
+
+        scheduler = RefreshScheduler(player, misc, Update, OnHotKeys, settings.MoveLatency, settings.IdleLatency, settings.IdleAfter,
+                                     settings.RefreshInterval, settings.HotKeyLatency, clock=misc.Clock)
+
+        # Long enough after the last event for a held back move to be reported
+        endTime = trace.Duration() + settings.RefreshInterval + settings.IdleLatency
+        scheduler.Run(lambda: misc.Time <= endTime)
+
+        for skill in sorted(stores):
+            store, loaded = stores[skill]
+            # Saved a bit later or earlier than while recording, the hotkeys being polled
+            result.SavedSpots += [FormatTextSpot(spot, withTime=False) for spot in store.AllSpots()[loaded:]]
+    finally:
+        engine.Close()
+        shutil.rmtree(directory)
+
+    result.LandMisses = land.Misses
+    return result
+
+def WriteResult(result, path):
+    with open(path, "w") as f:
+        for frame in result.Frames:
+            f.write("frame " + ",".join(f"{value}" for value in frame) + "\n")
+        for spot in result.SavedSpots:
+            f.write("spot " + spot + "\n")
+
+def ReadResult(path):
+    result = ReplayResult()
+    with open(path, "r") as f:
+        for line in f:
+            kind, _, value = line.strip().partition(" ")
+            if kind == "frame":
+                result.Frames.append(tuple(int(field) for field in value.split(",")))
+            elif kind == "spot":
+                result.SavedSpots.append(value)
+
+    return result
+
+# Description of the first difference between two results, or None if they're the same
+def CompareResults(result, expected):
+    for i, (frame, expectedFrame) in enumerate(zip(result.Frames, expected.Frames)):
+        if frame != expectedFrame:
+            return f"update {i} differs: map {frame[0]} at {frame[1]},{frame[2]}, expected map {expectedFrame[0]} at {expectedFrame[1]},{expectedFrame[2]}" + \
+                   (", the bank counts differ" if frame[:3] == expectedFrame[:3] else "")
+
+    if len(result.Frames) != len(expected.Frames):
+        return f"{len(result.Frames)} updates, expected {len(expected.Frames)}"
+
+    for spot, expectedSpot in zip(result.SavedSpots, expected.SavedSpots):
+        if spot != expectedSpot:
+            return f"saved spot {spot} differs, expected {expectedSpot}"
+
+    if len(result.SavedSpots) != len(expected.SavedSpots):
+        return f"{len(result.SavedSpots)} saved spots, expected {len(expected.SavedSpots)}"
+
+    return None
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Shows or replays a session recorded by the radar.")
+    parser.add_argument("command", choices=("info", "replay"))
+    parser.add_argument("trace", help="session trace file")
+    parser.add_argument("--save-key", default="S", help="hotkey that saves a spot, saveASpotKey of the radar")
+    parser.add_argument("--output", help="file to write the replay result to")
+    parser.add_argument("--compare", help="replay result of another version, which has to be the same")
+    parser.add_argument("--profile", help="file to write the phases of each update to, as JSON if it ends with .json, as CSV otherwise")
+    parser.add_argument("--slowest", type=int, default=5, help="how many of the slowest updates to show")
+    args = parser.parse_args()
+
+    trace = SessionTrace(args.trace)
+    settings = trace.Settings
+
+    if args.command == "info":
+        print(f"Visible range {settings.VisibleRange}, bank size {settings.BankSize or 'of the profiles'}, profile {settings.ResourceProfile}, "
+              f"reachability {settings.ReachabilityMode}, banks respawn time {settings.BankRespawnTime or 'never'}")
+        print(f"{trace.Duration() / 1000:.1f} seconds, {len(trace.Positions)} positions, {len(trace.HotKeys)} hotkeys, "
+              f"{len(trace.ProfileSwitches)} profile switches")
+        print(f"{len(trace.LandIDs)} land tiles, {len(trace.Statics)} statics tiles, "
+              f"{len(trace.AllSpots(trace.LoadedSpots))} loaded spots, {len(trace.AllSpots(trace.SavedSpots))} saved spots")
+        sys.exit(0)
+
+    profiler = FrameProfiler()
+    start = time.perf_counter()
+    result = ReplaySession(trace, args.save_key, profiler)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result.Latencies)
+    print(f"Replayed {trace.Duration() / 1000:.1f} seconds in {elapsed:.2f} seconds: {len(result.Frames)} updates, {len(result.SavedSpots)} saved spots")
+    if len(latencies) > 0:
+        print(f"Update latency: p50 {latencies[int(len(latencies) / 2)]:.2f} p95 {latencies[int(len(latencies) * 0.95)]:.2f} max {latencies[-1]:.2f} ms")
+
+    for line in profiler.SummaryLines():
+        print(f"  {line}")
+
+    slowest = sorted(range(len(result.Latencies)), key=lambda i: result.Latencies[i], reverse=True)[:args.slowest]
+    for i in slowest:
+        frame = result.Frames[i]
+        print(f"  update {i}: {result.Latencies[i]:.2f} ms at {frame[1]},{frame[2]} on map {frame[0]}")
+
+    if result.LandMisses > 0:
+        print(f"{result.LandMisses} land tiles were not in the trace, and have been replayed as tile 0 or Z 0", file=sys.stderr)
+
+    recordedSpots = [FormatTextSpot(spot, withTime=False) for spot in trace.AllSpots(trace.SavedSpots)]
+    if result.SavedSpots != recordedSpots:
+        print("The saved spots differ from the ones saved while recording", file=sys.stderr)
+
+    if args.profile:
+        profiler.WriteTrace(args.profile)
+
+    if args.output:
+        WriteResult(result, args.output)
+
+    if args.compare:
+        difference = CompareResults(result, ReadResult(args.compare))
+        if difference is not None:
+            print(f"DIFFERENT from {args.compare}: {difference}", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"Same as {args.compare}")
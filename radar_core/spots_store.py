@@ -0,0 +1,500 @@
+# Marked spots store by Smjert/Spasitjel
+#
+# The marked spots are saved in an append-only binary log, with an index that groups the records by map and region,
+# so that only the regions around the player have to be read, when the player gets close to them.
+#
+# Log file layout (all values little endian):
+#   Header: magic "RSPL", version (uint16)
+#   Records: kind (uint8), map index (uint8), spot X (uint16), spot Y (uint16), tiles count (uint16),
+#            followed by tiles count times: resource tile X (uint16), resource tile Y (uint16)
+#   The kinds are 1 for a spot, and 2 for a spot with the time it was saved at, when its banks were consumed,
+#   as the first of its tiles: the low 16 bits and the high 16 bits of the unix time, in seconds.
+#   Every record has the same layout, so that readers can skip the kinds they don't know.
+#
+# Index file layout (the log path plus ".idx"):
+#   Header: magic "RSPI", version (uint16), region size (uint16), log size covered by the index (uint64), regions count (uint32)
+#   Directory: per region: map index (uint8), region X (uint16), region Y (uint16),
+#              position of its first record offset (uint32), records count (uint32)
+#   Offsets: the offsets in the log of the records of each region (uint32), region after region
+#
+# Records appended after the index was last written are found by reading the log from the covered size to its end;
+# when there are too many of them, the index is rewritten.
+#
+# The files can be shared by the radars of several clients: appending to the log and rewriting the index are done holding
+# the lock of the log (see file_lock.py), and each store remembers how much of the log it has read, so that the records
+# appended by the others are found by reading only the end of the log, with ReadNewSpots. An index rewritten by another
+# process is read again the next time a region is loaded. Compact the log with the radars closed, since it moves the records;
+# a radar that finds the log shorter than it was reads it again from scratch.
+#
+# It can also be used from the command line, to import or export the text format used by older versions,
+# and to compact the log, which also removes duplicated spots:
+#   python -m radar_core.spots_store import <log path> <text path>
+#   python -m radar_core.spots_store export <log path> <text path>
+#   python -m radar_core.spots_store compact <log path>
+
+import os
+import struct
+
+from radar_core.file_lock import FileLock
+
+logMagic = b"RSPL"
+logVersion = 1
+logHeader = struct.Struct("<4sH")
+recordHeader = struct.Struct("<BBHHH")
+recordTile = struct.Struct("<HH")
+
+recordKindSpot = 1
+recordKindTimedSpot = 2
+
+indexMagic = b"RSPI"
+indexVersion = 1
+indexHeader = struct.Struct("<4sHHQI")
+indexDirectoryEntry = struct.Struct("<BHHII")
+indexOffset = struct.Struct("<I")
+
+class MarkedSpot():
+    def __init__(self, mapIndex, x, y, tiles, time=None):
+        self.Map = mapIndex
+        self.X = x
+        self.Y = y
+        # World coordinates of the first reachable resource tile of each bank
+        self.Tiles = tiles
+        # Unix time, in seconds, the spot was saved at, None if it's not known
+        self.Time = time
+
+def PackSpot(spot):
+    if spot.Time is None:
+        data = bytearray(recordHeader.pack(recordKindSpot, spot.Map, spot.X, spot.Y, len(spot.Tiles)))
+    else:
+        data = bytearray(recordHeader.pack(recordKindTimedSpot, spot.Map, spot.X, spot.Y, len(spot.Tiles) + 1))
+        data += recordTile.pack(spot.Time & 0xFFFF, (spot.Time >> 16) & 0xFFFF)
+
+    for tileX, tileY in spot.Tiles:
+        data += recordTile.pack(tileX, tileY)
+
+    return bytes(data)
+
+# Returns the spot, or None if it's not a spot record, and the offset of the next record
+def UnpackRecord(data, offset):
+    kind, mapIndex, x, y, tilesCount = recordHeader.unpack_from(data, offset)
+    offset += recordHeader.size
+
+    tiles = []
+    for _ in range(tilesCount):
+        tiles.append(recordTile.unpack_from(data, offset))
+        offset += recordTile.size
+
+    if kind == recordKindSpot:
+        return (MarkedSpot(mapIndex, x, y, tiles), offset)
+
+    if kind == recordKindTimedSpot:
+        return (MarkedSpot(mapIndex, x, y, tiles[1:], tiles[0][0] | (tiles[0][1] << 16)), offset)
+
+    return (None, offset)
+
+class SpotsStore():
+    def __init__(self, path, regionSize=128, maxUnindexedRecords=256):
+        self.Path = path
+        self.IndexPath = path + ".idx"
+        self.RegionSize = regionSize
+        self.MaxUnindexedRecords = maxUnindexedRecords
+
+        # (map, regionX, regionY) -> (position of the first offset in the index file, count)
+        self.Directory = {}
+        # (map, regionX, regionY) -> log offsets of the records not in the index yet
+        self.Unindexed = {}
+        self.UnindexedCount = 0
+        self.LoadedRegions = set()
+
+        # Log size covered by the index that has been read, and log size read so far
+        self.CoveredSize = logHeader.size
+        self.KnownSize = logHeader.size
+        # Spots appended by other processes in regions that were already loaded, to be returned by ReadNewSpots
+        self.NewSpots = []
+
+        self.Lock = FileLock(path + ".lock")
+        with self.Lock:
+            if not os.path.exists(self.Path):
+                with open(self.Path, "wb") as f:
+                    f.write(logHeader.pack(logMagic, logVersion))
+
+            with open(self.Path, "rb") as f:
+                magic, version = logHeader.unpack(f.read(logHeader.size))
+                if magic != logMagic or version != logVersion:
+                    raise ValueError(f"{self.Path} is not a marked spots log")
+
+            coveredSize = self.ReadIndex()
+            self.ReadUnindexed(coveredSize)
+
+            if self.UnindexedCount > self.MaxUnindexedRecords:
+                self.WriteIndex()
+
+    def RegionOf(self, mapIndex, x, y):
+        return (mapIndex, x // self.RegionSize, y // self.RegionSize)
+
+    def ReadIndex(self):
+        self.Directory = {}
+        self.CoveredSize = logHeader.size
+
+        if not os.path.exists(self.IndexPath):
+            return logHeader.size
+
+        with open(self.IndexPath, "rb") as f:
+            header = f.read(indexHeader.size)
+            if len(header) < indexHeader.size:
+                return logHeader.size
+
+            magic, version, regionSize, coveredSize, regionsCount = indexHeader.unpack(header)
+            if magic != indexMagic or version != indexVersion or regionSize != self.RegionSize or coveredSize > os.path.getsize(self.Path):
+                return logHeader.size
+
+            directory = f.read(regionsCount * indexDirectoryEntry.size)
+            for mapIndex, regionX, regionY, position, count in indexDirectoryEntry.iter_unpack(directory):
+                self.Directory[(mapIndex, regionX, regionY)] = (position, count)
+
+        self.CoveredSize = coveredSize
+        return coveredSize
+
+    # Reads the index again if another process rewrote it, dropping the unindexed records it now covers
+    def RefreshIndex(self):
+        coveredSize = logHeader.size
+        if os.path.exists(self.IndexPath):
+            with open(self.IndexPath, "rb") as f:
+                header = f.read(indexHeader.size)
+            if len(header) == indexHeader.size:
+                coveredSize = indexHeader.unpack(header)[3]
+
+        if coveredSize == self.CoveredSize:
+            return
+
+        self.ReadIndex()
+        unindexed = {}
+        self.UnindexedCount = 0
+        for region, offsets in self.Unindexed.items():
+            offsets = [offset for offset in offsets if offset >= self.CoveredSize]
+            if len(offsets) > 0:
+                unindexed[region] = offsets
+                self.UnindexedCount += len(offsets)
+
+        self.Unindexed = unindexed
+
+    def ReadUnindexed(self, fromOffset):
+        self.Unindexed = {}
+        self.UnindexedCount = 0
+
+        with open(self.Path, "rb") as f:
+            f.seek(fromOffset)
+            data = f.read()
+
+        offset = 0
+        while offset < len(data):
+            spot, nextOffset = UnpackRecord(data, offset)
+            if spot is not None:
+                self.Unindexed.setdefault(self.RegionOf(spot.Map, spot.X, spot.Y), []).append(fromOffset + offset)
+                self.UnindexedCount += 1
+
+            offset = nextOffset
+
+        self.KnownSize = fromOffset + len(data)
+
+    # Reads the records appended by other processes since the log was last read; it has to be called holding the lock.
+    # Those of the regions already loaded are kept for ReadNewSpots, the others will be read when their region is loaded.
+    def ReadAppended(self):
+        size = os.path.getsize(self.Path)
+        if size == self.KnownSize:
+            return
+
+        if size < self.KnownSize:
+            # Compacted, everything has moved
+            coveredSize = self.ReadIndex()
+            self.ReadUnindexed(coveredSize)
+            self.LoadedRegions = set()
+            return
+
+        with open(self.Path, "rb") as f:
+            f.seek(self.KnownSize)
+            data = f.read(size - self.KnownSize)
+
+        offset = 0
+        while offset < len(data):
+            spot, nextOffset = UnpackRecord(data, offset)
+            if spot is not None:
+                region = self.RegionOf(spot.Map, spot.X, spot.Y)
+                if region in self.LoadedRegions:
+                    self.NewSpots.append(spot)
+                else:
+                    self.Unindexed.setdefault(region, []).append(self.KnownSize + offset)
+                    self.UnindexedCount += 1
+
+            offset = nextOffset
+
+        self.KnownSize = size
+
+    # Whether other processes appended to the log since it was last read; it's only a file size check
+    def HasNewRecords(self):
+        return len(self.NewSpots) > 0 or os.path.getsize(self.Path) != self.KnownSize
+
+    # Spots appended by other processes to the regions already loaded, since the last call
+    def ReadNewSpots(self):
+        if not self.HasNewRecords():
+            return []
+
+        with self.Lock:
+            self.ReadAppended()
+            spots = self.NewSpots
+            self.NewSpots = []
+
+        return spots
+
+    def ReadRegionOffsets(self, region):
+        offsets = []
+
+        entry = self.Directory.get(region)
+        if entry is not None:
+            with open(self.IndexPath, "rb") as f:
+                f.seek(entry[0])
+                data = f.read(entry[1] * indexOffset.size)
+
+            offsets.extend(offset for (offset,) in indexOffset.iter_unpack(data))
+
+        offsets.extend(self.Unindexed.get(region, []))
+        return offsets
+
+    def ReadSpots(self, offsets):
+        spots = []
+        if len(offsets) == 0:
+            return spots
+
+        with open(self.Path, "rb") as f:
+            for offset in sorted(offsets):
+                f.seek(offset)
+                header = f.read(recordHeader.size)
+                tilesCount = recordHeader.unpack(header)[4]
+                spot = UnpackRecord(header + f.read(tilesCount * recordTile.size), 0)[0]
+                if spot is not None:
+                    spots.append(spot)
+
+        return spots
+
+    # Spots of the regions overlapping the area that haven't been loaded yet
+    def LoadArea(self, mapIndex, minX, minY, maxX, maxY):
+        regions = []
+        for regionY in range(max(minY, 0) // self.RegionSize, (max(maxY, 0) // self.RegionSize) + 1):
+            for regionX in range(max(minX, 0) // self.RegionSize, (max(maxX, 0) // self.RegionSize) + 1):
+                region = (mapIndex, regionX, regionY)
+                if region not in self.LoadedRegions:
+                    regions.append(region)
+
+        if len(regions) == 0:
+            return []
+
+        with self.Lock:
+            self.RefreshIndex()
+            self.ReadAppended()
+
+            offsets = []
+            for region in regions:
+                self.LoadedRegions.add(region)
+                offsets.extend(self.ReadRegionOffsets(region))
+
+            return self.ReadSpots(offsets)
+
+    def Append(self, spot):
+        self.AppendMany([spot])
+
+    def AppendMany(self, spots):
+        # Pack everything first, so that an invalid spot doesn't leave a partial write behind
+        records = [PackSpot(spot) for spot in spots]
+
+        with self.Lock:
+            # What the others appended comes before, and has to be read first
+            self.ReadAppended()
+
+            with open(self.Path, "ab") as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(b"".join(records))
+
+            for spot, data in zip(spots, records):
+                self.Unindexed.setdefault(self.RegionOf(spot.Map, spot.X, spot.Y), []).append(offset)
+                self.UnindexedCount += 1
+                offset += len(data)
+
+            self.KnownSize = offset
+
+    def AllSpots(self):
+        with open(self.Path, "rb") as f:
+            data = f.read()
+
+        spots = []
+        offset = logHeader.size
+        while offset < len(data):
+            spot, offset = UnpackRecord(data, offset)
+            if spot is not None:
+                spots.append(spot)
+
+        return spots
+
+    def WriteIndex(self):
+        with self.Lock:
+            self.ReadAppended()
+            self.WriteIndexLocked()
+
+    def WriteIndexLocked(self):
+        with open(self.Path, "rb") as f:
+            data = f.read()
+
+        regions = {}
+        offset = logHeader.size
+        while offset < len(data):
+            spot, nextOffset = UnpackRecord(data, offset)
+            if spot is not None:
+                regions.setdefault(self.RegionOf(spot.Map, spot.X, spot.Y), []).append(offset)
+
+            offset = nextOffset
+
+        directory = bytearray()
+        offsets = bytearray()
+        position = indexHeader.size + (len(regions) * indexDirectoryEntry.size)
+        for region in sorted(regions):
+            regionOffsets = regions[region]
+            directory += indexDirectoryEntry.pack(region[0], region[1], region[2], position + len(offsets), len(regionOffsets))
+            for recordOffset in regionOffsets:
+                offsets += indexOffset.pack(recordOffset)
+
+        temporaryPath = self.IndexPath + ".tmp"
+        with open(temporaryPath, "wb") as f:
+            f.write(indexHeader.pack(indexMagic, indexVersion, self.RegionSize, len(data), len(regions)))
+            f.write(directory)
+            f.write(offsets)
+
+        os.replace(temporaryPath, self.IndexPath)
+
+        self.ReadIndex()
+        self.Unindexed = {}
+        self.UnindexedCount = 0
+
+    # Rewrites the log with the spots grouped by region and without duplicates;
+    # spots saved more than once on the same position are merged, keeping the tiles of each one and the latest time.
+    def Compact(self):
+        with self.Lock:
+            return self.CompactLocked()
+
+    def CompactLocked(self):
+        merged = {}
+        for spot in self.AllSpots():
+            key = (spot.Map, spot.X, spot.Y)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = MarkedSpot(spot.Map, spot.X, spot.Y, list(spot.Tiles), spot.Time)
+                continue
+
+            if spot.Time is not None and (existing.Time is None or spot.Time > existing.Time):
+                existing.Time = spot.Time
+
+            for tile in spot.Tiles:
+                if tile not in existing.Tiles:
+                    existing.Tiles.append(tile)
+
+        spots = sorted(merged.values(), key=lambda spot: (self.RegionOf(spot.Map, spot.X, spot.Y), spot.Y, spot.X))
+
+        temporaryPath = self.Path + ".tmp"
+        with open(temporaryPath, "wb") as f:
+            f.write(logHeader.pack(logMagic, logVersion))
+            for spot in spots:
+                f.write(PackSpot(spot))
+
+        os.replace(temporaryPath, self.Path)
+        self.KnownSize = os.path.getsize(self.Path)
+        self.WriteIndexLocked()
+        self.LoadedRegions = set()
+
+        return len(spots)
+
+# Text format: <X>,<Y>,<Map>[,<Time>]|<Tile1 X>,<Tile1 Y>|<Tile2 X>,<Tile2 Y>|[...]
+# where the time the spot was saved at, as a unix time in seconds, is only there if it's known
+def ParseTextSpot(line):
+    fields = line.strip().split("|")
+    spotInfo = fields[0].split(",")
+
+    tiles = []
+    for field in fields[1:]:
+        tileInfo = field.split(",")
+        tiles.append((int(tileInfo[0]), int(tileInfo[1])))
+
+    time = int(spotInfo[3]) if len(spotInfo) > 3 else None
+    return MarkedSpot(int(spotInfo[2]), int(spotInfo[0]), int(spotInfo[1]), tiles, time)
+
+def FormatTextSpot(spot, withTime=True):
+    line = f"{spot.X},{spot.Y},{spot.Map}"
+    if withTime and spot.Time is not None:
+        line += f",{spot.Time}"
+
+    for tileX, tileY in spot.Tiles:
+        line += f"|{tileX},{tileY}"
+
+    return line
+
+def ReadTextSpots(textPath):
+    spots = []
+    with open(textPath, "r") as f:
+        for lineNumber, line in enumerate(f, 1):
+            if line.strip() == "":
+                continue
+
+            try:
+                spots.append(ParseTextSpot(line))
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid spot at line {lineNumber} of {textPath}: {line.strip()}")
+
+    return spots
+
+def ImportTextSpots(store, textPath):
+    spots = ReadTextSpots(textPath)
+    store.AppendMany(spots)
+    store.WriteIndex()
+    return len(spots)
+
+# Creates the log at path with the spots of a text file, if it doesn't exist yet. The log is written under a temporary name
+# and only appears once all the spots are in it, so that a text file that can't be read doesn't leave an empty log behind,
+# which would prevent importing it again once fixed.
+def CreateLogFromTextSpots(path, textPath):
+    spots = ReadTextSpots(textPath)
+
+    with FileLock(path + ".lock"):
+        if not os.path.exists(path):
+            temporaryPath = path + ".import"
+            with open(temporaryPath, "wb") as f:
+                f.write(logHeader.pack(logMagic, logVersion))
+                for spot in spots:
+                    f.write(PackSpot(spot))
+
+            os.replace(temporaryPath, path)
+
+    return len(spots)
+
+def ExportTextSpots(store, textPath):
+    spots = store.AllSpots()
+    with open(textPath, "w") as f:
+        for spot in spots:
+            f.write(FormatTextSpot(spot) + "\n")
+
+    return len(spots)
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ("import", "export", "compact") or (sys.argv[1] != "compact" and len(sys.argv) < 4):
+        print("Usage: python -m radar_core.spots_store import|export <log path> <text path>")
+        print("       python -m radar_core.spots_store compact <log path>")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    store = SpotsStore(sys.argv[2])
+
+    if command == "import":
+        print(f"Imported {ImportTextSpots(store, sys.argv[3])} spots")
+    elif command == "export":
+        print(f"Exported {ExportTextSpots(store, sys.argv[3])} spots")
+    else:
+        print(f"Compacted to {store.Compact()} spots")
@@ -0,0 +1,60 @@
+# Statics cache by Smjert/Spasitjel
+#
+# The statics of a tile, like the trees, take a query returning a list of objects, which is much slower than getting a land ID,
+# so they are queried a whole block of blockSize x blockSize tiles at a time, the first time any tile of the block is needed,
+# and kept in memory, the least recently used blocks being evicted; the prefetcher loads the blocks ahead of the player too.
+#
+# The provider is any object with GetStaticsTileInfo(x, y, mapIndex), whose tiles have StaticID and StaticZ,
+# like the Razor Enhanced Statics. The statics of each tile are kept as a tuple of (static ID, Z) pairs.
+
+from collections import OrderedDict
+from threading import Lock
+
+# Most tiles have no statics, they all share this
+noStatics = ()
+
+class StaticsBlock():
+    def __init__(self, size):
+        self.Tiles = [noStatics] * (size * size)
+
+class StaticsCache():
+    def __init__(self, staticsProvider, blockSize=8, maxBlocks=4096):
+        self.Provider = staticsProvider
+        self.BlockSize = blockSize
+        self.MaxBlocks = maxBlocks
+        self.Blocks = OrderedDict()
+        self.Lock = Lock()
+
+    def GetBlock(self, mapIndex, blockX, blockY):
+        key = (mapIndex, blockX, blockY)
+
+        with self.Lock:
+            block = self.Blocks.get(key)
+            if block is not None:
+                self.Blocks.move_to_end(key)
+                return block
+
+        # Loaded without holding the lock, so that a block being prefetched doesn't hold up the others
+        size = self.BlockSize
+        block = StaticsBlock(size)
+        i = 0
+        for y in range(blockY * size, (blockY + 1) * size):
+            for x in range(blockX * size, (blockX + 1) * size):
+                tiles = self.Provider.GetStaticsTileInfo(x, y, mapIndex)
+                if len(tiles) > 0:
+                    block.Tiles[i] = tuple((tile.StaticID, tile.StaticZ) for tile in tiles)
+                i += 1
+
+        with self.Lock:
+            self.Blocks[key] = block
+            if len(self.Blocks) > self.MaxBlocks:
+                self.Blocks.popitem(last=False)
+
+        return block
+
+    def GetStatics(self, x, y, mapIndex):
+        size = self.BlockSize
+        blockX = x // size
+        blockY = y // size
+        block = self.GetBlock(mapIndex, blockX, blockY)
+        return block.Tiles[((y - (blockY * size)) * size) + (x - (blockX * size))]
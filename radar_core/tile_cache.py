@@ -0,0 +1,375 @@
+# Land tiles cache by Smjert/Spasitjel
+#
+# Land tiles never change, so once they have been queried they are kept in memory in blocks of blockSize x blockSize tiles,
+# with the least recently used blocks being evicted, and also saved on a per map file on disk, which is memory mapped,
+# so that areas visited in previous sessions don't need to be queried again.
+#
+# The cache doesn't talk to Razor Enhanced directly, but through a land provider, which is any object with:
+#   GetLandID(x, y, mapIndex) -> tile ID
+#   GetLandFlag(tileID, flagName) -> bool
+# The Razor Enhanced Statics object is one, but a fake one can be used to run the cache outside of the client.
+#
+# The impassable flag of each tile ID can also be taken from a landFlags object with IsImpassable(tileID),
+# like a TileClassifier, so that it's read only once per tile ID.
+#
+# Both TileCache and UncachedLandTiles expose the same interface to the radar:
+#   GetLandTile(x, y, mapIndex) -> (tileID, blocked)
+#   GetLandBlock(mapIndex, blockX, blockY) -> LandBlock
+#
+# TileCache.PrefetchBlock loads a block ahead of time from another thread (see prefetcher.py), without holding the cache lock
+# while the provider is queried, so the lookups of the blocks already cached don't wait for it.
+#
+# The cache files can be shared by the radars of several clients, so that each tile is queried once per machine, and the pages
+# of the files are shared by them: the files are created and the blocks are written holding the lock of the map (see file_lock.py),
+# after checking that another process didn't write them in the meantime.
+# A file mapped by another process can't be resized on Windows, so no file is ever resized: the directory file is created
+# with room for all the blocks of the map, and the records are kept in segment files of recordsPerSegment records each,
+# added as they fill up. Every file is written whole under a temporary name before being renamed, so the other processes
+# either don't see it or see it complete, and map the segments they don't know yet when they read a block in them.
+#
+# The cache files layout is (all values little endian):
+#   Directory file, land-<map index>-<block size>.bin:
+#     Header: magic "RLTC", version (uint16), block size (uint16), map index (uint16),
+#             blocks wide (uint16), blocks high (uint16), records count (uint32)
+#     Block directory: one uint32 per block, in row major order; 0 means the block is not cached,
+#                      otherwise it's the 1 based index of the record holding it.
+#   Segment files, land-<map index>-<block size>-<segment index>.bin, record index // recordsPerSegment:
+#     Records: blockSize * blockSize tile IDs (uint16) in row major order,
+#              followed by the impassable bitmask, one bit per tile.
+
+import mmap
+import os
+import struct
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from radar_core.file_lock import FileLock
+
+# Size in tiles of the maps of an OSI like shard, indexed by Player.Map.
+# Blocks outside of these are not saved on disk.
+mapSizes = [(7168, 4096), (7168, 4096), (2304, 1600), (2560, 2048), (1448, 1448), (1280, 4096)]
+
+# Size in tiles of the blocks the radar caches the land, the statics and the heights in, whatever the banks are;
+# the offline tools read the land cache files with it too
+cacheBlockSize = 8
+
+cacheFileMagic = b"RLTC"
+cacheFileVersion = 1
+cacheFileHeader = struct.Struct("<4sHHHHHI")
+directoryEntry = struct.Struct("<I")
+
+# How many records each segment file holds
+recordsPerSegment = 8192
+
+class LandBlock():
+    def __init__(self, size):
+        self.TileIDs = array("H", [0] * (size * size))
+        self.Blocked = bytearray(size * size)
+
+# Reads directly from the provider, for when the cache is disabled
+class UncachedLandTiles():
+    def __init__(self, landProvider, blockSize, landFlags=None):
+        self.Provider = landProvider
+        self.BlockSize = blockSize
+        self.LandFlags = {}
+
+        if landFlags is not None:
+            self.IsImpassable = landFlags.IsImpassable
+
+    def IsImpassable(self, tileID):
+        blocked = self.LandFlags.get(tileID)
+        if blocked is None:
+            blocked = bool(self.Provider.GetLandFlag(tileID, "Impassable"))
+            self.LandFlags[tileID] = blocked
+
+        return blocked
+
+    def GetLandTile(self, x, y, mapIndex):
+        tileID = self.Provider.GetLandID(x, y, mapIndex)
+        return (tileID, self.IsImpassable(tileID))
+
+    def GetLandBlock(self, mapIndex, blockX, blockY):
+        size = self.BlockSize
+        block = LandBlock(size)
+        startX = blockX * size
+        startY = blockY * size
+
+        i = 0
+        for y in range(startY, startY + size):
+            for x in range(startX, startX + size):
+                tileID = self.Provider.GetLandID(x, y, mapIndex)
+                block.TileIDs[i] = tileID
+                block.Blocked[i] = 1 if self.IsImpassable(tileID) else 0
+                i += 1
+
+        return block
+
+    def Close(self):
+        pass
+
+# Path of the cache directory file of a map
+def LandBlockFilePath(cacheDirectory, mapIndex, blockSize):
+    return os.path.join(cacheDirectory, f"land-{mapIndex}-{blockSize}.bin")
+
+def LandSegmentFilePath(path, segment):
+    root, extension = os.path.splitext(path)
+    return f"{root}-{segment}{extension}"
+
+def MapBlocksSize(mapIndex, blockSize):
+    width, height = mapSizes[mapIndex]
+    return (int((width + blockSize - 1) / blockSize), int((height + blockSize - 1) / blockSize))
+
+# Writes a file of a given size, starting with data and then zeros, so that it appears complete to the other processes
+def CreateFile(path, data, size):
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "wb") as f:
+        f.write(data)
+        f.truncate(size)
+
+    os.replace(temporaryPath, path)
+
+class LandBlockFile():
+    # A read only file can be shared by multiple readers, but it has to exist already
+    def __init__(self, path, mapIndex, blockSize, blocksWide, blocksHigh, readOnly=False):
+        self.Path = path
+        self.ReadOnly = readOnly
+        self.BlockSize = blockSize
+        self.BlocksWide = blocksWide
+        self.BlocksHigh = blocksHigh
+        self.TilesPerBlock = blockSize * blockSize
+        self.RecordSize = (self.TilesPerBlock * 2) + int((self.TilesPerBlock + 7) / 8)
+        self.DirectorySize = cacheFileHeader.size + (blocksWide * blocksHigh * directoryEntry.size)
+        self.SegmentSize = recordsPerSegment * self.RecordSize
+        # (file, map) of the segments mapped so far
+        self.Segments = []
+
+        # Readers don't change the files, so they don't need their lock
+        self.Lock = FileLock(path + ".lock") if not readOnly else None
+        if self.Lock is not None:
+            with self.Lock:
+                self.Open(mapIndex)
+        else:
+            self.Open(mapIndex)
+
+    def Open(self, mapIndex):
+        path = self.Path
+        header = (cacheFileMagic, cacheFileVersion, self.BlockSize, mapIndex, self.BlocksWide, self.BlocksHigh)
+        valid = False
+        if os.path.exists(path) and os.path.getsize(path) == self.DirectorySize:
+            with open(path, "rb") as f:
+                valid = cacheFileHeader.unpack(f.read(cacheFileHeader.size))[:6] == header
+
+        if not valid:
+            if self.ReadOnly:
+                raise ValueError(f"{path} is not a land cache file of map {mapIndex}")
+
+            # Missing, stale or foreign file, start from scratch; the segments are written again before being used
+            CreateFile(path, cacheFileHeader.pack(*header, 0), self.DirectorySize)
+
+        self.File = open(path, "rb" if self.ReadOnly else "r+b")
+        self.Map = self.MapFile(self.File)
+        self.RecordsCount = cacheFileHeader.unpack_from(self.Map, 0)[6]
+
+    def MapFile(self, f):
+        if self.ReadOnly:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return mmap.mmap(f.fileno(), 0)
+
+    # Map of a segment, mapping the ones written by another process, or by this one, the first time they're used
+    def GetSegment(self, segment):
+        while len(self.Segments) <= segment:
+            f = open(LandSegmentFilePath(self.Path, len(self.Segments)), "rb" if self.ReadOnly else "r+b")
+            self.Segments.append((f, self.MapFile(f)))
+
+        return self.Segments[segment][1]
+
+    def DirectoryPosition(self, blockX, blockY):
+        return cacheFileHeader.size + ((blockY * self.BlocksWide) + blockX) * directoryEntry.size
+
+    def Read(self, blockX, blockY):
+        record = directoryEntry.unpack_from(self.Map, self.DirectoryPosition(blockX, blockY))[0]
+        if record == 0:
+            return None
+
+        segment = self.GetSegment((record - 1) // recordsPerSegment)
+        offset = ((record - 1) % recordsPerSegment) * self.RecordSize
+
+        block = LandBlock(self.BlockSize)
+        block.TileIDs = array("H", segment[offset:offset + (self.TilesPerBlock * 2)])
+
+        bitmask = segment[offset + (self.TilesPerBlock * 2):offset + self.RecordSize]
+        for i in range(self.TilesPerBlock):
+            if bitmask[i >> 3] & (1 << (i & 7)):
+                block.Blocked[i] = 1
+
+        return block
+
+    def Write(self, blockX, blockY, block):
+        with self.Lock:
+            # Another process could have written records, or even this block, since the last write
+            self.RecordsCount = cacheFileHeader.unpack_from(self.Map, 0)[6]
+            if directoryEntry.unpack_from(self.Map, self.DirectoryPosition(blockX, blockY))[0] != 0:
+                return
+
+            self.WriteRecord(blockX, blockY, block)
+
+    def WriteRecord(self, blockX, blockY, block):
+        segmentIndex = self.RecordsCount // recordsPerSegment
+        offset = (self.RecordsCount % recordsPerSegment) * self.RecordSize
+        # The first record of a segment creates it, replacing the one of a stale file or of an interrupted write, if any
+        if offset == 0:
+            CreateFile(LandSegmentFilePath(self.Path, segmentIndex), b"", self.SegmentSize)
+
+        segment = self.GetSegment(segmentIndex)
+        segment[offset:offset + (self.TilesPerBlock * 2)] = block.TileIDs.tobytes()
+
+        bitmask = bytearray(self.RecordSize - (self.TilesPerBlock * 2))
+        for i in range(self.TilesPerBlock):
+            if block.Blocked[i]:
+                bitmask[i >> 3] |= (1 << (i & 7))
+        segment[offset + (self.TilesPerBlock * 2):offset + self.RecordSize] = bytes(bitmask)
+
+        # The directory and the count are written last, so that an interrupted write leaves the block simply not cached
+        self.RecordsCount += 1
+        directoryEntry.pack_into(self.Map, self.DirectoryPosition(blockX, blockY), self.RecordsCount)
+        directoryEntry.pack_into(self.Map, cacheFileHeader.size - directoryEntry.size, self.RecordsCount)
+
+    def Close(self):
+        for f, segment in self.Segments:
+            if not self.ReadOnly:
+                segment.flush()
+            segment.close()
+            f.close()
+
+        if not self.ReadOnly:
+            self.Map.flush()
+            self.Lock.Close()
+
+        self.Map.close()
+        self.File.close()
+
+class TileCache():
+    def __init__(self, landProvider, blockSize, cacheDirectory=None, maxBlocks=4096, landFlags=None):
+        self.Source = UncachedLandTiles(landProvider, blockSize, landFlags)
+        self.BlockSize = blockSize
+        self.CacheDirectory = cacheDirectory
+        self.MaxBlocks = maxBlocks
+        self.Blocks = OrderedDict()
+        self.Files = {}
+        self.Lock = Lock()
+
+        # Most lookups hit the same block of the previous one, so skip the LRU bookkeeping for those
+        self.LastBlockKey = None
+        self.LastBlock = None
+
+        if cacheDirectory and not os.path.exists(cacheDirectory):
+            os.makedirs(cacheDirectory)
+
+    def GetBlockFile(self, mapIndex):
+        blockFile = self.Files.get(mapIndex)
+        if blockFile is not None or mapIndex in self.Files:
+            return blockFile
+
+        if self.CacheDirectory and mapIndex >= 0 and mapIndex < len(mapSizes):
+            blocksWide, blocksHigh = MapBlocksSize(mapIndex, self.BlockSize)
+            path = LandBlockFilePath(self.CacheDirectory, mapIndex, self.BlockSize)
+            try:
+                blockFile = LandBlockFile(path, mapIndex, self.BlockSize, blocksWide, blocksHigh)
+            except OSError:
+                # A stale file still used by another radar, that can't be replaced; the map isn't saved on disk this time
+                blockFile = None
+
+        self.Files[mapIndex] = blockFile
+        return blockFile
+
+    def GetLandBlock(self, mapIndex, blockX, blockY):
+        key = (mapIndex, blockX, blockY)
+
+        with self.Lock:
+            if key == self.LastBlockKey:
+                return self.LastBlock
+
+            block = self.Blocks.get(key)
+            if block is not None:
+                self.Blocks.move_to_end(key)
+            else:
+                block = self.LoadBlock(mapIndex, blockX, blockY)
+                self.AddBlock(key, block)
+
+            self.LastBlockKey = key
+            self.LastBlock = block
+            return block
+
+    # Loads a block in the cache if it isn't already, returning whether it had to be loaded
+    def PrefetchBlock(self, mapIndex, blockX, blockY):
+        key = (mapIndex, blockX, blockY)
+
+        with self.Lock:
+            if key in self.Blocks:
+                return False
+
+            blockFile = self.GetStoredBlockFile(mapIndex, blockX, blockY)
+            if blockFile is not None:
+                block = blockFile.Read(blockX, blockY)
+                if block is not None:
+                    self.AddBlock(key, block)
+                    return True
+
+        block = self.Source.GetLandBlock(mapIndex, blockX, blockY)
+
+        with self.Lock:
+            # Loaded by a lookup in the meantime
+            if key in self.Blocks:
+                return False
+
+            if blockFile is not None:
+                blockFile.Write(blockX, blockY, block)
+
+            self.AddBlock(key, block)
+            return True
+
+    def AddBlock(self, key, block):
+        self.Blocks[key] = block
+        if len(self.Blocks) > self.MaxBlocks:
+            self.Blocks.popitem(last=False)
+
+    # Cache file that can hold a block, or None if it's not saved on disk
+    def GetStoredBlockFile(self, mapIndex, blockX, blockY):
+        blockFile = self.GetBlockFile(mapIndex)
+        if blockFile is not None and blockX >= 0 and blockY >= 0 and blockX < blockFile.BlocksWide and blockY < blockFile.BlocksHigh:
+            return blockFile
+
+        return None
+
+    def LoadBlock(self, mapIndex, blockX, blockY):
+        blockFile = self.GetStoredBlockFile(mapIndex, blockX, blockY)
+
+        if blockFile is not None:
+            block = blockFile.Read(blockX, blockY)
+            if block is not None:
+                return block
+
+        block = self.Source.GetLandBlock(mapIndex, blockX, blockY)
+
+        if blockFile is not None:
+            blockFile.Write(blockX, blockY, block)
+
+        return block
+
+    def GetLandTile(self, x, y, mapIndex):
+        size = self.BlockSize
+        blockX = x // size
+        blockY = y // size
+        block = self.GetLandBlock(mapIndex, blockX, blockY)
+        i = ((y - (blockY * size)) * size) + (x - (blockX * size))
+        return (block.TileIDs[i], block.Blocked[i] == 1)
+
+    def Close(self):
+        with self.Lock:
+            for blockFile in self.Files.values():
+                if blockFile is not None:
+                    blockFile.Close()
+
+            self.Files = {}
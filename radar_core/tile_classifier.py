@@ -0,0 +1,127 @@
+# Tile classifier by Smjert/Spasitjel
+#
+# Classifies land tile IDs as resource, rock or normal tiles through a lookup table with an entry for each possible tile ID,
+# so that classifying a tile costs a single index instead of a search in the tile lists.
+#
+# Each resource profile (for instance mountain or cave mining) has its own table, built once when the classifier is created;
+# supporting a new kind of resource only requires adding a profile with its tiles.
+#
+# A profile also says how its resources are gathered:
+#   Source: sourceLand if the resources are land tiles, like ore, or sourceStatics if they're statics, like trees,
+#           in which case its tables are indexed by static ID, and a tile is a resource if any of its statics is one
+#   BankWidth, BankHeight: the size in tiles of the resource banks
+#   Reach: how far, in tiles, the resources can be gathered from
+#   Skill: the profiles of the same skill share the banks, so the consumed banks and the marked spots too
+#
+# The profile tables hold the tile class (tileClassNormal, tileClassResource or tileClassRock) in bits 0-1,
+# while the land flags, which are the same for all the profiles, are kept in a separate table and read lazily
+# from the land provider the first time a tile ID is seen:
+#   bit 2: the tile is impassable
+#   bit 3: the flags have been read from the land provider
+# The impassable flags of the statics are kept the same way in another table, read with GetTileFlag(staticID, flagName).
+
+tileClassNormal = 0
+tileClassResource = 1
+tileClassRock = 2
+
+tileClassMask = 0x3
+tileFlagImpassable = 0x4
+tileFlagKnown = 0x8
+
+maxTileID = 0xFFFF
+
+sourceLand = "land"
+sourceStatics = "statics"
+
+class ResourceProfile():
+    def __init__(self, name, resourceTiles, rockTiles, bankWidth=8, bankHeight=8, reach=2, source=sourceLand, skill="Mining"):
+        self.Name = name
+        self.ResourceTiles = resourceTiles
+        self.RockTiles = rockTiles
+        self.BankWidth = bankWidth
+        self.BankHeight = bankHeight
+        self.Reach = reach
+        self.Source = source
+        self.Skill = skill
+
+class TileClassifier():
+    # landProvider is any object with GetLandFlag(tileID, flagName), like the Razor Enhanced Statics object;
+    # when it's None, all tiles are considered passable.
+    def __init__(self, profiles, landProvider=None):
+        self.Provider = landProvider
+        self.Flags = bytearray(maxTileID + 1)
+        self.StaticFlags = bytearray(maxTileID + 1)
+        self.Tables = {}
+        self.Profiles = {}
+
+        for profile in profiles:
+            self.Profiles[profile.Name] = profile
+            table = bytearray(maxTileID + 1)
+            # Resource tiles win over rock tiles if a tile is in both lists, same as the order they are checked in
+            for tileID in profile.RockTiles:
+                table[tileID] = tileClassRock
+            for tileID in profile.ResourceTiles:
+                table[tileID] = tileClassResource
+
+            self.Tables[profile.Name] = table
+
+        self.ProfileName = None
+        self.Profile = None
+        self.Classes = None
+        if len(profiles) > 0:
+            self.SetProfile(profiles[0].Name)
+
+    def SetProfile(self, name):
+        self.Classes = self.Tables[name]
+        self.ProfileName = name
+        self.Profile = self.Profiles[name]
+
+    def Classify(self, tileID):
+        return self.Classes[tileID]
+
+    def LoadFlags(self, tileID):
+        flags = tileFlagKnown
+        if self.Provider is not None and self.Provider.GetLandFlag(tileID, "Impassable"):
+            flags |= tileFlagImpassable
+
+        self.Flags[tileID] = flags
+        return flags
+
+    def IsImpassable(self, tileID):
+        flags = self.Flags[tileID]
+        if flags == 0:
+            flags = self.LoadFlags(tileID)
+
+        return (flags & tileFlagImpassable) != 0
+
+    # Class and flags of a tile in a single value, laid out as described above
+    def GetTileEntry(self, tileID):
+        flags = self.Flags[tileID]
+        if flags == 0:
+            flags = self.LoadFlags(tileID)
+
+        return self.Classes[tileID] | flags
+
+    def IsStaticImpassable(self, staticID):
+        flags = self.StaticFlags[staticID]
+        if flags == 0:
+            flags = tileFlagKnown
+            if self.Provider is not None and self.Provider.GetTileFlag(staticID, "Impassable"):
+                flags |= tileFlagImpassable
+
+            self.StaticFlags[staticID] = flags
+
+        return (flags & tileFlagImpassable) != 0
+
+    # Class of a tile from its statics, as (static ID, Z) pairs, for the profiles whose resources are statics
+    def ClassifyStatics(self, statics):
+        tileClass = tileClassNormal
+        for staticID, _ in statics:
+            staticClass = self.Classes[staticID]
+            if staticClass == tileClassResource:
+                return tileClassResource
+
+            if staticClass == tileClassRock:
+                tileClass = tileClassRock
+
+        return tileClass
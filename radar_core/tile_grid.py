@@ -0,0 +1,127 @@
+# Compact tiles grid by Smjert/Spasitjel
+#
+# The info of the visible tiles is kept in flat typed arrays, one per field, in row major order,
+# instead of in an object per tile, so that updating the grid doesn't allocate an object per tile,
+# and big grids stay small in memory:
+#   Classes: the tile class (see tile_classifier)
+#   Amounts: the number of reachable banks that are not consumed
+#   BankX, BankY: the coordinates of the bank the tile is in
+#   BankBits: the bit of that bank in the reachability masks, as given by a BankIndexer
+#   Blocked: 1 if the tile is impassable
+#   LandZ, TopZ: the Z of the land and of the highest land or statics top, only gathered for the Z-aware reachability
+#
+# Classes, Blocked and BankBits are directly the grids the reachability engine expects.
+# TileView gives access to a single tile by fields, for the code that isn't performance sensitive.
+
+from array import array
+
+class TileView():
+    __slots__ = ("Grid", "Index")
+
+    def __init__(self, grid, index):
+        self.Grid = grid
+        self.Index = index
+
+    @property
+    def Color(self):
+        return self.Grid.Classes[self.Index]
+
+    @property
+    def Amount(self):
+        return self.Grid.Amounts[self.Index]
+
+    @property
+    def BankX(self):
+        return self.Grid.BankX[self.Index]
+
+    @property
+    def BankY(self):
+        return self.Grid.BankY[self.Index]
+
+    @property
+    def Blocked(self):
+        return self.Grid.Blocked[self.Index] != 0
+
+class TileGrid():
+    def __init__(self, size):
+        self.Size = size
+        count = size * size
+        self.Classes = bytearray(count)
+        self.Amounts = array("H", bytes(2 * count))
+        self.BankX = array("i", bytes(4 * count))
+        self.BankY = array("i", bytes(4 * count))
+        self.BankBits = array("H", bytes(2 * count))
+        self.Blocked = bytearray(count)
+        self.LandZ = array("b", bytes(count))
+        self.TopZ = array("b", bytes(count))
+
+    def Index(self, row, col):
+        return (row * self.Size) + col
+
+    def Tile(self, row, col):
+        return TileView(self, self.Index(row, col))
+
+    def SetTile(self, row, col, tileClass, bankX, bankY, bankBit, blocked, landZ=0, topZ=0):
+        i = (row * self.Size) + col
+        self.Classes[i] = tileClass
+        self.Amounts[i] = 0
+        self.BankX[i] = bankX
+        self.BankY[i] = bankY
+        self.BankBits[i] = bankBit
+        self.Blocked[i] = 1 if blocked else 0
+        self.LandZ[i] = landZ
+        self.TopZ[i] = topZ
+
+    # A new grid with the tiles shifted by the movement, so that the tiles still visible keep their info.
+    # Also returns the grid coordinates of the tiles that entered it, which are left empty.
+    def Scrolled(self, deltaX, deltaY):
+        size = self.Size
+        grid = TileGrid(size)
+        exposedTiles = []
+
+        colStart = max(-deltaX, 0)
+        colEnd = min(size - deltaX, size)
+
+        for row in range(size):
+            oldRow = row + deltaY
+            if oldRow < 0 or oldRow >= size or colStart >= colEnd:
+                exposedTiles.extend((row, col) for col in range(size))
+                continue
+
+            start = (row * size) + colStart
+            end = (row * size) + colEnd
+            oldStart = (oldRow * size) + colStart + deltaX
+            oldEnd = (oldRow * size) + colEnd + deltaX
+
+            for old, new in ((self.Classes, grid.Classes), (self.Amounts, grid.Amounts), (self.BankX, grid.BankX),
+                             (self.BankY, grid.BankY), (self.BankBits, grid.BankBits), (self.Blocked, grid.Blocked),
+                             (self.LandZ, grid.LandZ), (self.TopZ, grid.TopZ)):
+                new[start:end] = old[oldStart:oldEnd]
+
+            exposedTiles.extend((row, col) for col in range(0, colStart))
+            exposedTiles.extend((row, col) for col in range(colEnd, size))
+
+        return (grid, exposedTiles)
+
+    # Sets the amounts of a rectangle, given in row major order; rows and cols ends are excluded
+    def SetAmounts(self, rowStart, rowEnd, colStart, colEnd, amounts):
+        width = colEnd - colStart
+        i = 0
+        for row in range(rowStart, rowEnd):
+            start = (row * self.Size) + colStart
+            self.Amounts[start:start + width] = array("H", amounts[i:i + width])
+            i += width
+
+    # Zeroes the amounts of the tiles outside of a rectangle; rows and cols ends are excluded
+    def ClearAmountsOutside(self, rowStart, rowEnd, colStart, colEnd):
+        size = self.Size
+        emptyRow = array("H", bytes(2 * size))
+
+        for row in range(size):
+            start = row * size
+            if row < rowStart or row >= rowEnd:
+                self.Amounts[start:start + size] = emptyRow
+                continue
+
+            self.Amounts[start:start + colStart] = emptyRow[0:colStart]
+            self.Amounts[start + colEnd:start + size] = emptyRow[colEnd:size]
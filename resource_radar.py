@@ -11,29 +11,42 @@
 # Finally, the radar also supports showing which specific banks are reached from each tile; just click on a tile with a number and the radar will highlight the reachable banks.
 # Moving will reset the highghtlight status.
 #
-# Currently only Mining resource banks are supported.
+# Mining and Lumberjacking resource banks are supported; hit P to switch between them, each one has its own marked spots file.
 #
-# The marked spots file format currently has one line per marked spot, and each line is:
+# The marked spots are saved in a binary file, which is read only around where the player is (see radar_core/spots_store.py);
+# it can be converted from and to a text format, which has one line per marked spot, and each line is:
 # <Marked Spot X>,<Marked Spot Y>,<Marked Spot Map Index>|<Resource Tile1 X>,<Resource Tile1 Y>|<Resource Tile2 X>,<Resource Tile2 Y>|[...]
 #
 # The Map Index is the Player.Map value.
+#
+# The radar_core folder has to be placed next to this script.
 
 import clr
-import os
-from threading import Lock
+import time
+from array import array
+from threading import Lock, Event
 from ctypes import windll
 
 clr.AddReference("System.Windows.Forms")
 clr.AddReference("System.Drawing")
 
 from System.Windows.Forms import Form, Application, FormBorderStyle, Padding, MouseButtons, OpenFileDialog
-from System.Drawing import Point, Size, Font, Pen, Color, Rectangle, SolidBrush, FontFamily, StringFormat, StringAlignment
-from System import Char, String, EventHandler, Array
+from System.Drawing import Point, Size, Font, Pen, Color, Rectangle, SolidBrush, FontFamily, StringFormat, StringAlignment, Bitmap, Graphics, GraphicsUnit
+from System.Drawing.Imaging import PixelFormat
+from System.Drawing.Text import TextRenderingHint
+from System import Char, String, EventHandler
 from System.Collections.Generic import List
-from System.Threading import Thread, ParameterizedThreadStart
+from System.Threading import Thread, ThreadStart, ParameterizedThreadStart
 from System import Action
 from System.Windows.Forms.SystemInformation import VerticalScrollBarWidth, HorizontalScrollBarHeight
 
+from radar_core.tile_classifier import tileClassResource, tileClassRock
+from radar_core.radar_engine import RadarEngine, EdgeBands
+from radar_core.scheduler import RefreshScheduler
+from radar_core.profiler import FrameProfiler, NullProfiler, Instrumented
+from radar_core.session_trace import SessionRecorder, NullRecorder, TraceSettings
+from utilities.misc import WorldOverlay
+
 # SETTINGS
 #
 # Color settings; you can find the premade ones here: https://learn.microsoft.com/en-us/dotnet/api/system.drawing.color?view=net-8.0
@@ -54,8 +67,25 @@ tilePxSize = 22
 # The radar is always a square; this is the distance from the player position to the furthest tile.
 # (The formula then multiplies this by 2 and adds 1 for the center tile, where the player is)
 visibleRange = 16
-# How often to refresh the map, when moving. 1 tick = 100ms.
-mapUpdateTicks = 5
+# The radar window shows at most this many tiles from the player, one cell per tile; when visibleRange is bigger,
+# the whole area can be seen by zooming out with the mouse wheel, where each cell is a bank.
+detailRange = 16
+# How long, in milliseconds, it takes at most for the radar to notice that the player moved.
+moveLatency = 50
+# While moving continuously, like when running, the radar is refreshed at most this often, in milliseconds,
+# for the latest position only.
+refreshInterval = 250
+# After standing still for idleAfter milliseconds, the position is only checked every idleLatency milliseconds.
+idleLatency = 500
+idleAfter = 2000
+# How long, in milliseconds, it takes at most for a hotkey to be handled.
+hotKeyLatency = 100
+# When moving, shift the already known tiles and only query the newly exposed rows and columns,
+# instead of querying the whole visible area again. Set to False to always do a full refresh.
+scrollingUpdate = True
+# While walking, load in the background this many tiles beyond the visible area in the direction you're heading,
+# so that new areas are already known when you get there. Set to 0 to disable it.
+prefetchDistance = 16
 
 # Relative path to the file where the marked spots are saved and loaded.
 #
@@ -67,63 +97,77 @@ mapUpdateTicks = 5
 # then the root should be again where the executable is.
 # If you are executing it through a .bat file, then the root folder is where the .bat file is located,
 # unless you changed directory in the batch file before executing.
-markedSpotsFilePath = "mining-spots.txt"
+# The radars of several clients can use the same file: each one sees the spots saved by the others within hotKeyLatency.
+markedSpotsFilePath = "mining-spots.bin"
+# Text file with the marked spots saved by older versions; it's imported the first time the radar runs.
+legacyMarkedSpotsFilePath = "mining-spots.txt"
+# The same for the lumberjacking spots; it's only opened the first time the radar is switched to lumberjacking.
+lumberjackingSpotsFilePath = "lumberjacking-spots.bin"
+
+# Relative path to the folder where the land tiles are cached between sessions, so that areas
+# already visited don't need to be queried again. The same path limitations as above apply.
+# Set it to None to only cache them in memory. The radars of several clients can share it, so tiles are only queried once.
+landCacheDirectory = "radar-land-cache"
+# How many blocks of 8x8 land tiles are kept in memory; the statics and the heights, when they're used, are kept the same way.
+landCacheBlocks = 4096
+
+# Relative path to the folder with the heatmaps built by radar_core/heatmap.py, which have the reachable banks
+# of every tile already computed; areas not covered by them are computed live. Set it to None to always compute them live.
+heatmapDirectory = "radar-heatmaps"
+
+# Which resource tiles are shown and counted when the radar starts: "Mining" for all the ore, "Mountain" or "Cave" for only one kind,
+# or "Lumberjacking" for the trees. The profiles are defined in radar_core/mining_tiles.py and radar_core/lumberjacking_tiles.py.
+resourceProfile = "Mining"
+
+# How the reachable banks of a tile are counted: "window" counts every resource tile within 2 tiles, which is the cheapest;
+# "z" only counts the ones in line of sight, from the heights of the land and the statics, like servers check,
+# which queries Statics about three times as much for new tiles and doesn't use the heatmaps.
+reachabilityMode = "window"
+
+# How many minutes the resource banks take to respawn after you gathered them, on your shard; set it to None if they never do.
+# The banks of a saved spot are shown as consumed, and left out of the counts, only until they respawn;
+# the spots saved by older versions of the radar don't have the time they were saved at, so their banks are considered respawned.
+bankRespawnMinutes = None
 
 # Keyboard key to use to save a spot
 saveASpotKey = 'S'
+# Keyboard key to use to switch to the next of the switchProfiles
+switchProfileKey = 'P'
+switchProfiles = ["Mining", "Lumberjacking"]
+
+# Set it to True to also show the marked spots and the consumed banks in the game world, as fake items only you can see:
+# worldMarkedSpotItem on each marked spot, and worldConsumedBankItem in the middle of each consumed bank, both colored worldOverlayHue.
+# Only the ones that changed are sent to the client, when the radar changes.
+worldOverlayEnabled = False
+worldMarkedSpotItem = 0x1F14 # Recall rune
+worldConsumedBankItem = 0x19B9 # Ore
+worldOverlayHue = 0x0021
+# Tiles from the player beyond which the client deletes the items, its update range; only the ones within it are sent
+worldOverlayRange = 18
+
+# Set it to True to find out what makes the radar slow: how long each part of it takes, and how many Statics calls it does,
+# are shown on the radar and written to profilerTraceFilePath when it's closed, as JSON if the path ends with .json, as CSV otherwise.
+# It makes the radar a bit slower, so keep it off otherwise.
+profilerEnabled = False
+profilerTraceFilePath = "radar-profile.csv"
+
+# Set it to a file path, like "radar-session.trace", to record the session: your moves, your hotkeys and what the radar gets from Statics.
+# It can then be replayed outside of the client to find out where the radar is slow, or to check that a new version counts the same,
+# see radar_core/session_trace.py. While recording the land cache on disk is not used, so that every tile gets in the trace.
+sessionTraceFilePath = None
 
 ###################################################################################################
-# The majority of you don't need to modify this, but if you find a tile that you would like to add
-# or remove from the list of resource tiles, then this can be done here.
-#
-# The current selection is made so that only tiles that should be always reachable or visible are in the list.
-# There may be some tiles that in some occasions are considered resource tiles and reachable,
-# but in the majority of cases due to where they are used in the map and for the ServUO line of sight calculations,
-# they aren't.
+# The resource tiles are in radar_core/mining_tiles.py and radar_core/lumberjacking_tiles.py; the majority of you don't need to modify them,
+# but if you find a tile that you would like to add or remove from the list of resource tiles, then this can be done there.
 ###################################################################################################
 
-mountainResourceTiles = [0xDC, 0xDD, 0xDE, 0xDF, 0xE0, 0xE1, 0xE2, 0xE3, 0xE4, 0xE5, 0xE6,
-                         0xE7, 0xEC, 0xED, 0xEE, 0xEF, 0xF0, 0xF1, 0xF2, 0xF3, 0xF4,
-                         0xF5, 0xF6, 0xF7, 0xFC, 0xFD, 0xFE, 0xFF, 0x100, 0x101, 0x102,
-                         0x103, 0x104, 0x105, 0x106, 0x107, 0x10C, 0x10D, 0x10E, 0x10F, 0x110,
-                         0x111, 0x112, 0x113, 0x114, 0x115, 0x116, 0x117, 0x11E, 0x11F, 0x120,
-                         0x121, 0x122, 0x123, 0x124, 0x125, 0x126, 0x127, 0x128, 0x129, 0x141,
-                         0x142, 0x143, 0x144, 0x1D3, 0x1D4, 0x1D5, 0x1D6, 0x1D7, 0x1D8, 0x1D9,
-                         0x1DA, 0x1DC, 0x1DD, 0x1DE, 0x1DF, 0x1E0, 0x1E1, 0x1E2, 0x1E3, 0x1E4,
-                         0x1E5, 0x1E6, 0x1E7, 0x1EC, 0x1ED, 0x1EE, 0x1EF, 0x231, 0x232, 0x233, 0x234, 0x235,
-                         0x236, 0x237, 0x238, 0x239, 0x23A, 0x23B, 0x23C, 0x23D, 0x23E, 0x23F,
-                         0x240, 0x241, 0x242, 0x243, 0x6CD, 0x6CE, 0x6CF, 0x6D0, 0x6D1, 0x6D2,
-                         0x6D3, 0x6D4, 0x6D5, 0x6D6, 0x6D7, 0x6D8, 0x6D9, 0x709, 0x70A, 0x70B,
-                         0x70C, 0x70D, 0x70E, 0x70F, 0x710, 0x711, 0x713, 0x714, 0x715, 0x716,
-                         0x717, 0x718, 0x719, 0x71A, 0x71B, 0x71C, 0x727, 0x728, 0x729, 0x72A,
-                         0x72B, 0x72C, 0x72D, 0x72E, 0x72F, 0x730,
-                         0x731, 0x732, 0x733, 0x734, 0x735, 0x736, 0x737, 0x738, 0x739, 0x73A,
-                         0x7BD, 0x7BE, 0x7BF, 0x7C0, 0x7C1, 0x7C2, 0x7C3, 0x7C4, 0x7C5, 0x7C6, 0x7C7, 0x7C8,
-                         0x7C9, 0x7CA, 0x7CB, 0x7CC, 0x7CD, 0x7CE, 0x7CF, 0x7D0]
-
-caveResourceTiles = [0x245, 0x246, 0x247, 0x248, 0x249, 0x24A,
-                     0x24B, 0x24C, 0x24D, 0x24E, 0x24F, 0x250, 0x251, 0x252, 0x253, 0x254,
-                     0x255, 0x256, 0x257, 0x258, 0x259, 0x262, 0x263, 0x264, 0x265]
-
-# These are not resource tiles, but we still want to draw them differently from normal tiles
-# Normally part of the mountains
-rockTiles = [0x21F, 0x220, 0x221, 0x222, 0x223, 0x224, 0x225, 0x226, 0x227, 0x228,
-             0x229, 0x22A, 0x22B, 0x22C, 0x22D, 0x22E, 0x22F, 0x230, 0x3F2, 0x6DA,
-             0x6DB, 0x6DC, 0x6DD, 0x6EB, 0x6EC, 0x6ED, 0x6EE, 0x6EF, 0x6F0, 0x6F1,
-             0x6F2, 0x6F3, 0x6F4, 0x6F5, 0x6F6, 0x6F7, 0x6F8, 0x6F9, 0x6FA, 0x6FB,
-             0x6FC, 0x6FD, 0x6FE, 0x71D, 0x71E, 0x71F, 0x720, 0x73B, 0x73C, 0x73D,
-             0x73E, 0x745, 0x746, 0x747, 0x748, 0x749, 0x74A, 0x74B, 0x74C, 0x74D,
-             0x74E, 0x74F, 0x750, 0x751, 0x752, 0x753, 0x754, 0x755, 0x756, 0x757,
-             0x758, 0x759, 0x75A, 0x75B, 0x75C, 0x7D1, 0x7D2, 0x7D3, 0x7D4, 0x7EC,
-             0x7ED, 0x7EE, 0x7EF, 0x7F0, 0x7F1, 0x834, 0x835, 0x836, 0x837, 0x838,
-             0x839, 0x453B, 0x453C, 0x453D, 0x453E, 0x453F, 0x4540, 0x4541, 0x4542,
-             0x4543, 0x4544, 0x4545, 0x4546, 0x4547, 0x4548, 0x4549, 0x454A, 0x454B,
-             0x454C, 0x454D, 0x454E, 0x454F]
-
 ###################################################################################################
 # DO NOT MODIFY BELOW HERE (Unless you know what you're doing)
 ###################################################################################################
 
+# How long, in milliseconds, saving a spot waits for the radar to catch up with the player position
+saveWaitTimeout = 2000
+
 # Note, due to specifics on how a line is drawn, and which coordinates are used,
 # that I have to better look into, increasing this value causes all the drawing offsets to be wrong.
 # Keep it at 1 for now.
@@ -140,70 +184,81 @@ tileNormalTextBrush = SolidBrush(tileNormalTextColor)
 consumedTileTextBrush = SolidBrush(consumedTileTextColor)
 markedTileTextBrush = SolidBrush(markedTileTextColor)
 
+tileStringFormat = StringFormat()
+tileStringFormat.Alignment = StringAlignment.Center
+tileStringFormat.LineAlignment = StringAlignment.Center
+
 gridLinesDistance = tilePxSize + gridLinesWidth
-visibleTiles = (visibleRange * 2) + 1
-centerTile = int(visibleTiles / 2)
-scanRange = int(visibleTiles / 2) - 2
 
-# This is a single value since ore banks are squares, but will need to be split in X and Y for lumberjacking and maybe others
-bankSize = 8
+# The banks are as big as the resource profile says, 8x8 tiles for the ore and 4x3 for the trees; set it to a number of tiles
+# to make the banks of all the profiles that big squares instead.
+bankSize = None
 # This is the number of maps present in a OSI like shards. Used to store map specific tile state.
 numberOfMaps = 6
 
-mineableTiles = []
-mineableTiles.extend(mountainResourceTiles)
-mineableTiles.extend(caveResourceTiles)
-
-class TileInfo():
-    def __init__(self, color, amount, bankX, bankY, blocked):
-        self.Color = color
-        self.Amount = amount
-        self.BankX = bankX
-        self.BankY = bankY
-        self.Blocked = blocked
-        self.MineableTiles = []
-
-class MapState():
-    def __init__(self, size):
-        self.GridRows = [0] * (size + 1)
-        self.GridCols = [0] * (size + 1)
-        self.TilesInfo = Array.CreateInstance(TileInfo, size, size)
-        for row in range(size):
-            for col in range(size):
-                self.TilesInfo[row, col] = TileInfo(0, 0, 0, 0, False)
-                
-        self.Size = size
-        self.MarkedSpots = [[] for _ in range(numberOfMaps)]
-        self.ConsumedBanks = [[] for _ in range(numberOfMaps)]
-           
-mapState = MapState(visibleTiles)
-mapStateLock = Lock()
-
-radarLock = Lock()
-
-def FilterVisibleConsumedBanks(centerX, centerY):
-    filteredBanks = []
-    
-    minX, minY = GridToWorldCoords(0, 0, centerX, centerY)
-    maxX, maxY = GridToWorldCoords(visibleTiles - 1, visibleTiles - 1, centerX, centerY)
-    
-    minBankX = int(minX / bankSize)
-    maxBankX = int(maxX / bankSize)
-
-    minBankY = int(minY / bankSize)
-    maxBankY = int(maxY / bankSize)
-    
-    mapConsumedBanks = mapState.ConsumedBanks[Player.Map]
-    
-    # Filter only the banks that are visible
-    for coords in mapConsumedBanks:
-        if coords[0] >= minBankX and coords[0] <= maxBankX and coords[1] >= minBankY and coords[1] <= maxBankX:
-            filteredBanks.append((coords[0], coords[1]))
-            
-    return filteredBanks
-
-def GridToWorldCoords(col, row, centerX, centerY):
-    return (centerX + (col - centerTile), centerY + (row - centerTile))
+profiler = FrameProfiler() if profilerEnabled else NullProfiler()
+
+# In seconds, as the engine takes it
+bankRespawnTime = bankRespawnMinutes * 60 if bankRespawnMinutes is not None else None
+
+if sessionTraceFilePath is not None:
+    recorder = SessionRecorder(sessionTraceFilePath, TraceSettings(visibleRange, bankSize, resourceProfile, moveLatency, idleLatency,
+                                                                   idleAfter, refreshInterval, hotKeyLatency, reachabilityMode,
+                                                                   bankRespawnTime))
+else:
+    recorder = NullRecorder()
+
+player = recorder.WrapPlayer(Player)
+
+# Marked spots file of each skill, and the text one imported the first time it's opened
+spotsFilePaths = {"Mining": (markedSpotsFilePath, legacyMarkedSpotsFilePath), "Lumberjacking": (lumberjackingSpotsFilePath, None)}
+
+# Everything the radar shows is computed by the engine, see radar_core/radar_engine.py; the radar only draws its published state
+engine = RadarEngine(recorder.WrapLand(Statics), visibleRange, bankSize, numberOfMaps, resourceProfile,
+                     landCacheDirectory if not recorder.Enabled else None, landCacheBlocks, heatmapDirectory, scrollingUpdate, profiler,
+                     prefetchDistance, reachabilityMode, bankRespawnTime)
+visibleTiles = engine.VisibleTiles
+centerTile = engine.CenterTile
+
+# Tiles shown when zoomed in, and the grid row and column of the first one
+viewTiles = (min(visibleRange, detailRange) * 2) + 1
+viewCenterTile = int(viewTiles / 2)
+viewOffset = centerTile - viewCenterTile
+viewPxSize = (viewTiles * gridLinesDistance) + 1
+
+# Banks shown when zoomed out, for banks of bankWidth x bankHeight tiles: enough of them to cover the grid however it's aligned to them,
+# and the distance between their cells, which are as wide and high as the radar allows, so they're squares only if the banks are
+class OverviewLayout():
+    def __init__(self, bankWidth, bankHeight):
+        self.BankWidth = bankWidth
+        self.BankHeight = bankHeight
+        self.BanksWide = int((visibleTiles + bankWidth - 1) / bankWidth) + 1
+        self.BanksHigh = int((visibleTiles + bankHeight - 1) / bankHeight) + 1
+        self.CellDistanceX = int((viewPxSize - 1) / self.BanksWide)
+        self.CellDistanceY = int((viewPxSize - 1) / self.BanksHigh)
+
+# Layout of each banks size, computed once
+overviewLayouts = {}
+
+def GetOverviewLayout(state):
+    key = (state.BankWidth, state.BankHeight)
+    layout = overviewLayouts.get(key)
+    if layout is None:
+        layout = OverviewLayout(state.BankWidth, state.BankHeight)
+        overviewLayouts[key] = layout
+
+    return layout
+
+statsFont = Font(FontFamily.GenericMonospace, 8)
+statsTextBrush = SolidBrush(Color.White)
+statsBackgroundBrush = SolidBrush(Color.FromArgb(192, 0, 0, 0))
+
+radarLock = Instrumented(Lock(), profiler, "radarLock")
+
+worldOverlay = WorldOverlay(PacketLogger) if worldOverlayEnabled else None
+# Land height of the world overlay items, by (map, x, y)
+worldOverlayHeights = {}
+worldOverlayState = None
 
 def ShowRadar(radar):
     Application.Run(radar)
@@ -217,17 +272,36 @@ class Radar(Form):
         self.AutoScroll = False
         self.IsShown = False
         self.Font = Font(FontFamily.GenericMonospace, 12)
-        self.ClientSize = Size((visibleTiles * gridLinesDistance) + 1, (visibleTiles * gridLinesDistance) + 1)
+        self.ClientSize = Size(viewPxSize, viewPxSize)
         self.Load += self.OnFormLoad
         
         self.Paint += self.OnPaint
         self.FormClosing += self.OnRadarClosing
         self.Shown += self.OnShown
         self.MouseClick += self.OnMouseClick
+        self.MouseWheel += self.OnRadarMouseWheel
+
+        # Banks reachable from the clicked tile, and the map, position and profile of the state they have been found in
+        self.HighlightedBanks = set()
+        self.HighlightedAt = None
+
+        # When zoomed out each cell is a bank, otherwise a tile
+        self.ZoomedOut = False
 
-        self.VisibleConsumedBanks = []
-        self.HighlightedBanks = []
-        self.PlayerPosition = (0, 0)
+        # The grid lines and the tiles fills are drawn on a bitmap, only when the tiles change, and copied on each repaint;
+        # the spare bitmap is where the background is shifted into when moving.
+        self.BackgroundBitmap = None
+        self.SpareBitmap = None
+        # The state the background has been drawn from
+        self.BackgroundState = None
+
+        self.Glyphs = GlyphCache()
+        self.FontChanged += self.OnRadarFontChanged
+
+        # Profiler stats drawn over the radar, when profiling, where they have been drawn, and when they have been collected
+        self.StatsLines = []
+        self.StatsRectangle = None
+        self.StatsAt = None
  
 
     def OnFormLoad(self, sender, args):
@@ -236,162 +310,473 @@ class Radar(Form):
         windll.user32.SetWindowPos(hwnd, -1, 0, 0, 0, 0, 1|2)
         
     def OnMouseClick(self, args):
-        global radarLock
-        
-        if args.Button == MouseButtons.Left:
-            with radarLock:
-                col = int(args.X / gridLinesDistance)
-                row = int(args.Y / gridLinesDistance)
-
-                tileInfo = mapState.TilesInfo[row, col]
-
-                self.HighlightedBanks = []
-
-                for mineableCoords in tileInfo.MineableTiles:
-                    bankX = int(mineableCoords[0] / bankSize)
-                    bankY = int(mineableCoords[1] / bankSize)
+        if args.Button == MouseButtons.Left and not self.ZoomedOut:
+            col = int(args.X / gridLinesDistance) + viewOffset
+            row = int(args.Y / gridLinesDistance) + viewOffset
+
+            state = engine.State
+            mineableTiles = engine.GetMineableTiles(state, row, col)
+
+            highlightedBanks = set()
+
+            for mineableCoords in mineableTiles:
+                bankX = int(mineableCoords[0] / state.BankWidth)
+                bankY = int(mineableCoords[1] / state.BankHeight)
+
+                highlightedBanks.add((bankX, bankY))
+
+            # Only the tiles of the banks that were highlighted, or are now, have to be redrawn
+            changedBanks = highlightedBanks
+            if self.HighlightedAt == (state.Map, state.CenterX, state.CenterY, state.Profile):
+                changedBanks = highlightedBanks ^ self.HighlightedBanks
+
+            self.HighlightedBanks = highlightedBanks
+            self.HighlightedAt = (state.Map, state.CenterX, state.CenterY, state.Profile)
+
+            tiles = state.Tiles
+            dirtyTiles = []
+            for row in range(viewOffset, viewOffset + viewTiles):
+                i = (row * tiles.Size) + viewOffset
+                for col in range(viewOffset, viewOffset + viewTiles):
+                    if (tiles.BankX[i], tiles.BankY[i]) in changedBanks:
+                        dirtyTiles.append((col, row))
+                    i += 1
+
+            self.InvalidateTiles(dirtyTiles)
+
+    # Zooming only changes how the already computed state is drawn
+    def OnRadarMouseWheel(self, sender, args):
+        zoomedOut = args.Delta < 0
+        if zoomedOut != self.ZoomedOut:
+            self.ZoomedOut = zoomedOut
+            self.Invalidate()
+
+    # Invalidates the tiles, given as grid (col, row), or the whole radar if None
+    def InvalidateTiles(self, dirtyTiles):
+        # The stats are drawn each time something is, so they have to be redrawn completely
+        if self.StatsRectangle is not None:
+            self.Invalidate(self.StatsRectangle)
+
+        # The banks cells are few, they're always redrawn all together
+        if dirtyTiles is None or self.ZoomedOut:
+            self.Invalidate()
+            return
 
-                    if (bankX, bankY) not in self.HighlightedBanks:
-                        self.HighlightedBanks.append((bankX, bankY))
-                        
-                self.Refresh()
+        for col, row in dirtyTiles:
+            viewCol = col - viewOffset
+            viewRow = row - viewOffset
+            if viewCol >= 0 and viewCol < viewTiles and viewRow >= 0 and viewRow < viewTiles:
+                self.Invalidate(TileRectangle(viewCol, viewRow))
             
     def OnShown(self, args):
         self.IsShown = True
         
+    def UpdateBackground(self, state):
+        background = self.BackgroundState
+        # States published again after saving a spot share the tiles with the one they have been copied from
+        if background is not None and background.Tiles is state.Tiles:
+            return
+
+        if self.BackgroundBitmap is None:
+            width = self.ClientSize.Width
+            height = self.ClientSize.Height
+            self.BackgroundBitmap = Bitmap(width, height, PixelFormat.Format32bppPArgb)
+            self.SpareBitmap = Bitmap(width, height, PixelFormat.Format32bppPArgb)
+
+        deltaX = state.CenterX - background.CenterX if background is not None else 0
+        deltaY = state.CenterY - background.CenterY if background is not None else 0
+
+        # The banks boundaries and the resource tiles of another profile are all different
+        if (background is not None and background.Map == state.Map and background.Profile is state.Profile
+            and abs(deltaX) < viewTiles and abs(deltaY) < viewTiles):
+            # Shift what is still visible, then only draw the rows and columns that entered the view
+            g = Graphics.FromImage(self.SpareBitmap)
+            g.DrawImageUnscaled(self.BackgroundBitmap, -deltaX * gridLinesDistance, -deltaY * gridLinesDistance)
+            self.BackgroundBitmap, self.SpareBitmap = self.SpareBitmap, self.BackgroundBitmap
+
+            for band in EdgeBands(0, viewTiles, deltaX, deltaY):
+                DrawBackground(g, state, band)
+        else:
+            g = Graphics.FromImage(self.BackgroundBitmap)
+            DrawBackground(g, state, (0, viewTiles, 0, viewTiles))
+
+        g.Dispose()
+        self.BackgroundState = state
+
     def OnPaint(self, args):
-        global mapStateLock
-             
         g = args.Graphics
-        
-        # Draw base grid
-        with mapStateLock:
-            for r in range(0, visibleTiles + 1):
-                if mapState.GridRows[r] == 1:
-                    g.DrawLine(bankBoundariesPen, 0, r * gridLinesDistance, gridLinesDistance * visibleTiles, r * gridLinesDistance)
-                else:
-                    g.DrawLine(gridPen, 0, r * gridLinesDistance, gridLinesDistance * visibleTiles, r * gridLinesDistance)
-                
-            for c in range(0, visibleTiles + 1):
-                if mapState.GridCols[c] == 1:
-                    g.DrawLine(bankBoundariesPen, c * gridLinesDistance, 0, c * gridLinesDistance, gridLinesDistance * visibleTiles)
-                else:
-                    g.DrawLine(gridPen, c * gridLinesDistance, 0, c * gridLinesDistance, gridLinesDistance * visibleTiles)
-                
-            # Draw the colored tiles
-            rockTiles = List[Rectangle]()
-            resourceTiles = List[Rectangle]()
-            normalTiles = List[Rectangle]()
+        profiler.BeginFrame("paint")
+
+        # The published state is never modified, so it doesn't need to be locked while drawing
+        state = engine.State
+        highlightedBanksCoords = self.HighlightedBanks if self.HighlightedAt == (state.Map, state.CenterX, state.CenterY, state.Profile) else set()
+
+        # The texts are copied from the glyph cache, which is much faster than laying them out each time
+        self.Glyphs.SetFont(self.Font)
+
+        if self.ZoomedOut:
+            with profiler.Phase("overview"):
+                self.PaintOverview(g, state, highlightedBanksCoords)
+        else:
+            self.PaintTiles(g, state, highlightedBanksCoords, args.ClipRectangle)
+
+        profiler.EndFrame()
+
+        if profiler.Enabled:
+            self.PaintStats(g)
+
+    def PaintTiles(self, g, state, highlightedBanksCoords, clip):
+        # Only the tiles in the area to repaint are drawn; the loops are on the view rows and columns
+        colStart = max(int(clip.Left / gridLinesDistance), 0)
+        colEnd = min(int((clip.Right - 1) / gridLinesDistance) + 1, viewTiles)
+        rowStart = max(int(clip.Top / gridLinesDistance), 0)
+        rowEnd = min(int((clip.Bottom - 1) / gridLinesDistance) + 1, viewTiles)
+
+        # Draw the grid and the tiles
+        with profiler.Phase("background"):
+            self.UpdateBackground(state)
+            g.DrawImage(self.BackgroundBitmap, clip, clip, GraphicsUnit.Pixel)
+
+        with profiler.Phase("overlays"):
+            # Draw the overlays
             highlightedTiles = List[Rectangle]()
             tilesWithBankCount = []
             markedTiles = []
             consumedTiles = []
 
-            markedTilesCoords = mapState.MarkedSpots[Player.Map]
-            consumedBanksCoords = self.VisibleConsumedBanks
-            highlightedBanksCoords = self.HighlightedBanks
-
-            for row in range(0, visibleTiles):
-                for col in range(0, visibleTiles):
-                    startX = (col * gridLinesDistance) + gridLinesWidth
-                    startY = (row * gridLinesDistance) + gridLinesWidth
-                    
-                    tileInfo = mapState.TilesInfo[row, col]
-
-                    rect = Rectangle(startX, startY, tilePxSize, tilePxSize)
-                    
-                    if tileInfo is None:
-                        normalTiles.Add(rect)
-                        continue 
-                    
-                    if tileInfo.Color == 1:
-                        resourceTiles.Add(rect)
-                    elif tileInfo.Color == 2:
-                        rockTiles.Add(rect)
-                    else:
-                        normalTiles.Add(rect)
-
-                    tileWorldX, tileWorldY = GridToWorldCoords(col, row, self.PlayerPosition[0],  self.PlayerPosition[1])
-                    bankX = int(tileWorldX / bankSize)
-                    bankY = int(tileWorldY / bankSize) 
-
-                    if tileInfo.Color == 1 and (bankX, bankY) in consumedBanksCoords:
+            markedTilesCoords = state.VisibleMarkedSpots
+            consumedBanksCoords = state.VisibleConsumedBanks
+
+            # Read the tiles arrays directly, the tile views are too slow for this
+            tiles = state.Tiles
+            classes = tiles.Classes
+            amounts = tiles.Amounts
+            tilesBankX = tiles.BankX
+            tilesBankY = tiles.BankY
+            originX, originY = engine.GridToWorldCoords(viewOffset, viewOffset, state.CenterX, state.CenterY)
+
+            for row in range(rowStart, rowEnd):
+                i = ((row + viewOffset) * visibleTiles) + colStart + viewOffset
+                for col in range(colStart, colEnd):
+                    bank = (tilesBankX[i], tilesBankY[i])
+
+                    if classes[i] == tileClassResource and bank in consumedBanksCoords:
                         consumedTiles.append((col, row))
-                    elif (tileWorldX, tileWorldY) in markedTilesCoords:
+                    elif (originX + col, originY + row) in markedTilesCoords:
                         markedTiles.append((col, row))
-                    elif tileInfo.Amount > 0:
-                        tilesWithBankCount.append((col, row, tileInfo.Amount))
+                    elif amounts[i] > 0:
+                        tilesWithBankCount.append((col, row, amounts[i]))
+
+                    if bank in highlightedBanksCoords:
+                        highlightedTiles.Add(TileRectangle(col, row))
+
+                    i += 1
+
+            if highlightedTiles.Count > 0:
+                g.FillRectangles(bankHighlightBrush, highlightedTiles.ToArray())
+
+            # Draw player pos
+            g.FillRectangle(playerTileBrush, TileRectangle(viewCenterTile, viewCenterTile))
+
+        with profiler.Phase("texts"):
+            # Draw an X on mineable tiles that are reachable from marked spots
+            glyph = self.Glyphs.Get("X", consumedTileTextBrush)
+            for consumedTile in consumedTiles:
+                DrawGlyph(g, glyph, TileRectangle(consumedTile[0], consumedTile[1]))
+
+            # Drawn an M on tiles we marked a rune on
+            glyph = self.Glyphs.Get("M", markedTileTextBrush)
+            for markedTile in markedTiles:
+                DrawGlyph(g, glyph, TileRectangle(markedTile[0], markedTile[1]))
+
+            # Draw count of ore banks
+            for tileBankInfo in tilesWithBankCount:
+                DrawGlyph(g, self.Glyphs.Get(f"{tileBankInfo[2]}", tileNormalTextBrush), TileRectangle(tileBankInfo[0], tileBankInfo[1]))
+
+    # Draws a cell per bank, with the best count of its tiles, or an X if it's consumed
+    def PaintOverview(self, g, state, highlightedBanksCoords):
+        overview = state.Overview
+        if overview is None:
+            # The worker builds it only while zoomed out; storing it on the published state is harmless,
+            # since it's the same whoever builds it, and the UI thread is the only one reading it from there
+            overview = BuildOverview(state)
+            state.Overview = overview
+
+        layout = overview.Layout
+        cellWidth = layout.CellDistanceX - gridLinesWidth
+        cellHeight = layout.CellDistanceY - gridLinesWidth
+        width = (layout.BanksWide * layout.CellDistanceX) + gridLinesWidth
+        height = (layout.BanksHigh * layout.CellDistanceY) + gridLinesWidth
+
+        for line in range(layout.BanksHigh + 1):
+            g.DrawLine(bankBoundariesPen, 0, line * layout.CellDistanceY, width - 1, line * layout.CellDistanceY)
+
+        for line in range(layout.BanksWide + 1):
+            g.DrawLine(bankBoundariesPen, line * layout.CellDistanceX, 0, line * layout.CellDistanceX, height - 1)
+
+        resourceCells = List[Rectangle]()
+        normalCells = List[Rectangle]()
+        highlightedCells = List[Rectangle]()
+        consumedCells = []
+        cellsWithBankCount = []
+
+        i = 0
+        for row in range(layout.BanksHigh):
+            for col in range(layout.BanksWide):
+                rect = Rectangle((col * layout.CellDistanceX) + gridLinesWidth, (row * layout.CellDistanceY) + gridLinesWidth, cellWidth, cellHeight)
+                bank = (overview.FirstBankX + col, overview.FirstBankY + row)
+
+                if overview.Resources[i]:
+                    resourceCells.Add(rect)
+                else:
+                    normalCells.Add(rect)
 
-                    if (bankX, bankY) in highlightedBanksCoords:
-                        highlightedTiles.Add(rect)
+                if bank in highlightedBanksCoords:
+                    highlightedCells.Add(rect)
 
-        if rockTiles.Count > 0:
-            g.FillRectangles(rockTileBrush, rockTiles.ToArray())
-        
-        if normalTiles.Count > 0:
-            g.FillRectangles(normalTileBrush, normalTiles.ToArray())
+                if bank in state.VisibleConsumedBanks:
+                    consumedCells.append(rect)
+                elif overview.BestAmounts[i] > 0:
+                    cellsWithBankCount.append((rect, overview.BestAmounts[i]))
 
-        if resourceTiles.Count > 0:
-            g.FillRectangles(resourceTileBrush, resourceTiles.ToArray())
+                i += 1
 
-        if highlightedTiles.Count > 0:
-            g.FillRectangles(bankHighlightBrush, highlightedTiles.ToArray())
+        if normalCells.Count > 0:
+            g.FillRectangles(normalTileBrush, normalCells.ToArray())
 
-            
-        # Draw player pos
-        g.FillRectangle(playerTileBrush, 
-                      Rectangle((centerTile * gridLinesDistance) + 1, 
-                      (centerTile * gridLinesDistance) + 1, tilePxSize, tilePxSize))
-
-        stringFormat = StringFormat()
-        stringFormat.Alignment = StringAlignment.Center
-        stringFormat.LineAlignment = StringAlignment.Center
-                  
-        # Draw an X on mineable tiles that are reachable from marked spots
-        for consumedTile in consumedTiles:
-            rect = Rectangle((consumedTile[0] * gridLinesDistance) + 1, (consumedTile[1] * gridLinesDistance) + 1, tilePxSize, tilePxSize)
-            g.DrawString(f"X", self.Font, consumedTileTextBrush, rect, stringFormat)
-            
-        # Drawn an M on tiles we marked a rune on
-        for markedTile in markedTiles:
-            rect = Rectangle((markedTile[0] * gridLinesDistance) + 1, (markedTile[1] * gridLinesDistance) + 1, tilePxSize, tilePxSize)
-            g.DrawString(f"M", self.Font, markedTileTextBrush, rect, stringFormat)
-        
-        # Draw count of ore banks
-        for tileBankInfo in tilesWithBankCount:
-            rect = Rectangle((tileBankInfo[0] * gridLinesDistance) + 1, (tileBankInfo[1] * gridLinesDistance) + 1, tilePxSize, tilePxSize)
-            g.DrawString(f"{tileBankInfo[2]}", self.Font, tileNormalTextBrush, rect, stringFormat)
+        if resourceCells.Count > 0:
+            g.FillRectangles(resourceTileBrush, resourceCells.ToArray())
+
+        if highlightedCells.Count > 0:
+            g.FillRectangles(bankHighlightBrush, highlightedCells.ToArray())
+
+        # The player position inside its bank
+        playerX = state.CenterX - (overview.FirstBankX * layout.BankWidth)
+        playerY = state.CenterY - (overview.FirstBankY * layout.BankHeight)
+        playerSize = max(min(int(cellWidth / layout.BankWidth), int(cellHeight / layout.BankHeight)), 2)
+        g.FillRectangle(playerTileBrush, Rectangle(int((playerX * layout.CellDistanceX) / layout.BankWidth) + gridLinesWidth,
+                                                   int((playerY * layout.CellDistanceY) / layout.BankHeight) + gridLinesWidth, playerSize, playerSize))
+
+        # The texts don't fit if the cells are smaller than the tiles
+        if cellWidth < tilePxSize or cellHeight < tilePxSize:
+            return
+
+        glyph = self.Glyphs.Get("X", consumedTileTextBrush)
+        for rect in consumedCells:
+            DrawGlyph(g, glyph, rect)
+
+        for rect, amount in cellsWithBankCount:
+            DrawGlyph(g, self.Glyphs.Get(f"{amount}", tileNormalTextBrush), rect)
+
+    # The stats are collected at most once per second, so that sorting the samples doesn't weigh on the paints being measured
+    def PaintStats(self, g):
+        now = time.monotonic()
+        if self.StatsAt is None or now - self.StatsAt >= 1:
+            self.StatsLines = profiler.SummaryLines()
+            self.StatsAt = now
+
+        if len(self.StatsLines) == 0:
+            return
+
+        text = "\n".join(self.StatsLines)
+        size = g.MeasureString(text, statsFont)
+        self.StatsRectangle = Rectangle(0, 0, int(size.Width) + 1, int(size.Height) + 1)
+
+        g.FillRectangle(statsBackgroundBrush, self.StatsRectangle)
+        g.DrawString(text, statsFont, statsTextBrush, 0, 0)
+
+    def OnRadarFontChanged(self, sender, args):
+        self.Glyphs.SetFont(self.Font)
+        self.Invalidate()
 
     def OnRadarClosing(self, sender, args):
         with radarLock:
             self.IsShown = False
 
-def RefreshUI(radar):
-    radar.Refresh()
+        self.Glyphs.Clear()
+
+        if self.BackgroundBitmap is not None:
+            self.BackgroundBitmap.Dispose()
+            self.SpareBitmap.Dispose()
+            self.BackgroundBitmap = None
+            self.SpareBitmap = None
+
+# Pixels rectangle of a tile, given in view coordinates, excluding the grid lines
+def TileRectangle(col, row):
+    return Rectangle((col * gridLinesDistance) + gridLinesWidth, (row * gridLinesDistance) + gridLinesWidth, tilePxSize, tilePxSize)
+
+# Per bank summary of a state, for the zoomed out radar: whether each bank has resource tiles,
+# and the best count of its tiles, for the banks of the layout starting from the one of the grid origin.
+class BankOverview():
+    def __init__(self, layout, firstBankX, firstBankY):
+        self.Layout = layout
+        self.FirstBankX = firstBankX
+        self.FirstBankY = firstBankY
+        self.Resources = bytearray(layout.BanksWide * layout.BanksHigh)
+        self.BestAmounts = array("H", bytes(2 * layout.BanksWide * layout.BanksHigh))
+
+def BuildOverview(state):
+    layout = GetOverviewLayout(state)
+    originX, originY = engine.GridToWorldCoords(0, 0, state.CenterX, state.CenterY)
+    overview = BankOverview(layout, int(originX / layout.BankWidth), int(originY / layout.BankHeight))
+
+    tiles = state.Tiles
+    for i in range(tiles.Size * tiles.Size):
+        cell = ((tiles.BankY[i] - overview.FirstBankY) * layout.BanksWide) + (tiles.BankX[i] - overview.FirstBankX)
+        if tiles.Classes[i] == tileClassResource:
+            overview.Resources[cell] = 1
+        if tiles.Amounts[i] > overview.BestAmounts[cell]:
+            overview.BestAmounts[cell] = tiles.Amounts[i]
+
+    return overview
+
+# Texts drawn on the tiles, rendered once per font and brush color on a transparent bitmap of the size of a tile.
+# The digits and the markers are rendered as soon as the font is set, any other text the first time it's drawn.
+class GlyphCache():
+    def __init__(self):
+        self.Glyphs = {}
+        self.Font = None
+        self.FontKey = None
 
-def SaveMiningSpot(mapState):
-    tile = mapState.TilesInfo[centerTile, centerTile]
+    def Clear(self):
+        for glyph in self.Glyphs.values():
+            glyph.Dispose()
 
-    with open(markedSpotsFilePath, "a") as f:
-        f.write(f"{Player.Position.X},{Player.Position.Y},{Player.Map}")
-        mapState.MarkedSpots[Player.Map].append((Player.Position.X, Player.Position.Y))
+        self.Glyphs = {}
 
-        mapConsumedBanks = mapState.ConsumedBanks[Player.Map]
+    # Rebuilds the glyphs if the font changed since they have been rendered
+    def SetFont(self, font):
+        fontKey = (font.Name, font.Size, font.Style)
+        if fontKey == self.FontKey:
+            return
 
-        for miningCoords in tile.MineableTiles:
-            f.write(f"|{miningCoords[0]},{miningCoords[1]}")
-            
-            bankX = int(miningCoords[0] / bankSize)
-            bankY = int(miningCoords[1] / bankSize)
+        self.Clear()
+        self.Font = font
+        self.FontKey = fontKey
+
+        for digit in range(10):
+            self.Get(f"{digit}", tileNormalTextBrush)
+
+        self.Get("X", consumedTileTextBrush)
+        self.Get("M", markedTileTextBrush)
+
+    # The glyphs are per brush color, so a brush with a different color gets new ones
+    def Get(self, text, brush):
+        key = (text, brush.Color.ToArgb())
+        glyph = self.Glyphs.get(key)
+        if glyph is not None:
+            return glyph
+
+        glyph = Bitmap(tilePxSize, tilePxSize, PixelFormat.Format32bppPArgb)
+        g = Graphics.FromImage(glyph)
+        # ClearType needs an opaque background to blend with
+        g.TextRenderingHint = TextRenderingHint.AntiAliasGridFit
+        g.DrawString(text, self.Font, brush, Rectangle(0, 0, tilePxSize, tilePxSize), tileStringFormat)
+        g.Dispose()
+
+        self.Glyphs[key] = glyph
+        return glyph
+
+# Draws a glyph centered in a cell
+def DrawGlyph(g, glyph, rect):
+    g.DrawImageUnscaled(glyph, rect.X + int((rect.Width - tilePxSize) / 2), rect.Y + int((rect.Height - tilePxSize) / 2))
+
+# Draws the grid lines and the tiles fills of a band, given in view coordinates as (rowStart, rowEnd, colStart, colEnd), ends excluded
+def DrawBackground(g, state, band):
+    rowStart, rowEnd, colStart, colEnd = band
+    left = colStart * gridLinesDistance
+    top = rowStart * gridLinesDistance
+    right = colEnd * gridLinesDistance
+    bottom = rowEnd * gridLinesDistance
+
+    # The lines around the band are drawn too, since they have been shifted out or have to change color
+    g.SetClip(Rectangle(left, top, right - left + gridLinesWidth, bottom - top + gridLinesWidth))
+
+    for r in range(rowStart, rowEnd + 1):
+        if state.GridRows[r + viewOffset] == 1:
+            g.DrawLine(bankBoundariesPen, left, r * gridLinesDistance, right, r * gridLinesDistance)
+        else:
+            g.DrawLine(gridPen, left, r * gridLinesDistance, right, r * gridLinesDistance)
+
+    for c in range(colStart, colEnd + 1):
+        if state.GridCols[c + viewOffset] == 1:
+            g.DrawLine(bankBoundariesPen, c * gridLinesDistance, top, c * gridLinesDistance, bottom)
+        else:
+            g.DrawLine(gridPen, c * gridLinesDistance, top, c * gridLinesDistance, bottom)
+
+    rockTiles = List[Rectangle]()
+    resourceTiles = List[Rectangle]()
+    normalTiles = List[Rectangle]()
+
+    classes = state.Tiles.Classes
+    for row in range(rowStart, rowEnd):
+        i = ((row + viewOffset) * visibleTiles) + colStart + viewOffset
+        for col in range(colStart, colEnd):
+            tileClass = classes[i]
+            if tileClass == tileClassResource:
+                resourceTiles.Add(TileRectangle(col, row))
+            elif tileClass == tileClassRock:
+                rockTiles.Add(TileRectangle(col, row))
+            else:
+                normalTiles.Add(TileRectangle(col, row))
+            i += 1
+
+    if rockTiles.Count > 0:
+        g.FillRectangles(rockTileBrush, rockTiles.ToArray())
+
+    if normalTiles.Count > 0:
+        g.FillRectangles(normalTileBrush, normalTiles.ToArray())
+
+    if resourceTiles.Count > 0:
+        g.FillRectangles(resourceTileBrush, resourceTiles.ToArray())
+
+    g.ResetClip()
+
+# Asks the UI thread to redraw the dirty tiles, or all of them if None, without waiting for it
+def RefreshRadar(radar, dirtyTiles=None):
+    with radarLock:
+        if radar.IsShown:
+            refreshDelegate = Action(lambda: radar.InvalidateTiles(dirtyTiles))
+            radar.BeginInvoke(refreshDelegate)
+
+# Returns the published state once it's the one of the given position, or None if the worker takes longer than saveWaitTimeout
+def WaitForMapState(worker, centerX, centerY, mapIndex):
+    state = engine.State
+    if (state.Map, state.CenterX, state.CenterY) == (mapIndex, centerX, centerY):
+        return state
+
+    worker.RequestUpdate(centerX, centerY, mapIndex)
+
+    waited = 0
+    while waited < saveWaitTimeout:
+        Misc.Pause(20)
+        waited += 20
 
-            if (bankX, bankY) not in mapConsumedBanks:
-                mapConsumedBanks.append((bankX, bankY))
+        state = engine.State
+        if (state.Map, state.CenterX, state.CenterY) == (mapIndex, centerX, centerY):
+            return state
 
-        f.write("\n")
+    return None
+
+# Switches the engine to a resource profile, opening the spots file of its skill the first time; called by the worker thread
+def SwitchProfile(name):
+    with profiler.Phase("switch profile"):
+        engine.SetResourceProfile(name)
+
+        if engine.SpotsStore is None:
+            skill = engine.Profile.Skill
+            spotsFilePath, legacySpotsFilePath = spotsFilePaths[skill]
+            with profiler.Phase("spots file"):
+                engine.LoadMiningSpots(spotsFilePath, legacySpotsFilePath)
+            engine.SpotsStore = recorder.WrapSpotsStore(engine.SpotsStore, skill)
+
+    recorder.Profile(name)
 
 lastKey = None
-def HandleKey(radar):
-    global lastKey
+# The profile last asked for with switchProfileKey
+selectedProfile = resourceProfile
+def HandleKey(radar, worker):
+    global lastKey, selectedProfile
     key = Misc.LastHotKey()
     
     if key is None:
@@ -401,56 +786,177 @@ def HandleKey(radar):
         return
         
     lastKey = key
+    recorder.HotKey(f"{key.HotKey}")
+
+    if f"{key.HotKey}" == switchProfileKey:
+        nextProfile = switchProfiles.index(selectedProfile) + 1 if selectedProfile in switchProfiles else 0
+        selectedProfile = switchProfiles[nextProfile % len(switchProfiles)]
+        worker.RequestProfile(selectedProfile)
+        Player.HeadMessage(88, f"Radar switched to {selectedProfile}")
+        return
     
     if f"{key.HotKey}" != saveASpotKey:
         return
 
-    global mapStateLock
-    with mapStateLock:
-        SaveMiningSpot(mapState)
-        
-        Player.HeadMessage(88, "Mining Spot Saved!")
-        
-    global radarLock
-    with radarLock:
-        radar.VisibleConsumedBanks = FilterVisibleConsumedBanks(radar.PlayerPosition[0], radar.PlayerPosition[1])
-        if radar.IsShown:
-            refreshDelegate = Action[Radar](RefreshUI)
-            radar.Invoke(refreshDelegate, radar)
+    profiler.BeginFrame("key")
+    try:
+        with profiler.Phase("wait state"):
+            position = player.Position
+            state = WaitForMapState(worker, position.X, position.Y, player.Map)
 
-    
-def LoadMiningSpots():
-    global mapState
+        if state is None:
+            Player.HeadMessage(88, "The radar is still updating, try again!")
+            return
+
+        with profiler.Phase("save"):
+            engine.SaveMiningSpot(state)
+
+        Player.HeadMessage(88, f"{state.Profile.Skill} Spot Saved!")
 
-    if not os.path.exists(markedSpotsFilePath):
+        # The counts are only updated after moving, but the new marks are shown right away
+        RefreshRadar(radar, engine.RepublishMapState())
+    finally:
+        profiler.EndFrame()
+
+def WorldOverlayItems(state):
+    if len(worldOverlayHeights) > 0x4000:
+        worldOverlayHeights.clear()
+
+    def Item(kind, itemID, x, y):
+        z = worldOverlayHeights.get((state.Map, x, y))
+        if z is None:
+            z = Statics.GetLandZ(x, y, state.Map)
+            worldOverlayHeights[(state.Map, x, y)] = z
+
+        return ((kind, x, y), (itemID, x, y, z, worldOverlayHue))
+
+    def InRange(x, y):
+        return max(abs(x - state.CenterX), abs(y - state.CenterY)) <= worldOverlayRange
+
+    items = dict(Item("spot", worldMarkedSpotItem, x, y) for x, y in state.VisibleMarkedSpots if InRange(x, y))
+    bankCenters = (((bankX * state.BankWidth) + int(state.BankWidth / 2), (bankY * state.BankHeight) + int(state.BankHeight / 2))
+                   for bankX, bankY in state.VisibleConsumedBanks)
+    items.update(Item("bank", worldConsumedBankItem, x, y) for x, y in bankCenters if InRange(x, y))
+    return items
+
+# Shows the overlays of the published state in the world, if it changed since they were last shown
+def RefreshWorldOverlay():
+    global worldOverlayState
+
+    state = engine.State
+    if worldOverlay is None or state is worldOverlayState or state.Map < 0:
         return
 
-    with open(markedSpotsFilePath, "r") as f:
-        for line in f:
-            spotsInfo = line.split("|")
-            spotsInfoIt = iter(spotsInfo)
-            
-            markedSpot = next(spotsInfoIt)
-            markedSpotInfo = markedSpot.split(",")
+    # The client deleted the items of the previous map, and the ones that went out of its range
+    if worldOverlayState is not None and worldOverlayState.Map != state.Map:
+        worldOverlay.Forget()
+    else:
+        worldOverlay.ForgetOutOfRange(state.CenterX, state.CenterY, worldOverlayRange)
 
-            mapState.MarkedSpots[int(markedSpotInfo[2])].append((int(markedSpotInfo[0]), int(markedSpotInfo[1])))
-            mapConsumedBanks = mapState.ConsumedBanks[int(markedSpotInfo[2])]
+    worldOverlayState = state
+    profiler.BeginFrame("world overlay")
+    worldOverlay.Update(WorldOverlayItems(state))
+    profiler.EndFrame()
 
-            for miningSpot in spotsInfoIt:
-                miningSpotInfo = miningSpot.split(",")
+# The spots saved by the radars of other clients sharing the spots file, and the banks that respawned,
+# are counted without waiting for a move
+def CheckSharedSpots(worker):
+    state = engine.State
+    if state.Map >= 0 and worker.IsIdle() and (engine.HasNewSpots() or engine.HasExpiredBanks()):
+        worker.RequestUpdate(state.CenterX, state.CenterY, state.Map)
 
-                bankX = int(int(miningSpotInfo[0]) / bankSize)
-                bankY = int(int(miningSpotInfo[1]) / bankSize)
+    
+# Computes the map state of the requested positions in the background, so that drawing and the hotkeys never wait for it.
+# Only the latest requested position is computed, the ones requested while it was busy are skipped.
+# The resource profile is switched by the worker too, since the states are computed with it, and the current position computed again.
+class MapStateWorker():
+    def __init__(self, radar):
+        self.Radar = radar
+        self.Lock = Lock()
+        self.Wake = Event()
+        self.Request = None
+        self.ProfileRequest = None
+        self.Busy = False
+        self.Stopped = False
+        self.Error = None
+        self.Thread = None
+
+    def Start(self):
+        self.Thread = Thread(ThreadStart(self.Run))
+        self.Thread.IsBackground = True
+        self.Thread.Start()
+
+    def Stop(self):
+        self.Stopped = True
+        self.Wake.set()
+        if self.Thread is not None:
+            self.Thread.Join()
+
+    def RequestUpdate(self, centerX, centerY, mapIndex):
+        with self.Lock:
+            self.Request = (centerX, centerY, mapIndex)
+        self.Wake.set()
+
+    def RequestProfile(self, name):
+        with self.Lock:
+            self.ProfileRequest = name
+        self.Wake.set()
+
+    def IsIdle(self):
+        with self.Lock:
+            return self.Request is None and self.ProfileRequest is None and not self.Busy
+
+    def Run(self):
+        try:
+            while not self.Stopped:
+                self.Wake.wait()
+
+                with self.Lock:
+                    self.Wake.clear()
+                    request = self.Request
+                    profileRequest = self.ProfileRequest
+                    self.Request = None
+                    self.ProfileRequest = None
+                    self.Busy = request is not None or profileRequest is not None
+
+                if self.Stopped:
+                    continue
+
+                if profileRequest is not None:
+                    profiler.BeginFrame("profile")
+                    SwitchProfile(profileRequest)
+                    profiler.EndFrame()
+
+                    state = engine.State
+                    if request is None and state.Map >= 0:
+                        request = (state.CenterX, state.CenterY, state.Map)
+
+                if request is None:
+                    with self.Lock:
+                        self.Busy = False
+                    continue
+
+                profiler.BeginFrame("update")
+
+                newState = engine.ComputeMapState(engine.State, request[0], request[1], request[2])
+                # Spare the UI thread from building the banks summary
+                if self.Radar.ZoomedOut:
+                    with profiler.Phase("overview"):
+                        newState.Overview = BuildOverview(newState)
+
+                dirtyTiles = engine.PublishMapState(newState)
+                RefreshRadar(self.Radar, dirtyTiles)
+
+                profiler.EndFrame()
+
+                with self.Lock:
+                    self.Busy = False
+        except Exception as e:
+            # Raised again by the script thread
+            self.Error = e
 
-                if (bankX, bankY) not in mapConsumedBanks:
-                    mapConsumedBanks.append((bankX, bankY))
-        
 def StartRadar():
-    
-    global mapState
     global lastKey
-    global radarLock
-    global mapStateLock
 
     radar = Radar()
 
@@ -461,138 +967,48 @@ def StartRadar():
     while not radar.IsShown:
         Misc.Pause(200)
 
-    prevPlayerX = 0
-    prevPlayerY = 0
-
-    gridRowsCount = len(mapState.GridRows)
-    gridColsCount = len(mapState.GridCols)
-
-    updateMapEvery = mapUpdateTicks
-    tick = 0
     lastKey = Misc.LastHotKey()
     
-    LoadMiningSpots()
-    
-    while True:
-        if not radar.IsShown:
-            return
-            
-        HandleKey(radar)
-        Misc.Pause(100)
-        tick += 1
-        
-        if tick < updateMapEvery:
-            continue
-
-        tick = 0
-        
-        currentPlayerX = Player.Position.X
-        currentPlayerY = Player.Position.Y
-
-        # We haven't moved, don't recalculate
-        if prevPlayerX == currentPlayerX and prevPlayerY == currentPlayerY:
-            continue
-            
-        prevPlayerX = currentPlayerX
-        prevPlayerY = currentPlayerY
-
-        with radarLock:
-            radar.VisibleConsumedBanks = FilterVisibleConsumedBanks(currentPlayerX, currentPlayerY)
-            visibleConsumedBanks = list(radar.VisibleConsumedBanks)
-            radar.HighlightedBanks = []
-            radar.PlayerPosition = (currentPlayerX, currentPlayerY)
-
-        with mapStateLock:
-        
-            mapState.GridCols = [0] * (mapState.Size + 1)
-            mapState.GridRows = [0] * (mapState.Size + 1)
-                
-            offsetCenterX = currentPlayerX % bankSize
-            offsetCenterY = currentPlayerY % bankSize
-            
-            # Color the grid lines that represent the banks boundaries
-            for x in range(0, int(gridColsCount / bankSize) + 1):
-                col = ((x * bankSize) - offsetCenterX)
-                if col >= 0 and col <= gridColsCount:
-                    mapState.GridCols[col] = 1
-                
-            for y in range(0, int(gridRowsCount / bankSize) + 1):
-                row = ((y * bankSize) - offsetCenterY)
-                if row >= 0 and row <= gridRowsCount:
-                    mapState.GridRows[row] = 1
-               
-            # Gather the land tiles IDs and check if it's impassable
-            for row in range(0, visibleTiles):
-                for col in range(0, visibleTiles):
-                    
-                    adjX = currentPlayerX + (col - centerTile)
-                    adjY = currentPlayerY + (row - centerTile)
-                    tileID = Statics.GetLandID(adjX, adjY, Player.Map)
-                    blocked = Statics.GetLandFlag(tileID, "Impassable")
-                    
-                    color = 0
-                    if tileID in mineableTiles:
-                        color = 1
-                    elif tileID in rockTiles:
-                        color = 2
-
-                    mapState.TilesInfo[row, col] = TileInfo(color, 0, int(adjX / bankSize), int(adjY / bankSize), blocked)
-                  
-            # For each walkable tiles, check how many mineable tiles,
-            # each on a different bank, are reachable.
-            for row in range(centerTile - scanRange,  centerTile + scanRange):
-                for col in range(centerTile - scanRange, centerTile + scanRange):
-                    tile = mapState.TilesInfo[row, col]
-
-                    if tile.Blocked == True:
-                     continue
-
-                    # Keep track of the banks we've already seen, so we don't consider mineable tiles
-                    # in a bank that we already counted.
-                    banksSeen = []
-
-                    # Then from the selected walkable tile, we check if there's any mineable tile in a distance of 2
-                    # if there is, we count the bank it's in if we haven't already seen it.
-                    for rowOffset in range(-2, 3):
-                        for colOffset in range(-2, 3):
-                            finalCol = col + colOffset
-                            finalRow = row + rowOffset
-
-                            targetTile = mapState.TilesInfo[finalRow, finalCol]
-
-                            bankFound = False
-                            for bank in banksSeen:
-                                if bank[0] == targetTile.BankX and bank[1] == targetTile.BankY:
-                                    bankFound = True
-                                    break
-                                
-                            if bankFound:
-                                continue
-                             
-                            for bank in visibleConsumedBanks:
-                                 if bank[0] == targetTile.BankX and bank[1] == targetTile.BankY:
-                                    bankFound = True
-                                    break
-                                    
-                            if bankFound:
-                                continue
-                                 
-
-                            # If it's a mineable tile, and the bank is new, count it
-                            if targetTile.Color == 1:
-                                tileWorldX, tileWorldY = GridToWorldCoords(finalCol, finalRow, currentPlayerX, currentPlayerY)
-                                bankX = int(tileWorldX / bankSize)
-                                bankY = int(tileWorldY / bankSize)
-                                 
-                                banksSeen.append((bankX, bankY))
-                                tile.Amount += 1
-                                tile.MineableTiles.append((tileWorldX, tileWorldY))
-        
-        with radarLock:
-            if radar.IsShown:
-                refreshDelegate = Action[Radar](RefreshUI)
-                radar.Invoke(refreshDelegate, radar)
-            else:
-                break
+    profiler.BeginFrame("startup")
+    skill = engine.Profile.Skill
+    with profiler.Phase("spots file"):
+        engine.LoadMiningSpots(*spotsFilePaths[skill])
+    engine.SpotsStore = recorder.WrapSpotsStore(engine.SpotsStore, skill)
+    profiler.EndFrame()
+
+    worker = MapStateWorker(radar)
+    worker.Start()
+
+    try:
+        RunRadar(radar, worker)
+    finally:
+        worker.Stop()
+        engine.Close()
+        recorder.Close()
+
+        if worldOverlay is not None:
+            worldOverlay.Clear()
+
+        if profiler.Enabled:
+            frames = profiler.WriteTrace(profilerTraceFilePath)
+            Misc.SendMessage(f"Radar profile of {frames} frames written to {profilerTraceFilePath}")
+
+def RunRadar(radar, worker):
+    def KeepRunning():
+        if worker.Error is not None:
+            raise worker.Error
+
+        return radar.IsShown
+
+    def OnHotKeys():
+        HandleKey(radar, worker)
+        CheckSharedSpots(worker)
+        RefreshWorldOverlay()
+
+    # The worker only computes the latest requested position, so the moves requested while it's busy are coalesced too
+    scheduler = RefreshScheduler(player, Misc, worker.RequestUpdate, OnHotKeys,
+                                 moveLatency, idleLatency, idleAfter, refreshInterval, hotKeyLatency,
+                                 onPositionChange=engine.ObservePosition)
+    scheduler.Run(KeepRunning)
         
 StartRadar()
\ No newline at end of file
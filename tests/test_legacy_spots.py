@@ -0,0 +1,59 @@
+# Legacy marked spots import tests by Smjert/Spasitjel
+#
+# Opens the marked spots of a RadarEngine on the text file of older versions, and checks that its spots end up in the log,
+# and that a text file with a bad line leaves no log behind, so that it's imported again once fixed.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from radar_core.radar_engine import RadarEngine
+from radar_core.fakes import FakeStatics, FlatMap
+
+legacyLines = [
+    "1200,1500,0,1700000000|1201,1500|1200,1502",
+    "300,280,1|301,281",
+    "",
+    "2500,40,3,1700000500|2500,42",
+]
+
+class LegacySpotsTest(unittest.TestCase):
+    def setUp(self):
+        self.Directory = tempfile.mkdtemp(prefix="radar-legacy-spots-")
+        self.SpotsPath = os.path.join(self.Directory, "MiningSpots.bin")
+        self.LegacyPath = os.path.join(self.Directory, "MiningSpots.txt")
+        self.Engine = RadarEngine(FakeStatics(FlatMap()))
+
+    def tearDown(self):
+        shutil.rmtree(self.Directory)
+
+    def WriteLegacyFile(self, lines):
+        with open(self.LegacyPath, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def StoredSpots(self):
+        return [(spot.Map, spot.X, spot.Y, spot.Tiles, spot.Time) for spot in self.Engine.SpotsStore.AllSpots()]
+
+    def testImportsAllTheSpotsOfTheLegacyFile(self):
+        self.WriteLegacyFile(legacyLines)
+        self.Engine.LoadMiningSpots(self.SpotsPath, self.LegacyPath)
+
+        self.assertEqual(self.StoredSpots(), [(0, 1200, 1500, [(1201, 1500), (1200, 1502)], 1700000000),
+                                              (1, 300, 280, [(301, 281)], None),
+                                              (3, 2500, 40, [(2500, 42)], 1700000500)])
+        self.assertTrue(os.path.exists(self.Engine.SpotsStore.IndexPath))
+
+    def testABadLineLeavesNoLogAndIsImportedOnceFixed(self):
+        self.WriteLegacyFile(legacyLines[:2] + ["300,300"])
+        with self.assertRaises(ValueError):
+            self.Engine.LoadMiningSpots(self.SpotsPath, self.LegacyPath)
+
+        self.assertFalse(os.path.exists(self.SpotsPath))
+
+        self.WriteLegacyFile(legacyLines)
+        self.Engine.LoadMiningSpots(self.SpotsPath, self.LegacyPath)
+        self.assertEqual(len(self.StoredSpots()), 3)
+
+if __name__ == "__main__":
+    unittest.main()
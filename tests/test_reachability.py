@@ -0,0 +1,133 @@
+# Resource banks reachability tests by Smjert/Spasitjel
+#
+# Compares the bitmask sliding windows of ComputeReachability, with and without NumPy, and FirstReachableTiles,
+# with the count the radar did before them: for every walkable tile, each resource tile within reach whose bank
+# hasn't been seen yet and isn't consumed counts one bank. The grids are random, placed around the origin of the map
+# so that some banks have negative coordinates, with consumed banks, and scanned up to their edges.
+
+import random
+import unittest
+
+from radar_core.reachability import BankIndexer, ComputeReachability, ComputeReachabilityZ, FirstReachableTiles, numpy
+from radar_core.tile_classifier import tileClassNormal, tileClassResource, tileClassRock
+
+gridsCount = 300
+
+class RandomGrid():
+    def __init__(self, rng):
+        self.Width = rng.randrange(1, 40)
+        self.Height = rng.randrange(1, 40)
+        self.BankWidth, self.BankHeight = rng.choice(((8, 8), (4, 3), (3, 3), (2, 5)))
+        self.Reach = rng.randrange(0, 4)
+        self.MinX = rng.randrange(-30, 30)
+        self.MinY = rng.randrange(-30, 30)
+
+        resourceChance = rng.random()
+        self.Classes = [tileClassResource if rng.random() < resourceChance else rng.choice((tileClassNormal, tileClassRock))
+                        for i in range(self.Width * self.Height)]
+        self.Blocked = [1 if rng.random() < 0.2 else 0 for i in range(self.Width * self.Height)]
+
+        # As the radar does, truncating toward 0
+        self.Banks = [(int((self.MinX + (i % self.Width)) / self.BankWidth), int((self.MinY + (i // self.Width)) / self.BankHeight))
+                      for i in range(self.Width * self.Height)]
+        indexer = BankIndexer(self.Width, self.Height, self.BankWidth, self.BankHeight)
+        self.BankIndices = [indexer.Index(bankX, bankY) for bankX, bankY in self.Banks]
+
+        self.ConsumedBanks = set(bank for bank in set(self.Banks) if rng.random() < 0.3)
+        self.ConsumedMask = indexer.MaskOf(self.ConsumedBanks)
+
+        if rng.random() < 0.3:
+            self.ScanRect = (0, self.Height, 0, self.Width)
+        else:
+            rowStart = rng.randrange(0, self.Height + 1)
+            colStart = rng.randrange(0, self.Width + 1)
+            self.ScanRect = (rowStart, rng.randrange(rowStart, self.Height + 1), colStart, rng.randrange(colStart, self.Width + 1))
+
+    # The resource tiles of the banks reachable from a tile, first met of each bank, in the order they are met
+    def ReferenceTiles(self, row, col):
+        tiles = []
+        if self.Blocked[(row * self.Width) + col]:
+            return tiles
+
+        banksSeen = []
+        for rowOffset in range(-self.Reach, self.Reach + 1):
+            for colOffset in range(-self.Reach, self.Reach + 1):
+                finalRow = row + rowOffset
+                finalCol = col + colOffset
+                if finalRow < 0 or finalRow >= self.Height or finalCol < 0 or finalCol >= self.Width:
+                    continue
+
+                i = (finalRow * self.Width) + finalCol
+                bank = self.Banks[i]
+                if bank in banksSeen or bank in self.ConsumedBanks:
+                    continue
+
+                if self.Classes[i] == tileClassResource:
+                    banksSeen.append(bank)
+                    tiles.append((finalCol, finalRow))
+
+        return tiles
+
+    def InScanRect(self, row, col):
+        rowStart, rowEnd, colStart, colEnd = self.ScanRect
+        return row >= rowStart and row < rowEnd and col >= colStart and col < colEnd
+
+    def Compute(self, useNumPy):
+        return ComputeReachability(self.Width, self.Height, self.Classes, self.Blocked, self.BankIndices, self.ConsumedMask, self.ScanRect,
+                                   self.Reach, useNumPy)
+
+class ReachabilityTest(unittest.TestCase):
+    def CheckResult(self, grid, result, seed):
+        for row in range(grid.Height):
+            for col in range(grid.Width):
+                tiles = grid.ReferenceTiles(row, col) if grid.InScanRect(row, col) else []
+                expectedMask = 0
+                for tileCol, tileRow in tiles:
+                    expectedMask |= 1 << grid.BankIndices[(tileRow * grid.Width) + tileCol]
+
+                where = f"tile {col},{row} of grid {seed}"
+                self.assertEqual(result.GetCount(row, col), len(tiles), where)
+                if len(tiles) > 0:
+                    self.assertEqual(result.GetMask(row, col), expectedMask, where)
+
+    def testPurePythonMatchesTheReference(self):
+        for seed in range(gridsCount):
+            grid = RandomGrid(random.Random(seed))
+            self.CheckResult(grid, grid.Compute(useNumPy=False), seed)
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def testNumPyMatchesTheReference(self):
+        for seed in range(gridsCount):
+            grid = RandomGrid(random.Random(seed))
+            self.CheckResult(grid, grid.Compute(useNumPy=True), seed)
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def testNumPyMatchesPurePython(self):
+        for seed in range(gridsCount):
+            grid = RandomGrid(random.Random(seed))
+            python = grid.Compute(useNumPy=False)
+            withNumPy = grid.Compute(useNumPy=True)
+            for row in range(grid.Height):
+                for col in range(grid.Width):
+                    where = f"tile {col},{row} of grid {seed}"
+                    self.assertEqual(withNumPy.GetCount(row, col), python.GetCount(row, col), where)
+                    self.assertEqual(withNumPy.GetMask(row, col), python.GetMask(row, col), where)
+
+    def testZWithoutObstaclesMatchesTheReference(self):
+        for seed in range(gridsCount):
+            grid = RandomGrid(random.Random(seed))
+            result = ComputeReachabilityZ(grid.Width, grid.Height, grid.Classes, grid.Blocked, grid.BankIndices, grid.ConsumedMask,
+                                          grid.ScanRect, lambda row, col, deltaRow, deltaCol: True, grid.Reach)
+            self.CheckResult(grid, result, seed)
+
+    def testFirstReachableTilesMatchTheReference(self):
+        for seed in range(gridsCount):
+            grid = RandomGrid(random.Random(seed))
+            for row in range(grid.Height):
+                for col in range(grid.Width):
+                    tiles = FirstReachableTiles(grid.Width, grid.Height, grid.Classes, grid.Blocked, grid.BankIndices, grid.ConsumedMask,
+                                                row, col, grid.Reach)
+                    self.assertEqual(tiles, grid.ReferenceTiles(row, col), f"tile {col},{row} of grid {seed}")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# Refresh scheduler tests by Smjert/Spasitjel
+#
+# Runs the RefreshScheduler on the fake clock of a FakeMisc, with a FakePlayer walking a scripted path,
+# and checks when it polls the position, reports the moves and handles the hotkeys:
+#   python -m unittest discover tests
+
+import unittest
+
+from radar_core.scheduler import RefreshScheduler
+from radar_core.fakes import FakeMisc, FakePlayer
+
+stepTime = 100
+movePollInterval = 50
+idlePollInterval = 500
+idleAfter = 2000
+refreshInterval = 250
+hotKeyPollInterval = 100
+
+# Stands at x for the given number of steps, then walks one tile per step to each of the next x, and stays on the last one
+def Path(standingSteps, *walkedX):
+    return [(100, 100)] * standingSteps + [(x, 100) for x in walkedX]
+
+# Records the times the position is read
+class PolledPlayer():
+    def __init__(self, player, misc):
+        self.Player = player
+        self.Misc = misc
+        self.PollTimes = []
+
+    @property
+    def Position(self):
+        if len(self.PollTimes) == 0 or self.PollTimes[-1] != self.Misc.Time:
+            self.PollTimes.append(self.Misc.Time)
+
+        return self.Player.Position
+
+    @property
+    def Map(self):
+        return self.Player.Map
+
+class SchedulerRun():
+    def __init__(self, path, keys=(), movePoll=movePollInterval):
+        self.Misc = FakeMisc()
+        self.Player = PolledPlayer(FakePlayer(path, self.Misc, stepTime=stepTime), self.Misc)
+        for key, atTime in keys:
+            self.Misc.PressKey(key, atTime)
+
+        # (time, x) of each reported move
+        self.Reports = []
+        # (time pressed, time handled) of each hotkey
+        self.HotKeys = []
+        self.LastKey = None
+
+        self.Scheduler = RefreshScheduler(self.Player, self.Misc, self.OnMove, self.OnHotKeys, movePoll, idlePollInterval, idleAfter,
+                                          refreshInterval, hotKeyPollInterval, clock=self.Misc.Clock)
+
+    def OnMove(self, x, y, mapIndex):
+        self.Reports.append((self.Misc.Time, x))
+
+    def OnHotKeys(self):
+        key = self.Misc.LastHotKey()
+        if key is not None and key is not self.LastKey:
+            self.LastKey = key
+            self.HotKeys.append((key.Timestamp, self.Misc.Time))
+
+    def Run(self, endTime):
+        self.Scheduler.Run(lambda: self.Misc.Time < endTime)
+        return self
+
+class RefreshSchedulerTest(unittest.TestCase):
+    def testPollsSlowerOnceIdle(self):
+        run = SchedulerRun(Path(50)).Run(4000)
+
+        self.assertEqual(run.Reports, [(0, 100)])
+        self.assertEqual(run.Player.PollTimes, list(range(0, idleAfter + 1, movePollInterval)) + [2500, 3000, 3500])
+
+    def testReportsAMoveAfterIdleWithinTheIdleInterval(self):
+        # Moves at 3100, while polled every idlePollInterval
+        run = SchedulerRun(Path(31, 101)).Run(4000)
+
+        self.assertEqual(run.Reports, [(0, 100), (3500, 101)])
+        # Polled every movePollInterval again after the move
+        self.assertEqual([t for t in run.Player.PollTimes if t >= 3500][:3], [3500, 3550, 3600])
+
+    def testThrottlesAContinuousMoveToTheRefreshInterval(self):
+        # Walks from 1000 to 1900, one tile per step
+        run = SchedulerRun(Path(10, *range(101, 111))).Run(3000)
+
+        self.assertEqual(run.Reports, [(0, 100), (1000, 101), (1250, 103), (1500, 106), (1750, 108), (2000, 110)])
+
+    def testReportsAHeldBackMoveAsSoonAsTheRefreshIntervalPasses(self):
+        # Moves at 1000 and 1100; the second is held back until 1250, instead of waiting for the poll at 1300
+        run = SchedulerRun(Path(10, 101, 102), movePoll=100).Run(2000)
+
+        self.assertEqual(run.Reports, [(0, 100), (1000, 101), (1250, 102)])
+
+    def testHandlesTheHotKeysWithinTheirIntervalWhileIdle(self):
+        run = SchedulerRun(Path(60), (("S", 3210), ("P", 5030))).Run(6000)
+
+        self.assertEqual([pressed for pressed, handled in run.HotKeys], [3210, 5030])
+        for pressed, handled in run.HotKeys:
+            self.assertTrue(0 <= handled - pressed < hotKeyPollInterval, f"pressed at {pressed}, handled at {handled}")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# Session trace tests by Smjert/Spasitjel
+#
+# Records a session of a RadarEngine on a FakeStatics, with a FakePlayer walking a random path on the fake clock of a FakeMisc,
+# saving spots and switching profiles as the radar does, then replays its trace and checks that the replay computes
+# the same updates and saves the same spots, without asking for land that isn't in the trace.
+
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from radar_core.session_trace import SessionRecorder, SessionTrace, TraceSettings, ReplayResult, ReplaySession, CompareResults
+from radar_core.radar_engine import RadarEngine
+from radar_core.scheduler import RefreshScheduler
+from radar_core.spots_store import SpotsStore, MarkedSpot, FormatTextSpot
+from radar_core.benchmark import MovementPath
+from radar_core.fakes import FakeStatics, FakeMisc, FakePlayer, RandomMap
+
+saveKey = "S"
+switchKey = "P"
+
+# Records a session as the radar does, keeping the result the replay has to compute
+class RecordedSession():
+    def __init__(self, directory, settings, keys, switchProfiles=()):
+        self.Directory = directory
+        self.TracePath = os.path.join(directory, "session.trace")
+        self.Settings = settings
+        self.Misc = FakeMisc()
+        self.Recorder = SessionRecorder(self.TracePath, settings, clock=lambda: self.Misc.Time / 1000, wallClock=lambda: 1700000000)
+        self.Engine = RadarEngine(self.Recorder.WrapLand(FakeStatics(RandomMap(0))), settings.VisibleRange, settings.BankSize,
+                                  resourceProfile=settings.ResourceProfile, reachabilityMode=settings.ReachabilityMode,
+                                  clock=lambda: 1700000000 + (self.Misc.Time / 1000))
+        self.Path = FakePlayer(MovementPath("random", 120, 1), self.Misc, stepTime=150)
+        self.Player = self.Recorder.WrapPlayer(self.Path)
+        for key, atTime in keys:
+            self.Misc.PressKey(key, atTime)
+
+        self.SwitchProfiles = list(switchProfiles)
+        self.LastKey = self.Misc.LastHotKey()
+        self.Result = ReplayResult()
+        # Number of spots of each skill that were in its store before the session
+        self.StoredSpots = {}
+        self.OpenStore()
+
+    # Opens the spots of the skill of the current profile, with a spot already marked near the start of the path
+    def OpenStore(self):
+        skill = self.Engine.Profile.Skill
+        spotsPath = os.path.join(self.Directory, f"spots-{skill}.bin")
+        store = SpotsStore(spotsPath)
+        store.AppendMany([MarkedSpot(0, 1004, 998, [(1003, 997)], 1700000000)])
+        store.WriteIndex()
+        self.StoredSpots[skill] = 1
+
+        self.Engine.LoadMiningSpots(spotsPath)
+        self.Engine.SpotsStore = self.Recorder.WrapSpotsStore(self.Engine.SpotsStore, skill)
+
+    def Update(self, x, y, mapIndex):
+        self.Engine.Update(x, y, mapIndex)
+        state = self.Engine.State
+        self.Result.Frames.append((state.Map, state.CenterX, state.CenterY, zlib.crc32(state.Tiles.Amounts.tobytes())))
+
+    def OnHotKeys(self):
+        key = self.Misc.LastHotKey()
+        if key is None or (self.LastKey is not None and self.LastKey.Timestamp >= key.Timestamp):
+            return
+
+        self.LastKey = key
+        self.Recorder.HotKey(key.HotKey)
+        if key.HotKey == switchKey:
+            profileName = self.SwitchProfiles.pop(0)
+            self.Recorder.Profile(profileName)
+            self.Engine.SetResourceProfile(profileName)
+            if self.Engine.SpotsStore is None:
+                self.OpenStore()
+
+            state = self.Engine.State
+            self.Update(state.CenterX, state.CenterY, state.Map)
+            return
+
+        position = self.Player.Position
+        state = self.Engine.State
+        if (state.Map, state.CenterX, state.CenterY) != (self.Player.Map, position.X, position.Y):
+            self.Update(position.X, position.Y, self.Player.Map)
+
+        self.Engine.SaveMiningSpot(self.Engine.State)
+        self.Engine.RepublishMapState()
+
+    def Run(self):
+        settings = self.Settings
+        scheduler = RefreshScheduler(self.Player, self.Misc, self.Update, self.OnHotKeys, settings.MoveLatency, settings.IdleLatency,
+                                     settings.IdleAfter, settings.RefreshInterval, settings.HotKeyLatency, clock=self.Misc.Clock)
+        scheduler.Run(lambda: not self.Path.Finished())
+        self.Recorder.Close()
+        self.Engine.Close()
+
+        for skill in sorted(self.StoredSpots):
+            spots = SpotsStore(os.path.join(self.Directory, f"spots-{skill}.bin")).AllSpots()[self.StoredSpots[skill]:]
+            self.Result.SavedSpots += [FormatTextSpot(spot, withTime=False) for spot in spots]
+
+        return self
+
+class SessionTraceTest(unittest.TestCase):
+    def setUp(self):
+        self.Directory = tempfile.mkdtemp(prefix="radar-session-trace-")
+
+    def tearDown(self):
+        shutil.rmtree(self.Directory)
+
+    def CheckReplay(self, session):
+        self.assertGreater(len(session.Result.Frames), 10)
+        self.assertGreater(len(session.Result.SavedSpots), 0)
+
+        trace = SessionTrace(session.TracePath)
+        result = ReplaySession(trace, saveKey)
+        self.assertIsNone(CompareResults(result, session.Result))
+        self.assertEqual(result.LandMisses, 0)
+
+    def testReplayComputesTheRecordedSession(self):
+        keys = ((saveKey, 3020), (switchKey, 6110), (saveKey, 9050), (switchKey, 12040), (saveKey, 15030))
+        session = RecordedSession(self.Directory, TraceSettings(), keys, ("Lumberjacking", "Mountain")).Run()
+        self.CheckReplay(session)
+
+    def testReplayComputesTheRecordedSessionWithZReachability(self):
+        keys = ((saveKey, 4020), (saveKey, 11070))
+        session = RecordedSession(self.Directory, TraceSettings(reachabilityMode="z"), keys).Run()
+        self.CheckReplay(session)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+# Land tiles cache tests by Smjert/Spasitjel
+#
+# Runs the TileCache on a FakeStatics, counting its calls, to check that the land tiles are only queried once,
+# in memory and through the cache files, and that the tiles of the blocks on the edges of the maps are the right ones.
+
+import shutil
+import tempfile
+import unittest
+
+from radar_core.tile_cache import TileCache, mapSizes, cacheBlockSize
+from radar_core.fakes import FakeStatics, RandomMap, impassableTiles
+
+# An area of a few blocks, not aligned to them
+areaTiles = [(x, y) for y in range(1003, 1029) for x in range(2005, 2031)]
+
+def VisitArea(cache, mapIndex=0):
+    return [cache.GetLandTile(x, y, mapIndex) for x, y in areaTiles]
+
+class TileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.Directory = tempfile.mkdtemp(prefix="radar-tile-cache-")
+        self.Map = RandomMap(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.Directory)
+
+    def testRevisitingAnAreaMakesNoCalls(self):
+        statics = FakeStatics(self.Map)
+        cache = TileCache(statics, cacheBlockSize)
+        tiles = VisitArea(cache)
+        calls = statics.Calls
+
+        self.assertGreater(calls, 0)
+        self.assertEqual(VisitArea(cache), tiles)
+        self.assertEqual(statics.Calls, calls)
+
+    def testRevisitingAnEvictedAreaReadsTheCacheFile(self):
+        statics = FakeStatics(self.Map)
+        cache = TileCache(statics, cacheBlockSize, self.Directory, maxBlocks=2)
+        tiles = VisitArea(cache)
+        calls = statics.Calls
+
+        self.assertEqual(VisitArea(cache), tiles)
+        self.assertEqual(statics.Calls, calls)
+        cache.Close()
+
+    def testReopeningTheCacheFileMakesNoCalls(self):
+        cache = TileCache(FakeStatics(self.Map), cacheBlockSize, self.Directory)
+        tiles = VisitArea(cache)
+        cache.Close()
+
+        statics = FakeStatics(self.Map)
+        cache = TileCache(statics, cacheBlockSize, self.Directory)
+        self.assertEqual(VisitArea(cache), tiles)
+        self.assertEqual(statics.Calls, 0)
+        cache.Close()
+
+    def testEdgeBlocksHaveTheRightTiles(self):
+        for mapIndex in range(len(mapSizes)):
+            width, height = mapSizes[mapIndex]
+            # The corners of the map, the tiles around the boundaries of their blocks, and the ones just outside of it
+            coordinates = []
+            for x in (-1, 0, 1, cacheBlockSize - 1, cacheBlockSize, width - cacheBlockSize - 1, width - cacheBlockSize, width - 1, width):
+                for y in (-1, 0, 1, cacheBlockSize - 1, cacheBlockSize, height - cacheBlockSize - 1, height - cacheBlockSize, height - 1, height):
+                    coordinates.append((x, y))
+
+            # Queried, then read from the file
+            for attempt in range(2):
+                cache = TileCache(FakeStatics(self.Map), cacheBlockSize, self.Directory)
+                for x, y in coordinates:
+                    tileID, blocked = cache.GetLandTile(x, y, mapIndex)
+                    self.assertEqual(tileID, self.Map.TileID(x, y), f"tile {x},{y} of map {mapIndex}")
+                    self.assertEqual(blocked, tileID in impassableTiles, f"tile {x},{y} of map {mapIndex}")
+
+                cache.Close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,15 @@
 # by Smjert/Spasitjel
 
 from enum import Enum
+from collections import OrderedDict
 import struct
+import time
+
+spawnItemPacket = struct.Struct("!BHBIHBHHHHbBHBH")
+removeObjectPacket = struct.Struct("!BI")
+# Speech packets by message length, in bytes
+speechPackets = {}
+speechLanguage = "ENU\0".encode('ascii')
 
 class SpeechType(Enum):
     Normal = 0x00,
@@ -26,7 +34,86 @@ class ItemDirection(Enum):
     West = 0x06,
     Up = 0x07,
 
-def SendSpeech(message, object, type, color, name, font = 3):
+# Graphic of an item or mobile, None if it's not around
+def FindGraphic(serial):
+    if serial >= 0x40000000:
+        item = Items.FindBySerial(serial)
+        return item.ItemID if item is not None else None
+
+    mobile = Mobiles.FindBySerial(serial)
+    return mobile.Body if mobile is not None else None
+
+# Least recently used item serials and their graphic, so that labeling the same items over and over doesn't look them up every time.
+# Mobiles are looked up every time, since they often walk away or change body, and a speech from one that left must not be sent.
+# An item is looked up again after maxAge seconds: until then, one that was picked up or decayed still has its graphic,
+# and speech is still sent over it, unless it's forgotten with Invalidate, which forgets one serial, or all of them.
+class GraphicCache():
+    def __init__(self, maxEntries=1024, maxAge=30, clock=time.monotonic):
+        self.MaxEntries = maxEntries
+        self.MaxAge = maxAge
+        self.Clock = clock
+        # serial -> (graphic, time it was looked up)
+        self.Entries = OrderedDict()
+
+    def Get(self, serial):
+        if serial < 0x40000000:
+            return FindGraphic(serial)
+
+        now = self.Clock()
+        entry = self.Entries.get(serial)
+        if entry is not None and now - entry[1] < self.MaxAge:
+            self.Entries.move_to_end(serial)
+            return entry[0]
+
+        graphic = FindGraphic(serial)
+        if graphic is None:
+            self.Entries.pop(serial, None)
+            return None
+
+        self.Entries[serial] = (graphic, now)
+        self.Entries.move_to_end(serial)
+        if len(self.Entries) > self.MaxEntries:
+            self.Entries.popitem(last=False)
+
+        return graphic
+
+    def Invalidate(self, serial=None):
+        if serial is None:
+            self.Entries.clear()
+        else:
+            self.Entries.pop(serial, None)
+
+serialGraphics = GraphicCache()
+
+def SpeechPacket(message_length):
+    packet = speechPackets.get(message_length)
+    if packet is None:
+        packet = struct.Struct(f"!BHIHBHH4s30s{message_length}sH")
+        speechPackets[message_length] = packet
+
+    return packet
+
+# Serial and graphic the speech comes from, None if the object is not around
+def FindSpeaker(object, type):
+    if type == SpeechType.System or type == SpeechType.Broadcast:
+        return (0xFFFFFF, 0xFFFF)
+
+    if isinstance(object, int):
+        graphic = serialGraphics.Get(object)
+        if graphic is None:
+            return None
+
+        return (object, graphic)
+
+    serial = object.Serial
+    if serial >= 0x40000000:
+        # it's an actual item
+        return (serial, object.ItemID)
+
+    return (serial, object.Body)
+
+# The packet to pack the speech with, and its values
+def SpeechPacketValues(message, speaker, type, color, name, font):
     # BYTE[1] cmd
     # BYTE[2] length
     # BYTE[4] ID
@@ -38,40 +125,21 @@ def SendSpeech(message, object, type, color, name, font = 3):
     # BYTE[30] Name
     # BYTE[?][2] Msg - Null Terminated (blockSize - 48)
 
-    if type == SpeechType.System or type == SpeechType.Broadcast:
-        graphic = 0xFFFF
-        serial = 0xFFFFFF
-    else:
-        if isinstance(object, int):
-            serial = object
-            if serial >= 0x40000000:
-                item = Items.FindBySerial(serial)
-                if item is None:
-                    return
-                graphic = item.ItemID
-            else:
-                mobile = Mobiles.FindBySerial(serial)
-                if mobile is None:
-                    return
-                graphic = mobile.Body
-        else:
-            serial = object.Serial
-
-            if serial >= 0x40000000:
-                # it's an actual item
-                graphic = object.ItemID
-            else:
-                graphic = object.Body
-
     encoded_message = message.encode('utf-16-be')
     message_length = len(encoded_message)
 
-    format = f"!BHIHBHH4s30s{message_length}sH"
-    
-    data = list(bytearray(struct.pack(format, 0xAE, 48 + message_length + 2,
-        serial, graphic, int(type.value[0]), color, font, "ENU\0".encode('ascii'), name.encode('ascii'), encoded_message, 0)))
-    
-    PacketLogger.SendToClient(data)
+    return (SpeechPacket(message_length), (0xAE, 48 + message_length + 2, speaker[0], speaker[1], int(type.value[0]), color, font,
+                                           speechLanguage, name.encode('ascii'), encoded_message, 0))
+
+# Sends nothing if the object is not around; an item serial is only looked up again after serialGraphics.MaxAge seconds though,
+# so speech can still be sent over an item that left meanwhile, see GraphicCache
+def SendSpeech(message, object, type, color, name, font = 3):
+    speaker = FindSpeaker(object, type)
+    if speaker is None:
+        return
+
+    packet, values = SpeechPacketValues(message, speaker, type, color, name, font)
+    PacketLogger.SendToClient(list(packet.pack(*values)))
 
 
 def SpawnItem(itemID, serial, direction, amount, x, y, z, color):
@@ -91,11 +159,143 @@ def SpawnItem(itemID, serial, direction, amount, x, y, z, color):
     #Byte[1] Flag // 0x20 = Movable if normally not , 0x80 = Hidden , 0x00 if Multi
     #Byte[2] Unknown // All 0x00
 
-    format = "!BHBIHBHHHHbBHBH"
-
-    data = list(bytearray(struct.pack(format,
+    data = list(spawnItemPacket.pack(
             0xF3, 0x01, 0x00, serial, itemID, int(direction.value[0]), amount,
             amount, x, y, z, 0x00,
-            color, 0x20, 0x00)))
+            color, 0x20, 0x00))
+
+    PacketLogger.SendToClient(data)
+
+def RemoveObject(serial):
+    #Byte[1] Packet ID
+    #Byte[4] Serial
+
+    PacketLogger.SendToClient(list(removeObjectPacket.pack(0x1D, serial)))
+
+# Packets packed one after the other in a reusable buffer and sent with a single SendToClient call per maxBatchSize bytes;
+# with batch False, each packet is sent on its own, for clients that only take one per call.
+class PacketBatch():
+    def __init__(self, packetLogger, batch=True, maxBatchSize=0x4000):
+        self.PacketLogger = packetLogger
+        self.Batch = batch
+        self.MaxBatchSize = maxBatchSize
+        self.Buffer = bytearray(maxBatchSize if batch else 0x100)
+        self.Size = 0
+
+        self.Packets = 0
+        self.Sends = 0
+
+    def Add(self, packet, *values):
+        if self.Size + packet.size > self.MaxBatchSize:
+            self.Flush()
+
+        # Only a packet bigger than the buffer makes it grow
+        if self.Size + packet.size > len(self.Buffer):
+            self.Buffer.extend(bytes(self.Size + packet.size - len(self.Buffer)))
+
+        packet.pack_into(self.Buffer, self.Size, *values)
+        self.Size += packet.size
+        self.Packets += 1
+
+        if not self.Batch:
+            self.Flush()
+
+    def Flush(self):
+        if self.Size == 0:
+            return
+
+        self.PacketLogger.SendToClient(list(memoryview(self.Buffer)[:self.Size]))
+        self.Sends += 1
+        self.Size = 0
+
+# Fake items shown in the world, like markers, given all at once each frame as a dict of
+# key -> (itemID, x, y, z, color), where the key is anything identifying the item from a frame to the next.
+# Only what changed since the previous frame is sent, in a PacketBatch: new, moved or recolored items are spawned,
+# the missing ones removed. Each item keeps its serial while it's shown, and the serials of the removed ones are reused.
+# The client deletes the items on its own when changing map, and the ones beyond its update range: those have to be forgotten,
+# with Forget and ForgetOutOfRange, so that they're spawned again when they're back.
+class WorldOverlay():
+    def __init__(self, packetLogger, firstSerial=0x7FFF0000, batch=True, maxBatchSize=0x4000):
+        self.Packets = PacketBatch(packetLogger, batch, maxBatchSize)
+
+        self.NextSerial = firstSerial
+        self.FreeSerials = []
+        # key -> (serial, (itemID, x, y, z, color))
+        self.Shown = {}
+
+    def Update(self, items):
+        shown = self.Shown
+
+        for key in [key for key in shown if key not in items]:
+            serial = shown.pop(key)[0]
+            self.Packets.Add(removeObjectPacket, 0x1D, serial)
+            self.FreeSerials.append(serial)
+
+        for key, item in items.items():
+            current = shown.get(key)
+            if current is not None:
+                if current[1] == item:
+                    continue
+
+                serial = current[0]
+            elif len(self.FreeSerials) > 0:
+                serial = self.FreeSerials.pop()
+            else:
+                serial = self.NextSerial
+                self.NextSerial += 1
+
+            shown[key] = (serial, item)
+            itemID, x, y, z, color = item
+            self.Packets.Add(spawnItemPacket, 0xF3, 0x01, 0x00, serial, itemID, 0x00, 1, 1, x, y, z, 0x00, color, 0x20, 0x00)
+
+        self.Packets.Flush()
+
+    # Removes all the items from the world
+    def Clear(self):
+        self.Update({})
+
+    # Forgets the items shown, without removing them, since the client already did
+    def Forget(self):
+        self.FreeSerials.extend(serial for serial, item in self.Shown.values())
+        self.Shown = {}
+
+    # Forgets the items farther than updateRange tiles from x, y, which the client deleted
+    def ForgetOutOfRange(self, x, y, updateRange):
+        shown = self.Shown
+        for key in [key for key, (serial, item) in shown.items() if max(abs(item[1] - x), abs(item[2] - y)) > updateRange]:
+            self.FreeSerials.append(shown.pop(key)[0])
+
+# Speech to send a bit at a time, like labels over many objects, so that the script loop never stalls sending them.
+# Say queues a message, unless the same one is already waiting for the same object; Flush, called once per frame,
+# sends at most maxPerFrame of them, the oldest first, in a PacketBatch.
+class SpeechQueue():
+    def __init__(self, packetLogger, maxPerFrame=25, batch=True, maxBatchSize=0x4000):
+        self.Packets = PacketBatch(packetLogger, batch, maxBatchSize)
+        self.MaxPerFrame = maxPerFrame
+        # (serial, message, type, color, name, font) -> object
+        self.Pending = OrderedDict()
+        self.Duplicates = 0
+
+    def Say(self, message, object, type, color, name, font = 3):
+        serial = object if isinstance(object, int) or object is None else object.Serial
+        key = (serial, message, type, color, name, font)
+        if key in self.Pending:
+            self.Duplicates += 1
+            return False
+
+        self.Pending[key] = object
+        return True
+
+    # Sends the messages due this frame, returning how many are still waiting
+    def Flush(self):
+        for _ in range(min(self.MaxPerFrame, len(self.Pending))):
+            (serial, message, type, color, name, font), object = self.Pending.popitem(last=False)
+            speaker = FindSpeaker(object, type)
+            if speaker is None:
+                continue
+
+            packet, values = SpeechPacketValues(message, speaker, type, color, name, font)
+            self.Packets.Add(packet, *values)
 
-    PacketLogger.SendToClient(data)
\ No newline at end of file
+        self.Packets.Flush()
+        return len(self.Pending)
\ No newline at end of file